@@ -0,0 +1,64 @@
+"""Measure columnar decoding of query results against lists of documents.
+
+Run with ``python benchmarks/bench_columns.py`` once Quart-Motor is
+installed (``make install``), or as part of ``benchmarks/run.py``. Reads
+the same fields of every document of a collection with ``find`` and
+with ``find_columns``, through the in-process stand-in server, and
+reports the time taken and the memory the results hold per row.
+"""
+import asyncio
+import datetime
+import tracemalloc
+
+from common import measure_async, serving
+
+SCHEMA = {"total": float, "quantity": int, "paid": bool, "created": datetime.datetime}
+
+
+async def _retained(call):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = await call()
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+
+async def _run(rows, number):
+    async with serving() as (app, mongo):
+        created = datetime.datetime(2024, 1, 1)
+        await mongo.db.orders.insert_many([
+            {
+                "_id": i, "total": i * 1.25, "quantity": i % 7, "paid": i % 2 == 0,
+                "created": created + datetime.timedelta(minutes=i), "note": "n" * 40,
+            }
+            for i in range(rows)
+        ])
+        projection = {name: 1 for name in SCHEMA}
+        cases = [
+            ("find().to_list()", lambda: mongo.db.orders.find({}, projection).to_list(None)),
+            ("find_columns()", lambda: mongo.db.orders.find_columns({}, SCHEMA)),
+        ]
+        results = []
+        for name, call in cases:
+            await call()
+            results.append((name, await measure_async(call, number) * 1000, "ms"))
+            size, result = await _retained(call)
+            assert len(result) == rows
+            results.append(("%s, memory per row" % name, size / rows, "bytes"))
+        return results
+
+
+def run(rows=20000, number=5):
+    """Return ``(name, value, unit)`` for the time and memory of each approach."""
+    return asyncio.run(_run(rows, number))
+
+
+def main():
+    for name, value, unit in run():
+        print("%-40s %10.1f %s" % (name, value, unit))
+
+
+if __name__ == "__main__":
+    main()
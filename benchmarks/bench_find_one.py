@@ -0,0 +1,47 @@
+"""Measure the per-call cost of single-document lookups.
+
+Run with ``python benchmarks/bench_find_one.py`` once Quart-Motor is
+installed (``make install``), or as part of ``benchmarks/run.py``. Runs
+against the in-process stand-in server, so the times include a round
+trip over the loopback interface: compare ``find_one_or_404`` with plain
+``find_one`` for the helper's own overhead, and with the cached lookup
+for what the round trip costs.
+"""
+import asyncio
+
+from common import measure_async, serving
+
+
+async def _run(number):
+    async with serving() as (app, mongo):
+        await mongo.db.things.insert_many(
+            [{"_id": i, "name": "thing %d" % i, "tags": ["a", "b"]} for i in range(100)]
+        )
+        mongo.cache("cached_things", maxsize=128, ttl=None)
+        await mongo.db.cached_things.insert_one({"_id": 1, "name": "thing 1"})
+
+        things, cached = mongo.db.things, mongo.db.cached_things
+        cases = [
+            ("find_one", lambda: things.find_one({"_id": 42})),
+            ("find_one_or_404", lambda: things.find_one_or_404({"_id": 42})),
+            ("find_one_or_404, cached", lambda: cached.find_one_or_404({"_id": 1})),
+        ]
+        results = []
+        for name, call in cases:
+            await call()
+            results.append((name, await measure_async(call, number) * 1e6, "us"))
+        return results
+
+
+def run(number=1000):
+    """Return ``(name, microseconds per call, unit)`` per lookup."""
+    return asyncio.run(_run(number))
+
+
+def main():
+    for name, microseconds, _ in run():
+        print("%-25s %8.1f us per call" % (name, microseconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measure GridFS upload and download throughput.
+
+Run with ``python benchmarks/bench_gridfs.py`` once Quart-Motor is
+installed (``make install``), or as part of ``benchmarks/run.py``. Saves
+a file with :meth:`~quart_motor.Motor.save_file` and reads it back with
+:meth:`~quart_motor.Motor.send_file`, through the in-process stand-in
+server, and from a local file cache.
+"""
+import asyncio
+import io
+import os
+
+from common import measure_async, serving
+
+MB = 1024 * 1024
+
+
+async def _run(size, number):
+    data = os.urandom(size)
+    async with serving() as (app, mongo):
+        async def save():
+            await mongo.save_file("bench.bin", io.BytesIO(data))
+
+        async def send():
+            async with app.test_request_context("/"):
+                response = await mongo.send_file("bench.bin")
+                body = await response.get_data()
+            assert len(body) == size
+
+        save_seconds = await measure_async(save, number)
+        send_seconds = await measure_async(send, number)
+
+    async with serving(file_cache=True) as (app, mongo):
+        await mongo.save_file("bench.bin", io.BytesIO(data))
+
+        async def send_cached():
+            async with app.test_request_context("/"):
+                response = await mongo.send_file("bench.bin")
+                body = await response.get_data()
+            assert len(body) == size
+
+        await send_cached()
+        cached_seconds = await measure_async(send_cached, number)
+    return [
+        ("save_file", size / MB / save_seconds, "MB/s"),
+        ("send_file", size / MB / send_seconds, "MB/s"),
+        ("send_file, cached", size / MB / cached_seconds, "MB/s"),
+    ]
+
+
+def run(size=16 * MB, number=3):
+    """Return ``(name, megabytes per second, unit)`` for upload and download."""
+    return asyncio.run(_run(size, number))
+
+
+def main():
+    for name, throughput, _ in run():
+        print("%-20s %8.1f MB/s" % (name, throughput))
+
+
+if __name__ == "__main__":
+    main()
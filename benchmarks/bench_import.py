@@ -0,0 +1,80 @@
+"""Measure the cost of importing Quart-Motor and setting it up.
+
+Run with ``python benchmarks/bench_import.py`` once Quart-Motor is
+installed (``make install``), or as part of ``benchmarks/run.py``. Each
+measurement runs in a fresh interpreter, so nothing is imported yet; the
+best of several runs is kept. No MongoDB server is needed.
+Optional features (the GridFS file cache, columns, ``orjson``) are
+imported when first used; ``eagerly imported`` counts those that
+``import quart_motor`` loads anyway, which should stay ``0``.
+"""
+import json
+import subprocess
+import sys
+
+#: modules only some apps use, which importing quart_motor must not load
+LAZY_MODULES = (
+    "quart_motor.columns",
+    "quart_motor.file_cache",
+    "numpy",
+    "pyarrow",
+    "orjson",
+    "six",
+)
+
+_SCRIPT = """
+import json, sys, time
+%(before)s
+start = time.perf_counter()
+import quart_motor
+imported = time.perf_counter() - start
+from quart import Quart
+app = Quart("bench")
+start = time.perf_counter()
+quart_motor.Motor(app, "mongodb://localhost:27017/bench")
+initialized = time.perf_counter() - start
+print(json.dumps({
+    "import": imported,
+    "init_app": initialized,
+    "eager": [name for name in %(lazy)r if name in sys.modules],
+}))
+"""
+
+
+def _measure(before="", repeat=5):
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", _SCRIPT % {"before": before, "lazy": LAZY_MODULES}],
+            text=True,
+        )
+        result = json.loads(output)
+        if best is None or result["import"] < best["import"]:
+            best = result
+    return best
+
+
+def run(repeat=5):
+    """Return ``(name, milliseconds or count, unit)`` per measurement."""
+    cold = _measure(repeat=repeat)
+    # with Quart, PyMongo and Motor already imported, as in most apps
+    own = _measure("import quart, pymongo, motor.motor_asyncio", repeat)
+    return [
+        ("import quart_motor", cold["import"] * 1e3, "ms"),
+        ("import quart_motor, dependencies loaded", own["import"] * 1e3, "ms"),
+        ("Motor(app)", own["init_app"] * 1e3, "ms"),
+        ("eagerly imported", len(cold["eager"]), "modules"),
+    ]
+
+
+def main():
+    for name, value, unit in run():
+        print("%-40s %8.3f %s" % (name, value, unit))
+    eager = _measure(repeat=1)["eager"]
+    if eager:
+        print("imported by quart_motor, but only needed by some apps: %s" % ", ".join(eager))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare JSON encoding of nested MongoDB documents.
+
+Run with ``python benchmarks/bench_json.py`` once Quart-Motor is installed
+(``make install``), or as part of ``benchmarks/run.py``. Measures the encoder as it
+was before the type-dispatch table, :class:`~quart_motor.helpers.JSONEncoder`
+and :class:`~quart_motor.helpers.FastJSONEncoder`, and checks that all three
+produce the same bytes.
+"""
+import datetime
+
+from bson import Decimal128, ObjectId, SON, json_util
+from quart import Quart
+
+from common import measure
+from quart_motor.helpers import FastJSONEncoder, JSONEncoder
+
+
+class LegacyJSONEncoder(JSONEncoder):
+    """JSONEncoder.default as it was before the type-dispatch table."""
+
+    def default(self, obj):
+        if hasattr(obj, "iteritems") or hasattr(obj, "items"):
+            return SON((k, self.default(v)) for k, v in obj.items())
+        elif hasattr(obj, "__iter__") and not isinstance(obj, str):
+            return [self.default(v) for v in obj]
+        else:
+            try:
+                return json_util.default(obj, **self._default_kwargs)
+            except TypeError:
+                return obj
+
+
+def make_documents(count=1000):
+    now = datetime.datetime(2020, 7, 26, 12, 30, 15)
+    return [
+        {
+            "_id": ObjectId(),
+            "owner": ObjectId(),
+            "created": now,
+            "updated": now + datetime.timedelta(seconds=i),
+            "price": Decimal128("%d.99" % i),
+            "title": "document %d" % i,
+            "tags": ["a", "b", "c"],
+            "score": i / 7.0,
+            "items": [
+                {"sku": ObjectId(), "qty": j, "added": now, "note": "item"}
+                for j in range(5)
+            ],
+            "meta": {"source": "bench", "version": 3, "ref": {"id": ObjectId()}},
+        }
+        for i in range(count)
+    ]
+
+
+def run(number=20):
+    """Return ``(name, milliseconds per 1000 documents, unit)`` per encoder."""
+    app = Quart(__name__)
+    documents = make_documents()
+    kwargs = {"separators": (",", ":")}
+    encoders = [
+        ("legacy JSONEncoder", LegacyJSONEncoder(app=app, json_options=None)),
+        ("JSONEncoder", JSONEncoder(app=app, json_options=None)),
+        ("FastJSONEncoder", FastJSONEncoder(app=app, json_options=None)),
+    ]
+
+    expected = encoders[0][1].dumps(documents, **kwargs)
+    results = []
+    for name, encoder in encoders:
+        assert encoder.dumps(documents, **kwargs) == expected, name
+        seconds = measure(lambda: encoder.dumps(documents, **kwargs), number)
+        results.append((name, seconds * 1000, "ms"))
+    return results
+
+
+def main():
+    baseline = None
+    for name, milliseconds, _ in run():
+        baseline = baseline or milliseconds
+        print("%-20s %8.2f ms per 1000 documents  (%.1fx)" % (
+            name, milliseconds, baseline / milliseconds,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Measure request throughput of a document endpoint.
+
+Run with ``python benchmarks/bench_requests.py`` once Quart-Motor is
+installed (``make install``), or as part of ``benchmarks/run.py``. Sends
+concurrent requests through Quart's test client to a view that looks up
+a document with ``find_one_or_404`` and returns it as JSON, backed by the
+in-process stand-in server.
+"""
+import asyncio
+import time
+
+from common import serving
+
+
+async def _run(requests, concurrency):
+    async with serving() as (app, mongo):
+        await mongo.db.things.insert_many(
+            [{"_id": i, "name": "thing %d" % i, "tags": ["a", "b"]} for i in range(100)]
+        )
+
+        @app.route("/things/<int:thing_id>")
+        async def show_thing(thing_id):
+            return await mongo.db.things.find_one_or_404({"_id": thing_id})
+
+        client = app.test_client()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get(i):
+            async with semaphore:
+                response = await client.get("/things/%d" % (i % 100))
+                assert response.status_code == 200
+
+        await asyncio.gather(*(get(i) for i in range(concurrency)))
+        start = time.perf_counter()
+        await asyncio.gather(*(get(i) for i in range(requests)))
+        seconds = time.perf_counter() - start
+    return [("GET find_one_or_404, %d concurrent" % concurrency, requests / seconds, "req/s")]
+
+
+def run(requests=2000, concurrency=50):
+    """Return ``(name, requests per second, unit)``."""
+    return asyncio.run(_run(requests, concurrency))
+
+
+def main():
+    for name, throughput, _ in run():
+        print("%-40s %8.0f req/s" % (name, throughput))
+
+
+if __name__ == "__main__":
+    main()
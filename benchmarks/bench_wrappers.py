@@ -0,0 +1,34 @@
+"""Measure the cost of reaching a collection through the wrappers.
+
+Run with ``python benchmarks/bench_wrappers.py`` once Quart-Motor is
+installed (``make install``), or as part of ``benchmarks/run.py``. No
+MongoDB server is needed: the client is created with ``connect=False``
+and no operation is sent.
+"""
+from common import measure
+from quart_motor.wrappers import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+
+
+def run(number=100000):
+    """Return ``(name, microseconds per access, unit)`` per access path."""
+    cx = AsyncIOMotorClient("mongodb://localhost:27017/", connect=False)
+    db = cx["test"]
+
+    cases = [
+        ("uncached cx.test.things", lambda: AsyncIOMotorCollection(
+            AsyncIOMotorDatabase(cx, "test"), "things",
+        )),
+        ("cached cx.test.things", lambda: cx.test.things),
+        ("cached db.things", lambda: db.things),
+        ("cached db['things']", lambda: db["things"]),
+    ]
+    return [(name, measure(access, number) * 1e6, "us") for name, access in cases]
+
+
+def main():
+    for name, microseconds, _ in run():
+        print("%-25s %8.3f us per access" % (name, microseconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Helpers shared by the benchmarks."""
+import contextlib
+import time
+import timeit
+
+from quart import Quart
+
+from fake_server import FakeMongoServer
+from quart_motor import Motor
+
+#: units in which a larger value is better; in all others, smaller is
+HIGHER_IS_BETTER = frozenset(("MB/s", "req/s"))
+
+
+def measure(func, number, repeat=3):
+    """Return the best time of ``func()`` in seconds, over ``repeat`` runs."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+async def measure_async(func, number, repeat=3):
+    """Return the best time of ``await func()`` in seconds, over ``repeat`` runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        seconds = (time.perf_counter() - start) / number
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+@contextlib.asynccontextmanager
+async def serving(**kwargs):
+    """Start an app with a :class:`Motor` connected to a fresh stand-in server.
+
+    Yields ``(app, mongo)``; ``kwargs`` are passed to :class:`Motor`.
+    """
+    with FakeMongoServer() as server:
+        app = Quart(__name__)
+        app.config["MONGO_URI"] = server.uri("bench")
+        mongo = Motor(app, **kwargs)
+        await app.startup()
+        try:
+            yield app, mongo
+        finally:
+            await app.shutdown()
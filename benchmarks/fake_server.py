@@ -0,0 +1,339 @@
+"""An in-process MongoDB stand-in for the benchmarks.
+
+Speaks just enough of the wire protocol (``OP_QUERY`` for the handshake,
+``OP_MSG`` afterwards) for Motor to run ``find``/``getMore``, ``insert``,
+``delete``, the index commands GridFS needs and the usual handshake and
+session commands against an in-memory store. Queries support equality,
+``$in`` and the comparison operators, multi-key ``sort``, ``skip``,
+``limit``, ``batchSize`` and top-level projections.
+It runs its own event loop in a daemon thread, so the benchmarks measure
+the client side of each operation plus a small, constant per-operation
+cost of the stand-in. Numbers are meant to be compared between commits,
+not with a real server.
+.. code-block:: python
+    with FakeMongoServer() as server:
+        app.config["MONGO_URI"] = server.uri("bench")
+"""
+import asyncio
+import datetime
+import itertools
+import struct
+import threading
+
+import bson
+from bson.int64 import Int64
+
+OP_REPLY = 1
+OP_QUERY = 2004
+OP_MSG = 2013
+MORE_TO_COME = 1 << 1
+
+_HEADER = struct.Struct("<iiii")
+_COMMAND_NOT_FOUND = 59
+
+
+def _get(document, key):
+    for part in key.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+
+def _matches(document, filter):
+    for key, condition in filter.items():
+        if key == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+            continue
+        value = _get(document, key)
+        if isinstance(condition, dict) and condition and next(iter(condition)).startswith("$"):
+            for operator, arg in condition.items():
+                if not _OPERATORS[operator](value, arg):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _sort(documents, sort):
+    for key, direction in reversed(list(sort.items())):
+        documents.sort(key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+    return documents
+
+
+def _sort_key(value):
+    # None sorts first, as in MongoDB; other values are compared as they are
+    return (value is not None, value if value is not None else 0)
+
+
+def _project(document, projection):
+    if not projection:
+        return document
+    if any(value for key, value in projection.items() if key != "_id"):
+        return {
+            k: v for k, v in document.items()
+            if projection.get(k) or (k == "_id" and projection.get("_id", 1))
+        }
+    return {k: v for k, v in document.items() if projection.get(k, 1)}
+
+
+class FakeMongoServer(object):
+    """A standalone, in-memory MongoDB server running in a thread."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        """__init__."""
+        self.host = host
+        self.port = port
+        self.collections = {}
+        self.indexes = {}
+        self._cursors = {}
+        self._cursor_ids = itertools.count(1)
+        self._connection_ids = itertools.count(1)
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._handlers = {}
+
+    def uri(self, database="test"):
+        """Return a connection string for ``database`` on this server."""
+        return "mongodb://%s:%d/%s?directConnection=true" % (self.host, self.port, database)
+
+    def start(self):
+        """Start serving in a daemon thread."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port),
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="fake-mongod", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _shutdown(self):
+        self._server.close()
+        # closing the connections ends their handlers at the next read
+        handlers = list(self._handlers.items())
+        for _, writer in handlers:
+            writer.close()
+        await asyncio.gather(*(handler for handler, _ in handlers), return_exceptions=True)
+
+    def __enter__(self):
+        """__enter__."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """__exit__."""
+        self.stop()
+
+    async def _handle(self, reader, writer):
+        connection_id = next(self._connection_ids)
+        handler = asyncio.current_task()
+        self._handlers[handler] = writer
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                length, request_id, _, op_code = _HEADER.unpack(header)
+                body = await reader.readexactly(length - _HEADER.size)
+                if op_code == OP_QUERY:
+                    reply = self._op_query(body, connection_id)
+                elif op_code == OP_MSG:
+                    reply = self._op_msg(body, connection_id)
+                else:
+                    break
+                if reply is not None:
+                    op_code, data = reply
+                    writer.write(_HEADER.pack(
+                        _HEADER.size + len(data), 0, request_id, op_code,
+                    ) + data)
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._handlers.pop(handler, None)
+            writer.close()
+
+    def _op_query(self, body, connection_id):
+        # only used for the initial handshake: flags, namespace, skip,
+        # limit, then the command document
+        end = body.index(b"\x00", 4)
+        offset = end + 1 + 8
+        size = struct.unpack_from("<i", body, offset)[0]
+        command = bson.decode(body[offset:offset + size])
+        reply = bson.encode(self._command(command, connection_id))
+        return OP_REPLY, struct.pack("<iqii", 0, 0, 0, 1) + reply
+
+    def _op_msg(self, body, connection_id):
+        flags = struct.unpack_from("<I", body)[0]
+        offset = 4
+        command = None
+        while offset < len(body):
+            kind = body[offset]
+            offset += 1
+            size = struct.unpack_from("<i", body, offset)[0]
+            if kind == 0:
+                command = bson.decode(body[offset:offset + size])
+            else:
+                end = body.index(b"\x00", offset + 4)
+                identifier = body[offset + 4:end].decode()
+                command[identifier] = bson.decode_all(body[end + 1:offset + size])
+            offset += size
+
+        reply = self._command(command, connection_id)
+        if flags & MORE_TO_COME:
+            return None
+        return OP_MSG, struct.pack("<IB", 0, 0) + bson.encode(reply)
+
+    def _command(self, command, connection_id):
+        name = next(iter(command))
+        handler = getattr(self, "_cmd_" + name.lower(), None)
+        if handler is None:
+            return {
+                "ok": 0.0, "errmsg": "no such command: '%s'" % name,
+                "code": _COMMAND_NOT_FOUND, "codeName": "CommandNotFound",
+            }
+        reply = handler(command, connection_id)
+        reply.setdefault("ok", 1.0)
+        return reply
+
+    def _namespace(self, command, name):
+        return "%s.%s" % (command.get("$db", "admin"), command[name])
+
+    def _cmd_hello(self, command, connection_id):
+        return {
+            "helloOk": True,
+            "isWritablePrimary": True,
+            "ismaster": True,
+            "maxBsonObjectSize": 16 * 1024 * 1024,
+            "maxMessageSizeBytes": 48000000,
+            "maxWriteBatchSize": 100000,
+            "localTime": datetime.datetime.now(datetime.timezone.utc),
+            "logicalSessionTimeoutMinutes": 30,
+            "connectionId": connection_id,
+            "minWireVersion": 0,
+            "maxWireVersion": 21,
+            "readOnly": False,
+        }
+
+    _cmd_ismaster = _cmd_hello
+
+    def _cmd_ping(self, command, connection_id):
+        return {}
+
+    def _cmd_buildinfo(self, command, connection_id):
+        return {"version": "7.0.0", "versionArray": [7, 0, 0, 0]}
+
+    def _cmd_endsessions(self, command, connection_id):
+        return {}
+
+    def _cmd_find(self, command, connection_id):
+        namespace = self._namespace(command, "find")
+        documents = [
+            doc for doc in self.collections.get(namespace, [])
+            if _matches(doc, command.get("filter", {}))
+        ]
+        if command.get("sort"):
+            documents = _sort(documents, command["sort"])
+        documents = documents[command.get("skip", 0):]
+        limit = command.get("limit", 0)
+        if limit:
+            documents = documents[:abs(limit)]
+        projection = command.get("projection")
+        documents = [_project(doc, projection) for doc in documents]
+
+        batch_size = command.get("batchSize", 101)
+        if command.get("singleBatch") or limit < 0:
+            batch_size = len(documents)
+        return self._cursor(namespace, iter(documents), batch_size, "firstBatch")
+
+    def _cmd_getmore(self, command, connection_id):
+        cursor_id = command["getMore"]
+        namespace, documents = self._cursors.pop(cursor_id)
+        return self._cursor(
+            namespace, documents, command.get("batchSize", 1 << 31), "nextBatch", cursor_id,
+        )
+
+    def _cursor(self, namespace, documents, batch_size, field, cursor_id=None):
+        batch = list(itertools.islice(documents, batch_size or 101))
+        remaining = list(documents)
+        if remaining:
+            cursor_id = cursor_id or next(self._cursor_ids)
+            self._cursors[cursor_id] = (namespace, iter(remaining))
+        else:
+            cursor_id = 0
+        return {"cursor": {"id": Int64(cursor_id), "ns": namespace, field: batch}}
+
+    def _cmd_killcursors(self, command, connection_id):
+        for cursor_id in command.get("cursors", []):
+            self._cursors.pop(cursor_id, None)
+        return {"cursorsKilled": command.get("cursors", [])}
+
+    def _cmd_insert(self, command, connection_id):
+        namespace = self._namespace(command, "insert")
+        documents = command.get("documents", [])
+        self.collections.setdefault(namespace, []).extend(documents)
+        return {"n": len(documents)}
+
+    def _cmd_delete(self, command, connection_id):
+        namespace = self._namespace(command, "delete")
+        documents = self.collections.get(namespace, [])
+        deleted = 0
+        for delete in command.get("deletes", []):
+            kept, matched = [], 0
+            for doc in documents:
+                if (delete.get("limit") != 1 or not matched) and _matches(doc, delete["q"]):
+                    matched += 1
+                else:
+                    kept.append(doc)
+            documents = kept
+            deleted += matched
+        self.collections[namespace] = documents
+        return {"n": deleted}
+
+    def _cmd_createindexes(self, command, connection_id):
+        namespace = self._namespace(command, "createIndexes")
+        indexes = self.indexes.setdefault(namespace, [])
+        before = len(indexes) + 1
+        for index in command.get("indexes", []):
+            if not any(existing["name"] == index["name"] for existing in indexes):
+                indexes.append(dict(index, v=2))
+        return {
+            "numIndexesBefore": before, "numIndexesAfter": len(indexes) + 1,
+            "createdCollectionAutomatically": False,
+        }
+
+    def _cmd_listindexes(self, command, connection_id):
+        namespace = self._namespace(command, "listIndexes")
+        indexes = [{"v": 2, "key": {"_id": 1}, "name": "_id_"}]
+        indexes.extend(self.indexes.get(namespace, []))
+        return self._cursor(namespace, iter(indexes), 101, "firstBatch")
@@ -0,0 +1,116 @@
+"""Run the benchmark suite and record the results as JSON.
+
+Run with ``python benchmarks/run.py`` once Quart-Motor is installed
+(``make install``). No MongoDB server is needed: the benchmarks that
+issue operations use the in-process stand-in in ``fake_server.py``.
+.. code-block:: sh
+    python benchmarks/run.py --output before.json
+    git checkout my-branch
+    python benchmarks/run.py --output after.json --compare before.json
+Each result is recorded with its unit; times are the best of several
+runs, throughputs are in ``MB/s`` or ``req/s``.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+import motor
+import pymongo
+import quart
+
+import bench_columns
+import bench_find_one
+import bench_gridfs
+import bench_import
+import bench_json
+import bench_requests
+import bench_wrappers
+from common import HIGHER_IS_BETTER
+
+SUITES = {
+    "json": bench_json,
+    "wrappers": bench_wrappers,
+    "find_one": bench_find_one,
+    "gridfs": bench_gridfs,
+    "requests": bench_requests,
+    "columns": bench_columns,
+    "import": bench_import,
+}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(suites):
+    """Run the named suites; return the results document."""
+    results = {}
+    for suite in suites:
+        for name, value, unit in SUITES[suite].run():
+            key = "%s: %s" % (suite, name)
+            results[key] = {"value": round(value, 3), "unit": unit}
+            print("%-50s %10.3f %s" % (key, value, unit), file=sys.stderr)
+    return {
+        "commit": _commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": {
+            "motor": motor.version,
+            "pymongo": pymongo.version,
+            "quart": getattr(quart, "__version__", None),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Print each result next to its baseline, with the relative change."""
+    print("%-50s %12s %12s %9s" % ("benchmark", "baseline", "current", "change"))
+    for key, result in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None or old["unit"] != result["unit"] or not old["value"]:
+            print("%-50s %12s %12.3f %9s" % (key, "-", result["value"], "new"))
+            continue
+        change = (result["value"] - old["value"]) / old["value"] * 100
+        better = change > 0 if result["unit"] in HIGHER_IS_BETTER else change < 0
+        print("%-50s %12.3f %12.3f %+8.1f%%%s" % (
+            key, old["value"], result["value"], change,
+            "" if abs(change) < 5 else (" better" if better else " WORSE"),
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("suites", nargs="*", metavar="suite",
+                        help="suites to run: %s (default: all)" % ", ".join(SUITES))
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="compare with the results in this JSON file")
+    args = parser.parse_args(argv)
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error("unknown suites: %s" % ", ".join(sorted(unknown)))
+
+    current = run(args.suites or list(SUITES))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), current)
+    elif not args.output:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
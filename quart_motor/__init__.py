@@ -5,32 +5,57 @@ Modified from: https://github.com/dcrosta/flask-pymongo
 Author: Sriram
 """
 import asyncio
+import contextvars
+import hashlib
+import logging
+import math
+import os
 
 import pymongo
-from functools import partial
+from functools import partial, wraps
 from mimetypes import guess_type
-import sys
+from urllib.parse import unquote_plus
 
-from quart import abort, current_app, request, Quart
-from gridfs import GridFS, NoFile
+from quart import abort, current_app, has_request_context, request, Quart
+from gridfs import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from pymongo import uri_parser
-from werkzeug.wsgi import wrap_file
+from pymongo.errors import (
+    ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WaitQueueTimeoutError,
+)
+from werkzeug.exceptions import GatewayTimeout
+from bson.raw_bson import RawBSONDocument
 
-from quart_motor.helpers import BSONObjectIdConverter, JSONEncoder
-from quart_motor.wrappers import AsyncIOMotorClient
+from quart_motor.bulk import BulkWriter
+from quart_motor.cache import DocumentCache
+from quart_motor.grid_file import GridFSBody, iter_chunks
+from quart_motor.helpers import BSONObjectIdConverter, FastJSONEncoder, JSONEncoder
+from quart_motor.indexes import IndexAdvisor, IndexManager
+from quart_motor.monitoring import CommandInstrumentation
+from quart_motor.pool import PoolStats, detect_workers, max_pool_size, warm_up
+from quart_motor.streams import ChangeStreamHub
+from quart_motor.views import MaterializedView, ViewScheduler
+from quart_motor.wrappers import AsyncIOMotorClient, ReadRoutedDatabase
 
 __all__ = ("Motor", "ASCENDING", "DESCENDING")
 
-PY2 = sys.version_info[0] == 2
+logger = logging.getLogger(__name__)
 
-# Python 3 compatibility
-if PY2:
-    text_type = (str, unicode)
-    num_type = (int, long)
-else:
-    text_type = str
-    num_type = int
+_SRV_SCHEME = "mongodb+srv://"
 
+# request methods whose reads may be routed away from the primary
+SAFE_METHODS = frozenset(("GET", "HEAD"))
+
+# the read target of the current view, when overridden with reads_from()
+_DEFAULT_TARGET = object()
+
+# the view attribute holding the deadline set with with_deadline()
+_DEADLINE_ATTRIBUTE = "_quart_motor_deadline"
+
+# the errors the driver raises when an operation runs out of time
+_TIMEOUT_ERRORS = (
+    ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError, WaitQueueTimeoutError,
+)
 
 DESCENDING = pymongo.DESCENDING
 """Descending sort order."""
@@ -39,6 +64,18 @@ ASCENDING = pymongo.ASCENDING
 """Ascending sort order."""
 
 
+def _database_name(uri):
+    """Return the name of the database in ``uri``, or ``None``.
+
+    Other URIs are validated straight away, while ``mongodb+srv://`` URIs
+    are only resolved, which takes DNS queries, when the client is created.
+    """
+    if not uri.startswith(_SRV_SCHEME):
+        return uri_parser.parse_uri(uri)["database"]
+    path = uri.partition("?")[0][len(_SRV_SCHEME):].partition("/")[2]
+    return unquote_plus(path).split(".", 1)[0] or None
+
+
 class Motor(object):
     """Manages MongoDB connections for your Quart app.
 
@@ -48,13 +85,103 @@ class Motor(object):
     Motor accepts a MongoDB URI via the ``MONGO_URI`` QUART configuration
     variable, or as an argument to the constructor or ``init_app``. See
     :meth:`init_app` for more detail.
+    Further named connections, e.g. to an analytics cluster, can be
+    configured with the ``MONGO_URIS`` variable and are available through
+    :meth:`get_client` and :meth:`get_db`. With ``read_routing``, reads
+    through :attr:`db` during ``GET`` and ``HEAD`` requests are sent to
+    secondaries or to one of those connections, while writes always go to
+    the primary of the default connection; :meth:`reads_from` overrides
+    this for a single view.
+    With a ``deadline``, the operations a request issues must finish
+    within that many seconds of the request starting: the driver sends the
+    time left as ``maxTimeMS`` with each of them, and the request fails
+    with ``504 Gateway Timeout`` once it runs out. :meth:`with_deadline`
+    overrides it for a single view.
+    .. code-block:: python
+        app.config["MONGO_URI"] = "mongodb://db0,db1,db2/shop?replicaSet=rs0"
+        app.config["MONGO_URIS"] = {"analytics": "mongodb://analytics/shop"}
+        mongo = Motor(app, read_routing=ReadPreference.SECONDARY_PREFERRED)
+        @app.route("/reports/sales")
+        @mongo.reads_from("analytics")
+        async def sales_report():
+            return await mongo.db.orders.aggregate(pipeline).to_list(None)
     """
 
-    def __init__(self, app=None, uri=None, json_options=None, *args, **kwargs):
+    def __init__(
+        self,
+        app=None,
+        uri=None,
+        json_options=None,
+        *args,
+        fast_json=False,
+        instrumentation=None,
+        pool_stats=None,
+        warm_up=None,
+        warm_up_timeout=10.0,
+        read_routing=None,
+        raw=False,
+        limiter=None,
+        deadline=None,
+        deadline_header=None,
+        wait_for_indexes=True,
+        index_advisor=None,
+        file_cache=None,
+        pool_budget=None,
+        workers=None,
+        fork_safety="raise",
+        **kwargs
+    ):
         """__init__."""
+        self.limiter = limiter
+        self.deadline = deadline
+        self.deadline_header = deadline_header
+        self._app = None
+        self._view_deadlines = False
+        self._deadline_apps = []
+        self.raw = raw
         self.cx = None
         self.db = None
-        self._json_encoder = partial(JSONEncoder, json_options=json_options)
+        self.pool_budget = pool_budget
+        self.workers = workers
+        if fork_safety not in ("raise", "recreate"):
+            raise ValueError("fork_safety must be 'raise' or 'recreate'")
+        self.fork_safety = fork_safety
+        self._pid = None
+        self._connect = None
+        self.read_routing = read_routing
+        self._clients = {}
+        self._dbs = {}
+        self._routed = {}
+        self._read_target = contextvars.ContextVar(
+            "quart_motor_read_target", default=_DEFAULT_TARGET,
+        )
+        self._request_timeout = contextvars.ContextVar(
+            "quart_motor_request_timeout", default=None,
+        )
+        if instrumentation is True:
+            instrumentation = CommandInstrumentation()
+        self.instrumentation = instrumentation
+        if pool_stats is True:
+            pool_stats = PoolStats()
+        self.pool_stats = pool_stats
+        self.warm_up = warm_up
+        self.warm_up_timeout = warm_up_timeout
+        self.wait_for_indexes = wait_for_indexes
+        self._indexes = IndexManager()
+        if index_advisor is True:
+            index_advisor = IndexAdvisor()
+        self.index_advisor = index_advisor or None
+        if file_cache is True:
+            from quart_motor.file_cache import GridFSFileCache
+            file_cache = GridFSFileCache()
+        self.file_cache = file_cache
+        self._caches = {}
+        self._bulk_writers = {}
+        self._tasks = []
+        self._change_streams = ChangeStreamHub()
+        self._views = ViewScheduler()
+        encoder_class = FastJSONEncoder if fast_json else JSONEncoder
+        self._json_encoder = partial(encoder_class, json_options=json_options)
 
         if app is not None:
             self.init_app(app, uri, *args, **kwargs)
@@ -68,6 +195,15 @@ class Motor(object):
            or keyword arguments to :class:`~motor_async.AsyncIOMotorClient`
         2. If ``uri`` is ``None``, and a Quart config variable named
            ``MONGO_URI`` exists, use that as the ``uri`` as above.
+        3. Otherwise, if the ``MONGO_URIS`` config variable has a
+           ``"default"`` entry, use that as the ``uri`` as above.
+        A client is also configured for every other entry of ``MONGO_URIS``,
+        a mapping of connection names to URIs, with the same keyword
+        arguments.
+        The ``MONGO_DEADLINE``, ``MONGO_DEADLINE_HEADER``,
+        ``MONGO_POOL_BUDGET`` and ``MONGO_WORKERS`` config variables, if
+        set, take precedence over the ``deadline``, ``deadline_header``,
+        ``pool_budget`` and ``workers`` arguments of the constructor.
         The caller is responsible for ensuring that additional positional
         and keyword arguments result in a valid call.
         .. version-changed:: 2.2
@@ -78,13 +214,60 @@ class Motor(object):
            it did in previous versions. You must now use a MongoDB URI to
            configure Quart-Motor.
         """
-        async def _before_serving():
+        def _connect():
+            # clients must be created in the process that uses them, so this
+            # runs in each worker rather than when the app is loaded
+            self._pid = os.getpid()
             self.cx = AsyncIOMotorClient(*args, **kwargs)
+            self.cx.limiter = self.limiter
             if database_name:
                 self.db = self.cx[database_name]
+            for name, (named_uri, named_database) in named.items():
+                client = self._clients[name] = AsyncIOMotorClient(named_uri, **named_kwargs)
+                self._dbs[name] = client[named_database] if named_database else None
+
+        async def _before_serving():
+            _connect()
+            if self.warm_up:
+                connections = None if self.warm_up is True else self.warm_up
+                await asyncio.gather(*(
+                    warm_up(client, connections, self.warm_up_timeout)
+                    for client in [self.cx] + list(self._clients.values())
+                ))
+            self._start_background()
+            if self._indexes.status():
+                if self._db is None:
+                    raise ValueError("declared indexes need a database name in the URI")
+                if self.wait_for_indexes:
+                    await self._indexes.ensure(self._db)
+                else:
+                    self._tasks.append(asyncio.ensure_future(self._indexes.ensure(self._db)))
+
+        async def _after_serving():
+            writers, self._bulk_writers = self._bulk_writers, {}
+            await asyncio.gather(
+                self._views.close(), *(writer.close() for writer in writers.values())
+            )
 
+            self._change_streams.close()
+            if self.index_advisor is not None:
+                self.index_advisor.close()
+            if self.file_cache is not None:
+                self.file_cache.close()
+            tasks, self._tasks = self._tasks, []
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            if self.cx is not None:
+                self.cx.close()
+            for client in self._clients.values():
+                client.close()
+
+        uris = dict(app.config.get("MONGO_URIS") or {})
+        default_uri = uris.pop("default", None)
         if uri is None:
-            uri = app.config.get("MONGO_URI", None)
+            uri = app.config.get("MONGO_URI", default_uri)
         if uri is not None:
             args = tuple([uri] + list(args))
         else:
@@ -92,29 +275,472 @@ class Motor(object):
                 "You must specify a URI or set the MONGO_URI Quart config variable",
             )
 
-        parsed_uri = uri_parser.parse_uri(uri)
-        database_name = parsed_uri["database"]
+        database_name = _database_name(uri)
+        named = {
+            name: (named_uri, _database_name(named_uri))
+            for name, named_uri in uris.items()
+        }
 
         # Try to delay connecting, in case the app is loaded before forking, per
         # https://pymongo.readthedocs.io/en/stable/faq.html#is-pymongo-fork-safe
         kwargs.setdefault("connect", False)
+        self._connect = _connect
+
+        self.pool_budget = app.config.get("MONGO_POOL_BUDGET", self.pool_budget)
+        self.workers = app.config.get("MONGO_WORKERS", self.workers)
+        if self.pool_budget:
+            if any(key.lower() == "maxpoolsize" for key in kwargs):
+                raise ValueError("pass either a pool budget or maxPoolSize, not both")
+            if self.workers is None:
+                self.workers = detect_workers()
+            size = kwargs["maxPoolSize"] = max_pool_size(self.pool_budget, self.workers)
+            for key in [key for key in kwargs if key.lower() == "minpoolsize"]:
+                kwargs[key] = min(kwargs[key], size)
+        if self.raw:
+            kwargs.setdefault("document_class", RawBSONDocument)
+
+        listeners = [
+            listener for listener in (self.instrumentation, self.pool_stats)
+            if listener is not None
+        ]
+        if listeners:
+            kwargs["event_listeners"] = list(kwargs.get("event_listeners", ())) + listeners
+        # the advisor explains queries with the default client, so it only
+        # watches that one
+        named_kwargs = dict(kwargs)
+        if self.index_advisor is not None:
+            kwargs["event_listeners"] = list(kwargs.get("event_listeners", ())) + [self.index_advisor]
+        if self.instrumentation is not None:
+            app.before_request(self.instrumentation.before_request)
+            app.after_request(self.instrumentation.after_request)
+
+        self.deadline = app.config.get("MONGO_DEADLINE", self.deadline)
+        self.deadline_header = app.config.get("MONGO_DEADLINE_HEADER", self.deadline_header)
+        app.before_request(self._check_fork)
+        self._app = app
+        if self.deadline is not None or self.deadline_header is not None or self._view_deadlines:
+            self._install_deadline(app)
 
         app.before_serving(_before_serving)
+        app.after_serving(_after_serving)
 
         app.url_map.converters["ObjectId"] = BSONObjectIdConverter
         app.json = self._json_encoder(app=app)
 
+    @property
+    def db(self):
+        """The database named in the URI, or ``None``.
+
+        During a request whose reads are routed (see ``read_routing`` and
+        :meth:`reads_from`), this is the database the reads are routed to.
+        """
+        if self._db is None:
+            return None
+        target = self._read_target.get()
+        if target is _DEFAULT_TARGET:
+            if (
+                self.read_routing is None
+                or not has_request_context()
+                or request.method not in SAFE_METHODS
+            ):
+                return self._db
+            target = self.read_routing
+        if target is None:
+            return self._db
+        return self._routed_db(target)
+
+    @db.setter
+    def db(self, value):
+        self._db = value
+        self._routed = {}
+
+    def get_client(self, name=None):
+        """Return the client of a ``MONGO_URIS`` connection, or :attr:`cx`."""
+        if name is None or name == "default":
+            return self.cx
+        return self._clients[name]
+
+    def get_db(self, name=None):
+        """Return the database of a ``MONGO_URIS`` connection, or the default one.
+
+        Like :attr:`db`, this is ``None`` if the connection's URI names no
+        database; unlike it, it is never routed.
+        """
+        if name is None or name == "default":
+            return self._db
+        return self._dbs[name]
+
+    def reads_from(self, target):
+        """Route the reads of a view, whatever its request method.
+
+        .. code-block:: python
+            @app.route("/checkout", methods=["POST"])
+            @mongo.reads_from(ReadPreference.SECONDARY_PREFERRED)
+            async def checkout():
+                ...
+            @app.route("/account")
+            @mongo.reads_from(None)
+            async def account():
+                ...  # reads its own writes, so always use the primary
+        With the name of a ``MONGO_URIS`` connection, :attr:`db` is a
+        :class:`~quart_motor.wrappers.ReadRoutedDatabase` during the view:
+        its collections read from the connection's database, while writes
+        still go to the default one.
+        :param target: a read preference, such as
+           :attr:`~pymongo.read_preferences.ReadPreference.SECONDARY_PREFERRED`,
+           the name of a ``MONGO_URIS`` connection, or ``None`` to read from
+           the primary of the default connection
+        """
+        def decorator(view):
+            @wraps(view)
+            async def wrapper(*args, **kwargs):
+                token = self._read_target.set(target)
+                try:
+                    return await current_app.ensure_async(view)(*args, **kwargs)
+                finally:
+                    self._read_target.reset(token)
+            return wrapper
+        return decorator
+
+    def with_deadline(self, seconds):
+        """Set the deadline of a view, instead of the app's ``deadline``.
+
+        .. code-block:: python
+            @app.route("/reports/yearly")
+            @mongo.with_deadline(30)
+            async def yearly_report():
+                return await mongo.db.orders.aggregate(pipeline).to_list(None)
+        A deadline sent by the client in the ``deadline_header`` still
+        applies, if it is shorter.
+        :param float seconds: how long the view's operations may take in
+           all, or ``None`` for no deadline
+        """
+        def decorator(view):
+            setattr(view, _DEADLINE_ATTRIBUTE, seconds)
+            return view
+        if seconds is not None:
+            self._view_deadlines = True
+            if self._app is not None:
+                self._install_deadline(self._app)
+        return decorator
+
+    def _install_deadline(self, app):
+        # only apps with deadlines pay for the hooks, and only timeouts are
+        # handled, leaving other errors to the app's own handlers
+        if app in self._deadline_apps:
+            return
+        self._deadline_apps.append(app)
+        app.before_request(self._start_deadline)
+        app.teardown_request(self._end_deadline)
+        for error_class in _TIMEOUT_ERRORS:
+            app.register_error_handler(error_class, self._handle_timeout)
+
+    def _request_deadline(self):
+        view = current_app.view_functions.get(request.endpoint)
+        seconds = getattr(view, _DEADLINE_ATTRIBUTE, self.deadline)
+        if self.deadline_header is not None:
+            # the time the client is still willing to wait, in milliseconds
+            try:
+                budget = float(request.headers[self.deadline_header]) / 1000
+            except (KeyError, ValueError):
+                pass
+            else:
+                # nan and infinities are ignored, like any other nonsense
+                if math.isfinite(budget):
+                    seconds = budget if seconds is None else min(seconds, budget)
+        return seconds
+
+    async def _start_deadline(self):
+        seconds = self._request_deadline()
+        if seconds is None:
+            return
+        if seconds <= 0:
+            abort(504)
+        # operations read the deadline from the context, which Motor
+        # copies into the threads running them
+        timeout = pymongo.timeout(seconds)
+        timeout.__enter__()
+        self._request_timeout.set(timeout)
+
+    async def _end_deadline(self, exc):
+        timeout = self._request_timeout.get()
+        if timeout is not None:
+            self._request_timeout.set(None)
+            timeout.__exit__(None, None, None)
+
+    async def _handle_timeout(self, error):
+        if isinstance(error, ExecutionTimeout) or self._request_timeout.get() is not None:
+            return await current_app.handle_http_exception(GatewayTimeout())
+        raise error
+
+    async def _check_fork(self):
+        if self._pid is None or self._pid == os.getpid():
+            return
+        # the clients were created by a process this one was forked from;
+        # their sockets and threads are the parent's, and not safe to use
+        if self.fork_safety == "raise":
+            raise RuntimeError(
+                "the MongoDB client was created in process %d and used in process %d, "
+                "after a fork; create the app in each worker, or pass "
+                "fork_safety='recreate'" % (self._pid, os.getpid()),
+            )
+        logger.warning(
+            "process %d was forked from %d after the MongoDB client was created; "
+            "creating a new one", os.getpid(), self._pid,
+        )
+        # the parent's clients are dropped rather than closed, as closing
+        # them would use the parent's connections; everything holding on
+        # to them, or to the parent's tasks, starts over
+        self._discard_background()
+        self._clients = {}
+        self._dbs = {}
+        self._routed = {}
+        self._connect()
+        self._start_background()
+
+    def _start_background(self):
+        for collection_name in self._caches:
+            self._start_cache(collection_name)
+        if self.index_advisor is not None:
+            self.index_advisor.start(self.cx)
+        if self._views.views:
+            if self._db is None:
+                raise ValueError("materialized views need a database name in the URI")
+            self._views.start(self._db)
+
+    def _discard_background(self):
+        writers, self._bulk_writers = self._bulk_writers, {}
+        for writer in writers.values():
+            writer.discard()
+        self._views.discard()
+        self._change_streams.close()
+        if self.index_advisor is not None:
+            self.index_advisor.close()
+        if self.file_cache is not None:
+            self.file_cache.discard()
+        if self.limiter is not None:
+            self.limiter.discard()
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for cache, _ in self._caches.values():
+            # invalidations may have been missed while nobody watched
+            cache.clear()
+
+    def worker_stats(self):
+        """Return this worker's process id, connection budget and pool stats.
+
+        .. code-block:: python
+            @app.route("/metrics/worker")
+            async def worker_metrics():
+                return mongo.worker_stats()
+        ``max_pool_size`` is the largest pool of the default connection,
+        which ``pool_budget`` divided among ``workers`` processes when it
+        is set; ``pools`` has the snapshot of ``pool_stats``, if enabled.
+        """
+        return {
+            "pid": os.getpid(),
+            "workers": self.workers,
+            "pool_budget": self.pool_budget,
+            "max_pool_size": (
+                None if self.cx is None else self.cx.options.pool_options.max_pool_size
+            ),
+            "pools": None if self.pool_stats is None else self.pool_stats.snapshot(),
+        }
+
+    def _routed_db(self, target):
+        if isinstance(target, str):
+            key = ("connection", target)
+        else:
+            key = ("read_preference", repr(target))
+        db = self._routed.get(key)
+        if db is None:
+            if isinstance(target, str):
+                # only reads go to the other cluster
+                db = ReadRoutedDatabase(self._db, self._dbs[target])
+            else:
+                db = self.cx.get_database(self._db.name, read_preference=target)
+                # cached documents are as good as ones read from a secondary
+                for name, (cache, _) in self._caches.items():
+                    db[name].document_cache = cache
+            self._routed[key] = db
+        return db
+
+    def cache(self, collection_name, maxsize=1024, ttl=60.0, watch=False):
+        """Cache documents read from a collection with ``find_one``.
+
+        Enables a :class:`~quart_motor.cache.DocumentCache` for the named
+        collection of :attr:`db`: reads through
+        :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.find_one` and
+        :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.find_one_or_404`
+        with the same filter and projection are answered from memory
+        until the entry expires, is evicted, or is invalidated.
+        .. code-block:: python
+            mongo = Motor(app)
+            flags = mongo.cache("feature_flags", maxsize=512, ttl=300, watch=True)
+            @app.route("/cache-stats")
+            async def cache_stats():
+                return flags.stats
+        :param str collection_name: the collection to cache
+        :param int maxsize: the most documents kept in the cache
+        :param float ttl: seconds a cached document stays valid, or ``None``
+        :param bool watch: if ``True``, a change stream on the collection is
+           opened when the app starts serving, and the cache is cleared on
+           every write to the collection (requires a replica set or sharded
+           cluster)
+        """
+        cache = DocumentCache(maxsize=maxsize, ttl=ttl)
+        self._caches[collection_name] = (cache, watch)
+        if self._db is not None:
+            self._start_cache(collection_name)
+        return cache
+
+    def index(self, collection_name, keys, **kwargs):
+        """Declare an index of a collection of :attr:`db`.
+
+        Declared indexes are created when the app starts serving, those of
+        all collections concurrently; indexes that exist already are left
+        as they are. Startup waits for them unless ``wait_for_indexes`` is
+        ``False``; either way :meth:`index_status` reports on their
+        progress, and failures are logged rather than raised.
+        .. code-block:: python
+            mongo = Motor(app, wait_for_indexes=False)
+            mongo.index("orders", [("customer", ASCENDING), ("created", DESCENDING)])
+            mongo.index("users", "email", unique=True)
+            @app.route("/health/indexes")
+            async def index_health():
+                return mongo.index_status()
+        Returns the name of the index.
+        :param str collection_name: the collection to index
+        :param keys: the key or list of ``(key, direction)`` to index
+        :param kwargs: index options, as for
+           :class:`~pymongo.operations.IndexModel`
+        """
+        return self._indexes.declare(collection_name, keys, **kwargs)
+
+    def index_status(self):
+        """Return the state of the indexes declared with :meth:`index`, by collection.
+
+        See :meth:`~quart_motor.indexes.IndexManager.status`.
+        """
+        return self._indexes.status()
+
+    def bulk_writer(self, collection_name, **kwargs):
+        """Get the :class:`~quart_motor.bulk.BulkWriter` for a collection.
+
+        The writer buffers small writes to the named collection of
+        :attr:`db` and sends them as unordered ``bulk_write`` batches. The
+        same writer is returned for the same collection every time, and
+        all writers are flushed when the app stops serving.
+        .. code-block:: python
+            @app.route("/like/<ObjectId:post_id>", methods=["POST"])
+            async def like(post_id):
+                await mongo.bulk_writer("likes").insert_one({"post": post_id})
+                return "", 204
+        :param str collection_name: the collection to write to
+        :param kwargs: options for a new :class:`~quart_motor.bulk.BulkWriter`
+           (``max_batch``, ``flush_interval``, ``max_pending``); ignored if
+           the writer already exists
+        """
+        writer = self._bulk_writers.get(collection_name)
+        if writer is None:
+            if self._db is None:
+                raise ValueError("a bulk writer needs a database name in the URI")
+            writer = BulkWriter(self._db[collection_name], **kwargs)
+            self._bulk_writers[collection_name] = writer
+        return writer
+
+    def materialized_view(self, source, pipeline, into, every=300.0, **kwargs):
+        """Keep a collection of :attr:`db` up to date with an aggregation.
+
+        The view is refreshed when the app starts serving and then every
+        ``every`` seconds, in the background, by running ``pipeline`` on
+        the ``source`` collection with a ``$merge`` into the ``into``
+        collection; see :class:`~quart_motor.views.MaterializedView`.
+        Refreshes in progress are waited for when the app stops serving.
+        Every process serving the app refreshes its views.
+        .. code-block:: python
+            daily_sales = mongo.materialized_view(
+                "orders",
+                [{"$group": {"_id": "$day", "total": {"$sum": "$total"}}}],
+                into="daily_sales", every=600,
+            )
+            @app.route("/dashboard/daily")
+            async def daily():
+                return {
+                    "days": await mongo.db.daily_sales.find().to_list(None),
+                    "refreshed": daily_sales.status()["last_refresh"],
+                }
+        Returns the :class:`~quart_motor.views.MaterializedView`, whose
+        :meth:`~quart_motor.views.MaterializedView.refresh` can also be
+        awaited to refresh it at once.
+        :param str source: the collection the pipeline runs on
+        :param list pipeline: the aggregation pipeline
+        :param str into: the collection the results are merged into
+        :param float every: seconds between refreshes
+        :param kwargs: ``on`` and ``when_matched``, as for ``$merge``
+        """
+        view = MaterializedView(source, pipeline, into, every, **kwargs)
+        self._views.add(view)
+        return view
+
+    def watch(self, collection_name, pipeline=None, **kwargs):
+        """Subscribe to the changes of a collection of :attr:`db`.
+
+        Returns a :class:`~quart_motor.streams.Subscription`. Subscribers
+        of the same collection with the same pipeline and options share a
+        single change stream, and each event is serialized to JSON once
+        for all of them.
+        .. code-block:: python
+            @app.route("/events/orders")
+            async def order_events():
+                events = mongo.watch(
+                    "orders", [{"$match": {"operationType": "insert"}}],
+                    resume_after=request.headers.get("Last-Event-ID"),
+                )
+                return events.sse(), {"Content-Type": "text/event-stream"}
+        Change streams require a replica set or sharded cluster.
+        :param str collection_name: the collection to watch
+        :param pipeline: the change stream's aggregation pipeline
+        :param kwargs: ``maxsize`` (the most events queued for this
+           subscriber before it is dropped as too slow), ``resume_after``
+           (the id of the last event the subscriber saw), and options for
+           the change stream, such as ``full_document``
+        """
+        if self._db is None:
+            raise ValueError("a change stream needs a database name in the URI")
+        return self._change_streams.subscribe(
+            self._db[collection_name], pipeline, dumps=current_app.json.dumps, **kwargs
+        )
+
+    def _start_cache(self, collection_name):
+        if self._db is None:
+            raise ValueError("a document cache needs a database name in the URI")
+        cache, watch = self._caches[collection_name]
+        collection = self._db[collection_name]
+        collection.document_cache = cache
+        for key, db in self._routed.items():
+            if key[0] == "read_preference":
+                db[collection_name].document_cache = cache
+        if watch:
+            self._tasks.append(asyncio.ensure_future(cache.watch(collection)))
+
     # view helpers
-    def send_file(self, filename, base="fs", version=-1, cache_for=31536000):
+    async def send_file(self, filename, base="fs", version=-1, cache_for=31536000):
         """Respond with a file from GridFS.
 
         Returns an instance of the :attr:`~quart.Quart.response_class`
         containing the named file, and implement conditional GET semantics
-        (using :meth:`~werkzeug.wrappers.ETagResponseMixin.make_conditional`).
+        (using :meth:`~quart.wrappers.Response.make_conditional`). The file
+        is streamed from GridFS one chunk at a time, and ``Range`` /
+        ``If-Range`` requests are answered with ``206 Partial Content``
+        starting from the chunk that holds the first requested byte.
+        With a ``file_cache``, the file is fetched once and then served
+        from a local copy; see :class:`~quart_motor.file_cache.GridFSFileCache`.
         .. code-block:: python
             @app.route("/uploads/<path:filename>")
-            def get_upload(filename):
-                return mongo.send_file(filename)
+            async def get_upload(filename):
+                return await mongo.send_file(filename)
         :param str filename: the filename of the file to return
         :param str base: the base name of the GridFS collections to use
         :param bool version: if positive, return the Nth revision of the file
@@ -123,61 +749,142 @@ class Motor(object):
         :param int cache_for: number of seconds that browsers should be
            instructed to cache responses
         """
-        if not isinstance(base, text_type):
-            raise TypeError("'base' must be string or unicode")
-        if not isinstance(version, num_type):
+        if not isinstance(base, str):
+            raise TypeError("'base' must be a string")
+        if not isinstance(version, int):
             raise TypeError("'version' must be an integer")
-        if not isinstance(cache_for, num_type):
+        if not isinstance(cache_for, int):
             raise TypeError("'cache_for' must be an integer")
 
-        storage = GridFS(self.db, base)
+        db = self.db
+        if isinstance(db, ReadRoutedDatabase):
+            # files are stored through the default connection
+            db = db.writes
+        storage = AsyncIOMotorGridFSBucket(db, base)
+        cache = self.file_cache
 
+        fileobj = None
+        if cache is not None:
+            fileobj = cache.lookup(base, filename, version)
         try:
-            fileobj = storage.get_version(filename=filename, version=version)
+            if fileobj is None:
+                fileobj = await storage.open_download_stream_by_name(
+                    filename, revision=version,
+                )
+                if cache is not None:
+                    cache.remember(base, filename, version, fileobj)
+            if cache is not None:
+                body = await cache.body(base, filename, fileobj, storage)
+            else:
+                body = GridFSBody(fileobj)
         except NoFile:
             abort(404)
 
-        # mostly copied from quart/helpers.py, with
-        # modifications for GridFS
-        data = wrap_file(request.environ, fileobj, buffer_size=1024 * 255)
-        response = current_app.response_class(
-            data,
-            mimetype=fileobj.content_type,
-            direct_passthrough=True,
-        )
+        metadata = fileobj.metadata or {}
+        content_type = metadata.get("contentType") or fileobj.content_type
+        # GridFS files are immutable, so the _id identifies the content
+        # when no md5 was stored with the file
+        etag = fileobj.md5 or str(fileobj._id)
+
+        response = current_app.response_class(body, mimetype=content_type)
         response.content_length = fileobj.length
         response.last_modified = fileobj.upload_date
-        response.set_etag(fileobj.md5)
+        response.set_etag(etag)
         response.cache_control.max_age = cache_for
         response.cache_control.public = True
-        response.make_conditional(request)
+        await response.make_conditional(
+            request, accept_ranges=True, complete_length=fileobj.length,
+        )
         return response
 
-    def save_file(self, filename, fileobj, base="fs", content_type=None, **kwargs):
-        """Save a file-like object to GridFS using the given filename.
+    async def save_file(
+        self,
+        filename,
+        fileobj,
+        base="fs",
+        content_type=None,
+        chunk_size=None,
+        checksum="md5",
+        concurrent=True,
+        **kwargs
+    ):
+        """Save a file-like object or a stream of bytes to GridFS.
 
+        Data is written to GridFS chunk by chunk as it is read, so that an
+        upload never has to be held in memory (or spooled to disk first)
+        as a whole.
         .. code-block:: python
-            @app.route("/uploads/<path:filename>", methods=["POST"])
-            def save_upload(filename):
-                mongo.save_file(filename, request.files["file"])
+            @app.route("/uploads/<path:filename>", methods=["PUT"])
+            async def save_upload(filename):
+                await mongo.save_file(filename, request.body)
                 return redirect(url_for("get_upload", filename=filename))
         :param str filename: the filename of the file to return
-        :param file fileobj: the file-like object to save
+        :param fileobj: the data to save; :class:`bytes`, a file-like object
+           with a (sync or async) ``read()`` method such as a
+           :class:`~quart.datastructures.FileStorage`, or a (sync or async)
+           iterable of :class:`bytes` such as ``request.body``
         :param str base: base the base name of the GridFS collections to use
         :param str content_type: the MIME content-type of the file. If
            ``None``, the content-type is guessed from the filename using
            :func:`~mimetypes.guess_type`
-        :param kwargs: extra attributes to be stored in the file's document,
-           passed directly to :meth:`gridfs.GridFS.put`
+        :param int chunk_size: the GridFS chunk size in bytes, defaults to
+           the bucket's chunk size (255 KB)
+        :param str checksum: name of a :mod:`hashlib` algorithm used to
+           compute a checksum of the data as it is written. The hex digest
+           is stored in the file's document under the algorithm's name;
+           ``"md5"`` (the default) is also used as the ETag by
+           :meth:`send_file`. Pass ``None`` to skip the checksum.
+        :param bool concurrent: if ``True``, read the next piece of data
+           while the previous one is being written to GridFS, keeping at
+           most one write in flight
+        :param kwargs: extra attributes to be stored in the file's document
         """
-        if not isinstance(base, text_type):
-            raise TypeError("'base' must be string or unicode")
-        if not (hasattr(fileobj, "read") and callable(fileobj.read)):
-            raise TypeError("'fileobj' must have read() method")
+        if not isinstance(base, str):
+            raise TypeError("'base' must be a string")
 
         if content_type is None:
             content_type, _ = guess_type(filename)
 
-        storage = GridFS(self.db, base)
-        id = storage.put(fileobj, filename=filename, content_type=content_type, **kwargs)
-        return id
+        storage = AsyncIOMotorGridFSBucket(self._db, base)
+        if "_id" in kwargs:
+            grid_in = storage.open_upload_stream_with_id(
+                kwargs.pop("_id"), filename, chunk_size_bytes=chunk_size,
+            )
+        else:
+            grid_in = storage.open_upload_stream(filename, chunk_size_bytes=chunk_size)
+
+        hasher = hashlib.new(checksum) if checksum else None
+        pending = None
+        try:
+            async for data in iter_chunks(fileobj, grid_in.chunk_size):
+                if hasher is not None:
+                    hasher.update(data)
+                if pending is not None:
+                    await pending
+                    pending = None
+                if concurrent:
+                    pending = asyncio.ensure_future(grid_in.write(data))
+                else:
+                    await grid_in.write(data)
+            if pending is not None:
+                await pending
+                pending = None
+
+            if content_type is not None:
+                kwargs["contentType"] = content_type
+            if hasher is not None:
+                kwargs[checksum] = hasher.hexdigest()
+            # GridIn.set only updates the pending file document until the
+            # file is closed, so this does no I/O
+            for key, value in kwargs.items():
+                grid_in.delegate.set(key, value)
+            await grid_in.close()
+            if self.file_cache is not None:
+                self.file_cache.invalidate(base, filename)
+        except BaseException:
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            await grid_in.abort()
+            raise
+
+        return grid_in._id
@@ -0,0 +1,227 @@
+"""Write-behind bulk writes."""
+import asyncio
+import contextvars
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.common import (
+    validate_is_document_type, validate_ok_for_replace, validate_ok_for_update,
+)
+from pymongo.errors import BulkWriteError, WriteConcernError, WriteError
+
+__all__ = ["BulkWriter"]
+
+
+class BulkWriter(object):
+    """Buffer small writes and send them as unordered ``bulk_write`` batches.
+
+    Each write is queued and the caller can await its outcome; the queue
+    is flushed when ``max_batch`` writes are waiting or ``flush_interval``
+    seconds after the first write of a batch was queued, whichever comes
+    first. Once ``max_pending`` writes are queued or in flight, queuing
+    more waits for room (backpressure) instead of growing the buffer.
+    .. code-block:: python
+        @app.route("/track", methods=["POST"])
+        async def track():
+            events = mongo.bulk_writer("events")
+            await events.insert_one(await request.get_json(), wait=False)
+            return "", 204
+    Writers are created with :meth:`~quart_motor.Motor.bulk_writer`, which
+    also flushes them when the app stops serving.
+    Since batches are unordered, writes queued together may be applied in
+    any order.
+    :param collection: the collection to write to
+    :param int max_batch: the most writes sent in one ``bulk_write``
+    :param float flush_interval: the longest a write waits in the buffer
+    :param int max_pending: the most writes queued or in flight at once
+    """
+
+    def __init__(self, collection, max_batch=1000, flush_interval=0.1, max_pending=10000):
+        """__init__."""
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._buffer = []
+        self._space = None
+        self._has_writes = None
+        self._batch_full = None
+        self._task = None
+        self._closed = False
+
+    def __len__(self):
+        """Return the number of writes waiting to be flushed."""
+        return len(self._buffer)
+
+    async def write(self, request, wait=True):
+        """Queue a PyMongo write request, such as :class:`~pymongo.InsertOne`.
+
+        If ``wait`` is ``True``, return once the write has been applied, or
+        raise the :class:`~pymongo.errors.WriteError` (or other error) it
+        failed with. Otherwise return a future for that outcome as soon as
+        the write is queued. A request PyMongo would refuse to send, such
+        as an update without ``$`` operators, raises straight away rather
+        than failing the batch it would be sent with.
+        """
+        if self._closed:
+            raise RuntimeError("this BulkWriter is closed")
+        try:
+            request._add_to_bulk(_Validator())
+        except AttributeError:
+            raise TypeError("%r is not a valid request" % (request,))
+        if self._task is None:
+            self._start()
+
+        await self._space.acquire()
+        if self._closed:
+            # closed while waiting for room; the flusher may already be gone
+            self._space.release()
+            raise RuntimeError("this BulkWriter is closed")
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._space.release())
+        self._buffer.append((request, future))
+        self._has_writes.set()
+        if len(self._buffer) >= self.max_batch:
+            self._batch_full.set()
+
+        if wait:
+            return await asyncio.shield(future)
+        # nobody may look at the outcome of a fire-and-forget write
+        future.add_done_callback(_consume_exception)
+        return future
+
+    async def insert_one(self, document, wait=True):
+        """Queue an insert; see :meth:`write`."""
+        return await self.write(InsertOne(document), wait)
+
+    async def update_one(self, filter, update, upsert=False, wait=True, **kwargs):
+        """Queue an update of one document; see :meth:`write`."""
+        return await self.write(UpdateOne(filter, update, upsert=upsert, **kwargs), wait)
+
+    async def update_many(self, filter, update, upsert=False, wait=True, **kwargs):
+        """Queue an update of all matching documents; see :meth:`write`."""
+        return await self.write(UpdateMany(filter, update, upsert=upsert, **kwargs), wait)
+
+    async def replace_one(self, filter, replacement, upsert=False, wait=True, **kwargs):
+        """Queue a replacement; see :meth:`write`."""
+        return await self.write(ReplaceOne(filter, replacement, upsert=upsert, **kwargs), wait)
+
+    async def delete_one(self, filter, wait=True, **kwargs):
+        """Queue a deletion of one document; see :meth:`write`."""
+        return await self.write(DeleteOne(filter, **kwargs), wait)
+
+    async def delete_many(self, filter, wait=True, **kwargs):
+        """Queue a deletion of all matching documents; see :meth:`write`."""
+        return await self.write(DeleteMany(filter, **kwargs), wait)
+
+    async def flush(self):
+        """Send everything queued so far."""
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.max_batch], self._buffer[self.max_batch:]
+            if not self._buffer:
+                self._has_writes.clear()
+            if len(self._buffer) < self.max_batch:
+                self._batch_full.clear()
+            await self._send(batch)
+
+    async def close(self):
+        """Flush the queued writes and stop the background flusher.
+
+        Writes still waiting for room in the queue, and any queued after
+        this is called, raise ``RuntimeError``.
+        """
+        self._closed = True
+        if self._task is not None:
+            # wake the flusher so that it flushes what's left and exits
+            self._has_writes.set()
+            self._batch_full.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                # left over only if the flusher failed or was cancelled
+                buffer, self._buffer = self._buffer, []
+                for _, future in buffer:
+                    _resolve(future, RuntimeError("this BulkWriter is closed"))
+
+    def discard(self):
+        """Drop the queued writes without sending them, and stop the flusher.
+
+        For a process forked from the one that queued the writes, which
+        sends them itself.
+        """
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._buffer = []
+
+    def _start(self):
+        self._space = asyncio.Semaphore(self.max_pending)
+        self._has_writes = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        # outlives the request that queued the first write, so must not
+        # inherit its context, and with it its deadline
+        self._task = contextvars.Context().run(asyncio.ensure_future, self._run())
+
+    async def _run(self):
+        while not self._closed:
+            await self._has_writes.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def _send(self, batch):
+        try:
+            await self.collection.bulk_write([request for request, _ in batch], ordered=False)
+        except BulkWriteError as exc:
+            failed = set()
+            for error in exc.details.get("writeErrors", []):
+                index = error["index"]
+                failed.add(index)
+                _resolve(batch[index][1], WriteError(error.get("errmsg"), error.get("code"), error))
+            concern_errors = exc.details.get("writeConcernErrors")
+            outcome = None
+            if concern_errors:
+                error = concern_errors[-1]
+                outcome = WriteConcernError(error.get("errmsg"), error.get("code"), error)
+            for index, (_, future) in enumerate(batch):
+                if index not in failed:
+                    _resolve(future, outcome)
+        except Exception as exc:
+            for _, future in batch:
+                _resolve(future, exc)
+        else:
+            for _, future in batch:
+                _resolve(future, None)
+
+
+class _Validator(object):
+    """Checks a request the way PyMongo's bulk write does when adding it."""
+
+    def add_insert(self, document):
+        validate_is_document_type("document", document)
+
+    def add_update(self, selector, update, *args, **kwargs):
+        validate_ok_for_update(update)
+
+    def add_replace(self, selector, replacement, *args, **kwargs):
+        validate_ok_for_replace(replacement)
+
+    def add_delete(self, selector, *args, **kwargs):
+        pass
+
+
+def _resolve(future, exc):
+    if future.done():
+        return
+    if exc is None:
+        future.set_result(None)
+    else:
+        future.set_exception(exc)
+
+
+def _consume_exception(future):
+    if not future.cancelled():
+        future.exception()
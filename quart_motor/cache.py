@@ -0,0 +1,267 @@
+"""Read-through document and result caches."""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+
+import bson
+from bson.son import SON
+from pymongo.errors import OperationFailure, PyMongoError
+
+__all__ = ["DocumentCache", "ResultCache", "make_key"]
+
+logger = logging.getLogger(__name__)
+
+# returned by DocumentCache.get() on a miss; None is a cached "not found"
+MISSING = object()
+
+# "The $changeStream stage is only supported on replica sets"
+_CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+def make_key(filter, projection=None):
+    """Build a cache key from a ``find_one`` filter and projection.
+
+    Top-level fields are sorted, since their order doesn't change the
+    meaning of a query; embedded documents are kept as they are, since
+    theirs does. A filter that isn't a mapping is an ``_id`` value, as
+    for :meth:`~pymongo.collection.Collection.find_one`.
+    """
+    if filter is None:
+        filter = {}
+    elif not hasattr(filter, "items"):
+        filter = {"_id": filter}
+    if projection is not None and not hasattr(projection, "items"):
+        projection = dict.fromkeys(projection, 1)
+
+    return (
+        bson.encode(SON(sorted(filter.items()))),
+        bson.encode(SON(sorted(projection.items()))) if projection is not None else None,
+    )
+
+
+class DocumentCache(object):
+    """A size-bounded LRU cache of documents, with a time-to-live.
+
+    Documents are stored as raw BSON, so every hit hands out a fresh copy
+    that callers are free to modify. ``None`` (no matching document) is
+    cached as well. Enable it for a collection with
+    :meth:`~quart_motor.Motor.cache`; reads through
+    :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.find_one` (and so
+    :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.find_one_or_404`)
+    are then served from the cache.
+    :param int maxsize: the most entries kept; the least recently used
+       entry is evicted to make room for a new one
+    :param float ttl: seconds an entry stays valid, or ``None`` to keep
+       entries until they are evicted or invalidated
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        """__init__."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        """__len__."""
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the raw document cached for ``key``, or :data:`MISSING`."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        expires, raw = entry
+        if expires is not None and expires < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return raw
+
+    def set(self, key, raw, generation=None):
+        """Cache the raw document (or ``None``) for ``key``.
+
+        If ``generation`` is given and the cache was cleared since it was
+        read from :attr:`generation`, the document may be stale and is not
+        cached.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires, raw)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry."""
+        self._entries.clear()
+        self.generation += 1
+        self.invalidations += 1
+
+    @property
+    def stats(self):
+        """Hit, miss, eviction and invalidation counters, and the current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    async def watch(self, collection, retry_delay=1.0):
+        """Clear the cache whenever ``collection`` changes, until cancelled.
+
+        Any change to the collection may change the result of any cached
+        query, so every change event clears the whole cache; this suits
+        the rarely-written collections the cache is meant for. The cache
+        is also cleared whenever the change stream has to be reopened,
+        since events may have been missed in between.
+        """
+        while True:
+            try:
+                async with collection.watch() as stream:
+                    self.clear()
+                    async for _ in stream:
+                        self.clear()
+            except PyMongoError as exc:
+                if isinstance(exc, OperationFailure) and exc.code == _CHANGE_STREAMS_UNSUPPORTED:
+                    logger.error("can't watch %s, cache entries will expire by ttl only: %s",
+                                 collection.full_name, exc)
+                    return
+                logger.warning("change stream on %s failed, reopening: %s",
+                               collection.full_name, exc)
+                self.clear()
+                await asyncio.sleep(retry_delay)
+
+
+class _Result(object):
+
+    __slots__ = ("value", "fresh_until", "stale_until", "pending")
+
+    def __init__(self):
+        self.value = MISSING
+        self.fresh_until = self.stale_until = 0.0
+        self.pending = None
+
+
+class ResultCache(object):
+    """A size-bounded LRU cache of query results, loaded once at a time.
+
+    Used by
+    :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.aggregate_cached`.
+    Concurrent requests for a result that isn't cached share a single
+    load (single flight). Once a result is older than its ``ttl`` it may
+    still be served for ``stale_ttl`` more seconds, while it is reloaded
+    in the background (stale-while-revalidate). Results are shared by
+    every caller, who must not modify them.
+    :param int maxsize: the most results kept
+    """
+
+    def __init__(self, maxsize=256):
+        """__init__."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        """__len__."""
+        return len(self._entries)
+
+    async def get(self, key, load, ttl, stale_ttl=0.0):
+        """Return the result cached for ``key``, calling ``await load()`` if needed.
+
+        :param key: a hashable key
+        :param load: a function returning an awaitable of the result
+        :param float ttl: seconds the result is fresh, or ``None`` to keep
+           it until it is evicted or cleared
+        :param float stale_ttl: seconds a result older than ``ttl`` is
+           still served while it is reloaded
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Result()
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._entries.move_to_end(key)
+
+        if entry.value is not MISSING:
+            if now < entry.fresh_until:
+                self.hits += 1
+                return entry.value
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                if entry.pending is None:
+                    self._load(entry, load, ttl, stale_ttl, background=True)
+                return entry.value
+
+        self.misses += 1
+        if entry.pending is None:
+            self._load(entry, load, ttl, stale_ttl)
+        # callers giving up don't cancel the load shared with the others
+        return await asyncio.shield(entry.pending)
+
+    def _load(self, entry, load, ttl, stale_ttl, background=False):
+        async def run():
+            try:
+                value = await load()
+            finally:
+                entry.pending = None
+            entry.value = value
+            entry.fresh_until = time.monotonic() + ttl if ttl is not None else float("inf")
+            entry.stale_until = entry.fresh_until + (stale_ttl or 0.0)
+            return value
+
+        def done(task):
+            if not task.cancelled() and task.exception() is not None:
+                self.failures += 1
+                if background:
+                    logger.warning("refreshing a cached result failed, serving the stale one: %s",
+                                   task.exception())
+
+        if background:
+            # outlives the request that found the result stale, so must not
+            # inherit its context, and with it its deadline
+            task = contextvars.Context().run(asyncio.ensure_future, run())
+        else:
+            task = asyncio.ensure_future(run())
+        task.add_done_callback(done)
+        entry.pending = task
+
+    def clear(self):
+        """Drop every result; loads in progress still complete."""
+        self._entries.clear()
+
+    @property
+    def stats(self):
+        """Hit, stale hit, miss, eviction and failure counters, and the current size."""
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "failures": self.failures,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
@@ -0,0 +1,343 @@
+"""Query results decoded column by column."""
+import array
+import csv
+import datetime
+import io
+import itertools
+
+import bson
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+except ImportError:  # pragma: no cover
+    pyarrow = parquet = None
+
+__all__ = ["Columns", "iter_columns", "read_columns"]
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_NAIVE_EPOCH = datetime.datetime(1970, 1, 1)
+_MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
+def _milliseconds(value):
+    # BSON datetimes are decoded as naive UTC
+    return (value - _NAIVE_EPOCH) // _MILLISECOND
+
+
+# schema type: (array typecode, conversion, value stored for missing fields);
+# datetimes are kept as milliseconds since the epoch, as BSON stores them
+_TYPED = {
+    float: ("d", float, float("nan")),
+    int: ("q", int, 0),
+    bool: ("b", bool, False),
+    datetime.datetime: ("q", _milliseconds, 0),
+}
+
+_NUMPY_TYPES = {
+    float: "float64",
+    int: "int64",
+    bool: "bool",
+    datetime.datetime: "datetime64[ms]",
+}
+
+
+def _arrow_type(kind):
+    return {
+        float: pyarrow.float64(),
+        int: pyarrow.int64(),
+        bool: pyarrow.bool_(),
+        datetime.datetime: pyarrow.timestamp("ms", tz="UTC"),
+        str: pyarrow.string(),
+    }.get(kind)
+
+
+def _field(documents, name):
+    if "." not in name:
+        return list(map(dict.get, documents, itertools.repeat(name)))
+    values = []
+    for document in documents:
+        for part in name.split("."):
+            if not isinstance(document, dict):
+                document = None
+                break
+            document = document.get(part)
+        values.append(document)
+    return values
+
+
+def projection(schema):
+    """Return the projection that fetches only the fields of ``schema``."""
+    fields = {name: 1 for name in schema}
+    fields.setdefault("_id", 0)
+    return fields
+
+
+def _numpy_column(column):
+    dtype = _NUMPY_TYPES.get(column.kind)
+    if dtype is None:
+        values = numpy.array(column.values, dtype=object)
+    elif column.values:
+        values = numpy.frombuffer(column.values, dtype=dtype)
+    else:
+        values = numpy.empty(0, dtype=dtype)
+    mask = None
+    if column.mask is not None:
+        mask = numpy.frombuffer(column.mask, dtype=bool)
+    return values, mask
+
+
+# the arrays of these take the values of the type as they are, and raise
+# TypeError for other values, which are then converted
+_EXACT = frozenset((float, int))
+
+
+class _Column(object):
+
+    __slots__ = ("name", "kind", "values", "mask", "_convert", "_fill")
+
+    def __init__(self, name, kind):
+        typecode, convert, fill = _TYPED.get(kind, (None, kind, None))
+        if kind is object:
+            convert = None
+        self.name = name
+        self.kind = kind
+        self.values = array.array(typecode) if typecode else []
+        # one byte per row, set for missing values; only kept once one is
+        self.mask = None
+        self._convert = convert
+        self._fill = fill
+
+    def extend(self, documents):
+        values = _field(documents, self.name)
+        convert = self._convert
+        if None in values:
+            if self.mask is None:
+                self.mask = bytearray(len(self.values))
+            self.mask.extend(value is None for value in values)
+            values = [
+                self._fill if value is None else convert(value) if convert else value
+                for value in values
+            ]
+        else:
+            if self.mask is not None:
+                self.mask.extend(bytes(len(values)))
+            if self.kind in _EXACT:
+                # skips a conversion per value when none is needed
+                length = len(self.values)
+                try:
+                    self.values.extend(values)
+                    return
+                except TypeError:
+                    del self.values[length:]
+            if convert is not None:
+                values = map(convert, values)
+        self.values.extend(values)
+
+    def missing(self, index):
+        return self.mask is not None and self.mask[index]
+
+
+class Columns(object):
+    """Query results decoded into one typed array per field.
+
+    Returned by
+    :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.find_columns` and
+    :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.aggregate_columns`.
+    The ``schema`` maps field names (dotted for embedded fields) to their
+    types: ``float``, ``int``, ``bool`` and ``datetime.datetime`` values
+    are stored in compact :class:`array.array` buffers (datetimes as
+    milliseconds since the epoch), anything else in lists, converted with
+    the given type (e.g. ``str`` for an ``ObjectId``; ``object`` to keep
+    values as they are). Documents are only decoded one batch at a time,
+    so the result set is never held as a list of dicts.
+    .. code-block:: python
+        columns = await mongo.db.orders.find_columns(
+            {"status": "paid"}, {"total": float, "items": int, "created": datetime},
+        )
+        totals = columns.to_numpy()["total"]
+        return {"orders": len(columns), "revenue": float(totals.sum())}
+    Missing and ``null`` values are stored as ``NaN`` in ``float``
+    columns and as ``0`` or ``False`` in the other typed columns, and
+    masked in the NumPy and Arrow conversions.
+    :param dict schema: the type of each field, by name
+    """
+
+    def __init__(self, schema):
+        """__init__."""
+        self.schema = dict(schema)
+        self._columns = {name: _Column(name, kind) for name, kind in self.schema.items()}
+        self._length = 0
+
+    def __len__(self):
+        """Return the number of rows."""
+        return self._length
+
+    def __getitem__(self, name):
+        """Return the values of a field, as an :class:`array.array` or a list."""
+        return self._columns[name].values
+
+    def extend(self, batch):
+        """Append the documents of a raw BSON batch."""
+        self.extend_documents(bson.decode_all(batch))
+
+    def extend_documents(self, documents):
+        """Append a list of documents."""
+        for column in self._columns.values():
+            column.extend(documents)
+        self._length += len(documents)
+
+    def to_numpy(self):
+        """Return the columns as NumPy arrays, keyed by field name.
+
+        Typed columns share their memory with the arrays, without copying
+        them; columns with missing values are
+        :class:`~numpy.ma.MaskedArray` instances. Requires :mod:`numpy`.
+        """
+        if numpy is None:
+            raise RuntimeError("to_numpy() requires numpy")
+        arrays = {}
+        for name, column in self._columns.items():
+            values, mask = _numpy_column(column)
+            arrays[name] = values if mask is None else numpy.ma.masked_array(values, mask=mask)
+        return arrays
+
+    def to_arrow(self):
+        """Return the columns as a :class:`pyarrow.Table`.
+
+        Missing values are nulls. Requires :mod:`pyarrow`.
+        """
+        if pyarrow is None:
+            raise RuntimeError("to_arrow() requires pyarrow")
+        arrays = []
+        for column in self._columns.values():
+            kind = _arrow_type(column.kind)
+            if numpy is not None:
+                values, mask = _numpy_column(column)
+                arrays.append(pyarrow.array(values, type=kind, mask=mask))
+                continue
+            if column.kind is datetime.datetime:
+                values = [_EPOCH + datetime.timedelta(milliseconds=v) for v in column.values]
+            elif column.kind is bool:
+                values = [bool(v) for v in column.values]
+            else:
+                values = list(column.values)
+            if column.mask is not None:
+                values = [None if missing else v for v, missing in zip(values, column.mask)]
+            arrays.append(pyarrow.array(values, type=kind))
+        return pyarrow.Table.from_arrays(arrays, names=list(self._columns))
+
+    def rows(self):
+        """Yield the rows as tuples of CSV-ready values.
+
+        Missing values are ``""`` and datetimes are in ISO 8601 format.
+        """
+        columns = list(self._columns.values())
+        for index in range(self._length):
+            row = []
+            for column in columns:
+                if column.missing(index):
+                    row.append("")
+                elif column.kind is datetime.datetime:
+                    milliseconds = column.values[index]
+                    row.append((_EPOCH + datetime.timedelta(milliseconds=milliseconds)).isoformat())
+                elif column.kind is bool:
+                    row.append(bool(column.values[index]))
+                else:
+                    row.append(column.values[index])
+            yield tuple(row)
+
+    def to_csv(self, header=True):
+        """Format the rows as CSV."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(self.schema)
+        writer.writerows(self.rows())
+        return buffer.getvalue()
+
+
+async def read_columns(cursor, schema, length=1000):
+    """Read all the documents of a cursor into :class:`Columns`.
+
+    Documents are fetched ``length`` at a time, and only those are held
+    as dicts at once.
+    :param cursor: a cursor returned by ``find`` or ``aggregate``
+    :param dict schema: the type of each field, by name
+    :param int length: the most documents decoded at a time
+    """
+    result = Columns(schema)
+    while True:
+        documents = await cursor.to_list(length)
+        if not documents:
+            return result
+        result.extend_documents(documents)
+
+
+async def iter_columns(cursor, schema):
+    """Yield the batches of a raw-batch cursor as :class:`Columns`.
+
+    :param cursor: a cursor returned by ``find_raw_batches`` or
+       ``aggregate_raw_batches``
+    :param dict schema: the type of each field, by name
+    """
+    async for batch in cursor:
+        columns = Columns(schema)
+        columns.extend(batch)
+        yield columns
+
+
+class _Sink(io.RawIOBase):
+    """A write-only file whose contents are taken as they are written."""
+
+    def __init__(self):
+        """__init__."""
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        """writable."""
+        return True
+
+    def write(self, data):
+        """write."""
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        """tell."""
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def generate_csv(cursor, schema):
+    """Generate a CSV body, with a header row, from a raw-batch cursor."""
+    yield Columns(schema).to_csv()
+    async for columns in iter_columns(cursor, schema):
+        yield columns.to_csv(header=False)
+
+
+async def generate_parquet(cursor, schema):
+    """Generate a Parquet file, one row group per batch, from a raw-batch cursor."""
+    sink = _Sink()
+    writer = None
+    async for columns in iter_columns(cursor, schema):
+        table = columns.to_arrow()
+        if writer is None:
+            writer = parquet.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.take()
+    if writer is None:
+        writer = parquet.ParquetWriter(sink, Columns(schema).to_arrow().schema)
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,290 @@
+"""A local disk cache of GridFS files."""
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+from quart.wrappers.response import ResponseBody
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+from quart_motor.grid_file import GridFSBody
+
+__all__ = ["GridFSFileCache", "MappedFileBody"]
+
+logger = logging.getLogger(__name__)
+
+
+class MappedFileBody(ResponseBody):
+    """An async response body that serves a local file through ``mmap``.
+
+    The file is opened straight away, so that the body can still be sent
+    if the file is removed meanwhile; it is mapped into memory when the
+    response starts and sent ``buffer_size`` bytes at a time straight
+    from the page cache, without a read call or a thread per chunk. A
+    byte range may be set on the body, as for
+    :class:`~quart_motor.grid_file.GridFSBody`.
+    """
+
+    buffer_size = 256 * 1024
+
+    def __init__(self, path, size):
+        """__init__."""
+        self.path = path
+        self.size = size
+        self.begin = 0
+        self.end = size
+        self._file = open(path, "rb")
+        self._map = None
+        self._position = 0
+
+    async def __aenter__(self):
+        """__aenter__."""
+        self._position = self.begin
+        if self.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        """__aexit__."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __aiter__(self):
+        """__aiter__."""
+        return self
+
+    async def __anext__(self):
+        """Return the next part of the file, up to the range end."""
+        if self._position >= self.end:
+            raise StopAsyncIteration()
+        end = min(self._position + self.buffer_size, self.end)
+        data = self._map[self._position:end]
+        self._position = end
+        return data
+
+    async def make_conditional(self, begin, end):
+        """Restrict the body to the byte range ``[begin, end)``.
+
+        Returns the complete length of the file.
+        """
+        end = self.size if end is None else min(self.size, end)
+        if begin >= end or abs(begin) > self.size:
+            raise RequestedRangeNotSatisfiable()
+
+        self.begin = begin if begin >= 0 else self.size + begin
+        self.end = end
+        return self.size
+
+
+class _FileInfo(object):
+    """The attributes of a GridFS file that :meth:`Motor.send_file` uses."""
+
+    __slots__ = ("_id", "length", "upload_date", "md5", "content_type", "metadata")
+
+    def __init__(self, grid_out):
+        """__init__."""
+        for name in self.__slots__:
+            setattr(self, name, getattr(grid_out, name))
+
+
+class GridFSFileCache(object):
+    """Keep copies of popular GridFS files on local disk.
+
+    Passed as ``Motor(app, file_cache=...)`` (or ``file_cache=True`` for
+    the defaults), it makes :meth:`~quart_motor.Motor.send_file` read a
+    file's chunks from MongoDB only the first time the file is sent; the
+    copy is then served from disk through ``mmap`` (see
+    :class:`MappedFileBody`), until it is evicted to keep the cache under
+    ``max_size`` bytes, least recently used first.
+    .. code-block:: python
+        mongo = Motor(app, file_cache=GridFSFileCache(max_size=512 * 1024 * 1024))
+    Copies are keyed by the file's ``_id`` and md5 (or upload date), and
+    GridFS files never change, so a copy is never stale: a newer version of
+    a file is a new file, which is fetched when
+    :meth:`~quart_motor.Motor.send_file` first resolves the filename to
+    it, and the copies of older versions are dropped then. Resolving a
+    filename to its file is still a query of the files collection, unless
+    ``lookup_ttl`` is set, in which case it is remembered for that many
+    seconds, so that a new version may take that long to be served.
+    Each process has a cache directory of its own, under ``directory``
+    (the system's temporary directory by default), which is removed when
+    the app stops serving.
+    :param str directory: where to create the cache directory
+    :param int max_size: the most bytes kept on disk
+    :param int max_file_size: larger files are streamed from GridFS and
+       not cached
+    :param float lookup_ttl: seconds to remember which file a filename
+       resolves to, or ``0`` to look it up for every request
+    """
+
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024,
+                 max_file_size=16 * 1024 * 1024, lookup_ttl=0):
+        """__init__."""
+        self.directory = directory
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.lookup_ttl = lookup_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._path = None
+        # key: (path, size, (base, filename))
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lookups = {}
+
+    @property
+    def stats(self):
+        """Return the number of files and bytes cached, hits, misses and evictions."""
+        return {
+            "files": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def lookup(self, base, filename, version):
+        """Return the remembered file ``filename`` resolves to, if any."""
+        if not self.lookup_ttl:
+            return None
+        found = self._lookups.get((base, filename, version))
+        if found is None or found[0] <= time.monotonic():
+            return None
+        return found[1]
+
+    def remember(self, base, filename, version, grid_out):
+        """Remember the file ``filename`` resolved to.
+
+        If it resolved to the latest version, copies of older versions
+        are dropped.
+        """
+        if self.lookup_ttl:
+            self._lookups[(base, filename, version)] = (
+                time.monotonic() + self.lookup_ttl, _FileInfo(grid_out),
+            )
+        if version == -1:
+            current = self._key(grid_out)
+            for key, (_, _, name) in list(self._entries.items()):
+                if name == (base, filename) and key != current:
+                    self._evict(key)
+
+    def invalidate(self, base, filename):
+        """Forget which file ``filename`` resolves to, e.g. after a new upload."""
+        for key in [key for key in self._lookups if key[:2] == (base, filename)]:
+            del self._lookups[key]
+
+    async def body(self, base, filename, fileobj, storage):
+        """Return a response body for ``fileobj``, caching it first if needed.
+
+        :param fileobj: the opened :class:`~motor.motor_asyncio.AsyncIOMotorGridOut`,
+           or the file as returned by :meth:`lookup`
+        :param storage: the :class:`~motor.motor_asyncio.AsyncIOMotorGridFSBucket`
+           to fetch the file from
+        """
+        if fileobj.length > self.max_file_size:
+            return GridFSBody(await self._open(fileobj, storage))
+
+        key = self._key(fileobj)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return MappedFileBody(entry[0], entry[1])
+
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            # requests for the same file while it is fetched wait for it
+            pending = self._pending[key] = asyncio.ensure_future(
+                self._fetch(key, (base, filename), fileobj, storage),
+            )
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        path = await asyncio.shield(pending)
+        return MappedFileBody(path, fileobj.length)
+
+    async def _open(self, fileobj, storage):
+        if isinstance(fileobj, _FileInfo):
+            return await storage.open_download_stream(fileobj._id)
+        return fileobj
+
+    async def _fetch(self, key, name, fileobj, storage):
+        grid_out = await self._open(fileobj, storage)
+        if self._path is None:
+            self._path = tempfile.mkdtemp(prefix="quart-motor-", dir=self.directory)
+        path = os.path.join(self._path, hashlib.sha1(repr(key).encode()).hexdigest())
+        partial = path + ".part"
+        # file writes can block, so they run in the default executor
+        loop = asyncio.get_running_loop()
+        f = await loop.run_in_executor(None, open, partial, "wb")
+        try:
+            grid_out.seek(0)
+            written = 0
+            while written < grid_out.length:
+                chunk = await grid_out.readchunk()
+                if not chunk:
+                    break
+                written += await loop.run_in_executor(None, f.write, chunk)
+            await loop.run_in_executor(None, _finish, f, partial, path)
+        except BaseException:
+            await loop.run_in_executor(None, _abandon, f, partial)
+            raise
+
+        self._entries[key] = (path, grid_out.length, name)
+        self.size += grid_out.length
+        while self.size > self.max_size and len(self._entries) > 1:
+            self._evict(next(iter(self._entries)))
+        return path
+
+    def _evict(self, key):
+        path, size, _ = self._entries.pop(key)
+        self.size -= size
+        self.evictions += 1
+        # responses still sending the file keep their mapping of it
+        try:
+            os.remove(path)
+        except OSError as exc:
+            logger.warning("can't remove cached GridFS file %s: %s", path, exc)
+
+    def _key(self, fileobj):
+        return (fileobj._id, fileobj.md5 or fileobj.upload_date)
+
+    def discard(self):
+        """Forget the cached files without removing them.
+
+        For a process forked from the one that cached them, which removes
+        them itself; this one caches files in a directory of its own.
+        """
+        self._entries.clear()
+        self._pending.clear()
+        self._lookups.clear()
+        self.size = 0
+        self._path = None
+
+    def close(self):
+        """Remove the cached files."""
+        self._entries.clear()
+        self._lookups.clear()
+        self.size = 0
+        if self._path is not None:
+            shutil.rmtree(self._path, ignore_errors=True)
+            self._path = None
+
+
+def _finish(f, partial, path):
+    f.close()
+    os.replace(partial, path)
+
+
+def _abandon(f, partial):
+    f.close()
+    if os.path.exists(partial):
+        os.remove(partial)
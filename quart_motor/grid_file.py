@@ -0,0 +1,99 @@
+"""GridFS helpers."""
+import inspect
+
+from quart.wrappers.response import ResponseBody
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+__all__ = ["GridFSBody", "iter_chunks"]
+
+
+class GridFSBody(ResponseBody):
+    """An async response body that streams a GridFS file chunk by chunk.
+
+    Wraps an opened :class:`~motor.motor_asyncio.AsyncIOMotorGridOut` so
+    that Quart can send it without buffering the file in memory. A byte
+    range may be set on the body (Quart does so from
+    :meth:`~quart.wrappers.Response.make_conditional`), in which case
+    streaming starts at the GridFS chunk containing the first requested
+    byte rather than at the start of the file.
+    """
+
+    def __init__(self, grid_out):
+        """__init__."""
+        self.grid_out = grid_out
+        self.size = grid_out.length
+        self.begin = 0
+        self.end = self.size
+
+    async def __aenter__(self):
+        """__aenter__."""
+        self.grid_out.seek(self.begin)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        """__aexit__."""
+        self.grid_out.close()
+
+    def __aiter__(self):
+        """__aiter__."""
+        return self
+
+    async def __anext__(self):
+        """Return the next chunk of the file, trimmed to the range end."""
+        current = self.grid_out.tell()
+        if current >= self.end:
+            raise StopAsyncIteration()
+
+        chunk = await self.grid_out.readchunk()
+        if not chunk:
+            raise StopAsyncIteration()
+        return chunk[:self.end - current]
+
+    async def make_conditional(self, begin, end):
+        """Restrict the body to the byte range ``[begin, end)``.
+
+        Returns the complete length of the file.
+        """
+        end = self.size if end is None else min(self.size, end)
+        if begin >= end or abs(begin) > self.size:
+            raise RequestedRangeNotSatisfiable()
+
+        # suffix ranges ("bytes=-500") arrive with a negative begin
+        self.begin = begin if begin >= 0 else self.size + begin
+        self.end = end
+        return self.size
+
+
+async def iter_chunks(fileobj, chunk_size):
+    """Iterate asynchronously over the data in ``fileobj``.
+
+    ``fileobj`` may be :class:`bytes`, an object with a ``read()`` method
+    (sync or async, such as a :class:`~quart.datastructures.FileStorage`),
+    an async iterable of :class:`bytes` (such as ``request.body``) or a
+    plain iterable of :class:`bytes`. File-like objects are read
+    ``chunk_size`` bytes at a time, so that no more than one chunk is
+    held in memory; iterables are passed through as they are produced.
+    """
+    if isinstance(fileobj, (bytes, bytearray)):
+        if fileobj:
+            yield bytes(fileobj)
+    elif hasattr(fileobj, "read") and callable(fileobj.read):
+        while True:
+            data = fileobj.read(chunk_size)
+            if inspect.isawaitable(data):
+                data = await data
+            if not data:
+                break
+            yield data
+    elif hasattr(fileobj, "__aiter__"):
+        async for data in fileobj:
+            if data:
+                yield data
+    elif hasattr(fileobj, "__iter__") and not isinstance(fileobj, str):
+        for data in fileobj:
+            if data:
+                yield data
+    else:
+        raise TypeError(
+            "'fileobj' must be bytes, have a read() method or be iterable"
+        )
@@ -1,14 +1,31 @@
 """Helpers."""
+import datetime
+import re
+import uuid
+from functools import partial
+
+import bson
 from bson import json_util, SON
+from bson.dbref import DBRef
+from bson.decimal128 import Decimal128
 from bson.errors import InvalidId
+from bson.json_util import DatetimeRepresentation
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
 from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from bson.regex import Regex
+from bson.timestamp import Timestamp
 from quart import abort, Quart
 from quart.json import provider as quart_json_provider
-from six import iteritems, string_types
 from werkzeug.routing import BaseConverter
 import pymongo
 
-__all__ = ["BSONObjectIdConverter", "JSONEncoder"]
+# imported by FastJSONEncoder on first use, as it is slow to import;
+# False once the import failed
+orjson = None
+
+__all__ = ["BSONObjectIdConverter", "JSONEncoder", "FastJSONEncoder"]
 
 
 if pymongo.version_tuple >= (3, 5, 0):
@@ -27,6 +44,30 @@ def _iteritems(obj):
         raise TypeError("{!r} missing iteritems() and items()".format(obj))
 
 
+_EPOCH_NAIVE = datetime.datetime(1970, 1, 1)
+
+
+def _datetime_converter(bson_default, json_options):
+    """Build a fast converter for naive UTC datetimes, as stored by PyMongo.
+
+    Produces exactly what :func:`bson.json_util.default` does for ISO-8601
+    dates after the epoch and defers to it for everything else.
+    """
+    if (json_options is None
+            or json_options.datetime_representation != DatetimeRepresentation.ISO8601):
+        return bson_default
+
+    def convert(obj):
+        if obj.tzinfo is not None or obj < _EPOCH_NAIVE:
+            return bson_default(obj)
+        millis = obj.microsecond // 1000
+        if millis:
+            return {"$date": "%s.%03dZ" % (obj.isoformat("T", "seconds"), millis)}
+        return {"$date": obj.isoformat("T", "seconds") + "Z"}
+
+    return convert
+
+
 class BSONObjectIdConverter(BaseConverter):
     """A simple converter for the RESTful URL routing system of Quart.
 
@@ -94,6 +135,26 @@ class JSONEncoder(quart_json_provider.DefaultJSONProvider):
         else:
             self._default_kwargs = {}
 
+        # BSON leaf types are looked up by exact type, skipping the
+        # mapping/iterable probing below; all of them end up in
+        # json_util.default anyway
+        bson_default = partial(json_util.default, **self._default_kwargs)
+        self._converters = {
+            ObjectId: lambda obj: {"$oid": str(obj)},
+            Decimal128: lambda obj: {"$numberDecimal": str(obj)},
+            datetime.datetime: _datetime_converter(bson_default, json_options),
+            DBRef: bson_default,
+            MaxKey: bson_default,
+            MinKey: bson_default,
+            Regex: bson_default,
+            Timestamp: bson_default,
+            uuid.UUID: bson_default,
+            type(re.compile("")): bson_default,
+            # decoding the raw bytes in one go is much cheaper than walking
+            # the lazily inflated mapping
+            RawBSONDocument: lambda obj: bson.decode(obj.raw),
+        }
+
         super(JSONEncoder, self).__init__(app=app, *args, **kwargs)
 
     def default(self, obj):
@@ -103,9 +164,13 @@ class JSONEncoder(quart_json_provider.DefaultJSONProvider):
         This may raise ``TypeError`` for object types not recognized.
         .. version-added:: 2.4.0
         """
+        converter = self._converters.get(type(obj))
+        if converter is not None:
+            return converter(obj)
+
         if hasattr(obj, "iteritems") or hasattr(obj, "items"):
-            return SON((k, self.default(v)) for k, v in iteritems(obj))
-        elif hasattr(obj, "__iter__") and not isinstance(obj, string_types):
+            return SON((k, self.default(v)) for k, v in _iteritems(obj))
+        elif hasattr(obj, "__iter__") and not isinstance(obj, str):
             return [self.default(v) for v in obj]
         else:
             try:
@@ -115,3 +180,109 @@ class JSONEncoder(quart_json_provider.DefaultJSONProvider):
                 # the Flask default JSONEncoder won't; so we return the
                 # object itself and let stdlib json handle it if possible
                 return obj
+
+
+# numbers orjson may format differently from float.__repr__: anything with
+# an exponent, and small values written out as 0.0000...
+_FLOAT_HINT = re.compile(rb"\de|0\.0000")
+_FLOAT_NUMBER = re.compile(rb"-?\d+(?:\.\d+)?e-?\d+|-?\d+\.\d+")
+_FLOAT_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|' + _FLOAT_NUMBER.pattern)
+# a string as orjson writes a uuid.UUID
+_UUID_STRING = re.compile(rb'"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"')
+# what json escapes with ensure_ascii, DEL included, and orjson doesn't
+_NON_ASCII = re.compile("[^\x00-\x7e]")
+
+
+def _repr_float(match):
+    token = match.group(0)
+    if token[:1] == b'"':
+        return token
+    return repr(float(token)).encode()
+
+
+def _fix_floats(data):
+    """Rewrite the floats in orjson output the way float.__repr__ does."""
+    if b'\\"' in data:
+        # escaped quotes: fall back to a tokenizer that skips strings
+        return _FLOAT_TOKEN.sub(_repr_float, data)
+
+    # without escaped quotes, every other part lies outside a string
+    parts = data.split(b'"')
+    if not _FLOAT_HINT.search(b"".join(parts[::2])):
+        return data
+    for i in range(0, len(parts), 2):
+        if _FLOAT_HINT.search(parts[i]):
+            parts[i] = _FLOAT_NUMBER.sub(_repr_float, parts[i])
+    return b'"'.join(parts)
+
+
+def _import_orjson():
+    """Import :mod:`orjson`, once; return whether it is installed."""
+    global orjson
+    if orjson is None:
+        try:
+            import orjson
+        except ImportError:
+            orjson = False
+    return orjson is not False
+
+
+def _escape_non_ascii(match):
+    n = ord(match.group(0))
+    if n < 0x10000:
+        return "\\u{0:04x}".format(n)
+    n -= 0x10000
+    return "\\u{0:04x}\\u{1:04x}".format(0xd800 | (n >> 10), 0xdc00 | (n & 0x3ff))
+
+
+class FastJSONEncoder(JSONEncoder):
+    """A :class:`JSONEncoder` that serializes with :mod:`orjson` when installed.
+
+    :mod:`orjson` walks documents natively and only calls back into
+    :meth:`~JSONEncoder.default` for BSON types, which are converted through
+    the same type-dispatch table as :class:`JSONEncoder`. The result is
+    post-processed so that the output is byte-for-byte the same as
+    :class:`JSONEncoder` (float formatting, ``ensure_ascii`` escaping).
+    The one exception is ``NaN`` and ``Infinity``, which :mod:`orjson`
+    writes as ``null``.
+    Calls that :mod:`orjson` can't reproduce (custom separators or
+    indentation, non-string keys, integers over 64 bits, :class:`uuid.UUID`
+    values, which orjson would write itself, etc.) and all
+    calls when :mod:`orjson` isn't installed use :class:`JSONEncoder`.
+    Enable it with ``Motor(app, fast_json=True)``.
+    """
+
+    def dumps(self, obj, **kwargs):
+        """Serialize ``obj`` to a JSON string."""
+        option = self._orjson_option(kwargs)
+        if option is not None:
+            try:
+                data = orjson.dumps(obj, default=self.default, option=option)
+            except orjson.JSONEncodeError:
+                pass
+            else:
+                # orjson writes UUIDs itself, bypassing default(); anything
+                # that may have been one is encoded again the slow way
+                if not _UUID_STRING.search(data):
+                    return self._from_orjson(data)
+
+        return super(FastJSONEncoder, self).dumps(obj, **kwargs)
+
+    def _orjson_option(self, kwargs):
+        if not _import_orjson():
+            return None
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs == {"separators": (",", ":")}:
+            return option
+        if kwargs == {"indent": 2}:
+            return option | orjson.OPT_INDENT_2
+        return None
+
+    def _from_orjson(self, data):
+        text = _fix_floats(data).decode()
+        if self.ensure_ascii and (not text.isascii() or "\x7f" in text):
+            text = _NON_ASCII.sub(_escape_non_ascii, text)
+        return text
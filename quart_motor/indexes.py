@@ -0,0 +1,263 @@
+"""Declared indexes and an index advisor."""
+import asyncio
+import contextvars
+import logging
+import threading
+
+import pymongo
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from quart_motor.monitoring import redact
+
+__all__ = ["IndexAdvisor", "IndexManager", "suggest_index"]
+
+logger = logging.getLogger(__name__)
+
+# commands whose query plan can be explained without running them
+_EXPLAINABLE = frozenset(("find", "aggregate", "count", "distinct", "findAndModify"))
+
+# command fields that explain doesn't accept, or that are the driver's
+_DRIVER_FIELDS = frozenset((
+    "lsid", "$clusterTime", "$db", "$readPreference", "txnNumber",
+    "autocommit", "startTransaction", "readConcern", "writeConcern",
+    "maxTimeMS", "comment",
+))
+
+# stages of a query plan worth reporting
+_PROBLEMS = {
+    "COLLSCAN": "collection scan",
+    "SORT": "in-memory sort",
+}
+
+
+class IndexManager(object):
+    """Create the indexes declared for the collections of a database.
+
+    Used through :meth:`~quart_motor.Motor.index`, which declares the
+    indexes, and :meth:`~quart_motor.Motor.index_status`, which reports on
+    their creation when the app starts serving.
+    """
+
+    def __init__(self):
+        """__init__."""
+        self._indexes = {}
+        self._status = {}
+
+    def declare(self, collection_name, keys, **kwargs):
+        """Declare an index, as for :class:`~pymongo.operations.IndexModel`."""
+        model = pymongo.IndexModel(keys, **kwargs)
+        self._indexes.setdefault(collection_name, []).append(model)
+        self._status[collection_name] = {"state": "pending", "indexes": [], "error": None}
+        return model.document["name"]
+
+    async def ensure(self, db):
+        """Create the declared indexes of all collections of ``db`` concurrently.
+
+        Indexes that exist already are left as they are. Failures are
+        logged and reported by :meth:`status` rather than raised.
+        """
+        await asyncio.gather(*(
+            self._ensure(db[collection_name], models)
+            for collection_name, models in self._indexes.items()
+        ))
+
+    async def _ensure(self, collection, models):
+        status = self._status[collection.name]
+        status["state"] = "building"
+        try:
+            status["indexes"] = await collection.create_indexes(models)
+        except PyMongoError as exc:
+            logger.error("creating the indexes of %s failed: %s", collection.full_name, exc)
+            status.update(state="failed", error=str(exc))
+        else:
+            status["state"] = "ready"
+
+    def status(self):
+        """Return the state of the declared indexes of each collection.
+
+        ``state`` is ``"pending"``, ``"building"``, ``"ready"`` or
+        ``"failed"``, in which case ``error`` says why; ``indexes`` has
+        the names of the indexes once they are ready.
+        """
+        return {name: dict(status) for name, status in self._status.items()}
+
+
+def suggest_index(filter, sort=None):
+    """Suggest index keys for a query, following the equality, sort, range rule.
+
+    Fields compared for equality come first, then the sort fields, then
+    the fields queried by range; returns ``None`` if there is nothing to
+    index.
+    :param dict filter: the query filter
+    :param sort: the sort, as a mapping or a list of ``(key, direction)``
+    """
+    equality, ranges = [], []
+    for field, condition in (filter or {}).items():
+        if field.startswith("$"):
+            # $or, $and, $expr...: beyond a simple suggestion
+            continue
+        operators = set(condition) if isinstance(condition, dict) else set()
+        if operators and all(op.startswith("$") for op in operators):
+            if operators <= {"$eq", "$in"}:
+                equality.append(field)
+            else:
+                ranges.append(field)
+        else:
+            equality.append(field)
+
+    keys = [(field, pymongo.ASCENDING) for field in equality]
+    sort = list(sort.items()) if hasattr(sort, "items") else list(sort or [])
+    for field, direction in sort:
+        if field not in equality:
+            keys.append((field, direction))
+    for field in ranges:
+        if all(field != key for key, _ in keys):
+            keys.append((field, pymongo.ASCENDING))
+    return keys or None
+
+
+def _query(command_name, command):
+    """Return the filter and sort of a command."""
+    if command_name == "find":
+        return command.get("filter"), command.get("sort")
+    if command_name == "aggregate":
+        match = sort = None
+        for stage in command.get("pipeline", []):
+            if "$match" in stage and match is None and sort is None:
+                match = stage["$match"]
+            elif "$sort" in stage and sort is None:
+                sort = stage["$sort"]
+            else:
+                break
+        return match, sort
+    return command.get("query"), command.get("sort")
+
+
+def _plan_stages(explain):
+    """Yield the stage names anywhere in an explain result."""
+    if isinstance(explain, dict):
+        stage = explain.get("stage")
+        if isinstance(stage, str):
+            yield stage
+        for value in explain.values():
+            yield from _plan_stages(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from _plan_stages(value)
+
+
+class IndexAdvisor(monitoring.CommandListener):
+    """Explain the queries an app issues and report those needing an index.
+
+    Meant for development: passed as ``Motor(app, index_advisor=...)``
+    (or ``index_advisor=True``), it is registered on the client and sees
+    every command. The first time a query of a new shape (its fields and
+    operators, without the values) is issued, its plan is explained, and
+    queries whose plan scans the whole collection or sorts in memory are
+    logged to the ``quart_motor.indexes`` logger with a suggested index,
+    and reported by :meth:`report`.
+    .. code-block:: python
+        mongo = Motor(app, index_advisor=app.debug)
+        @app.route("/dev/indexes")
+        async def index_advice():
+            return {"queries": mongo.index_advisor.report()}
+    :param int max_shapes: the most query shapes remembered and explained
+    """
+
+    def __init__(self, max_shapes=1000):
+        """__init__."""
+        self.max_shapes = max_shapes
+        self._client = None
+        self._loop = None
+        self._shapes = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def start(self, client):
+        """Start explaining the queries of ``client``, on the running event loop."""
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+
+    def close(self):
+        """Stop explaining queries."""
+        self._client = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    def started(self, event):
+        """Explain a query of a new shape."""
+        if event.command_name not in _EXPLAINABLE or self._client is None:
+            return
+        command = {
+            key: value for key, value in event.command.items()
+            if key not in _DRIVER_FIELDS
+        }
+        collection_name = command[event.command_name]
+        key = (event.database_name, collection_name, repr(redact(command)))
+        with self._lock:
+            shape = self._shapes.get(key)
+            if shape is not None:
+                shape["count"] += 1
+                return
+            if len(self._shapes) >= self.max_shapes:
+                return
+            filter, sort = _query(event.command_name, command)
+            shape = self._shapes[key] = {
+                "namespace": "%s.%s" % (event.database_name, collection_name),
+                "command": event.command_name,
+                "shape": redact(command),
+                "count": 1,
+                "problems": None,
+                "suggested_index": suggest_index(filter, sort),
+            }
+        # listeners run in Motor's threads; explain on the event loop, outside
+        # the context (and deadline) of the request that issued the query
+        self._loop.call_soon_threadsafe(
+            self._explain_soon, event.database_name, command, shape,
+            context=contextvars.Context(),
+        )
+
+    def succeeded(self, event):
+        """succeeded."""
+
+    def failed(self, event):
+        """failed."""
+
+    def _explain_soon(self, database_name, command, shape):
+        if self._client is None:
+            return
+        task = asyncio.ensure_future(self._explain(database_name, command, shape))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, database_name, command, shape):
+        try:
+            explain = await self._client[database_name].command(
+                {"explain": command, "verbosity": "queryPlanner"},
+            )
+        except PyMongoError as exc:
+            logger.debug("can't explain %s on %s: %s", shape["command"], shape["namespace"], exc)
+            return
+        stages = set(_plan_stages(explain))
+        problems = [description for stage, description in _PROBLEMS.items() if stage in stages]
+        with self._lock:
+            shape["problems"] = problems
+        if problems:
+            logger.warning(
+                "%s on %s: %s %r; consider an index on %s",
+                " and ".join(problems), shape["namespace"], shape["command"],
+                shape["shape"], shape["suggested_index"],
+            )
+
+    def report(self):
+        """Return the explained queries with problems, most frequent first.
+
+        Each has the ``namespace``, ``command`` and ``shape`` of the query,
+        how many times it was issued (``count``), the ``problems`` of its
+        plan, and a ``suggested_index`` (a list of ``(key, direction)``)
+        where one can be derived from the query.
+        """
+        with self._lock:
+            shapes = [dict(shape) for shape in self._shapes.values() if shape["problems"]]
+        return sorted(shapes, key=lambda shape: -shape["count"])
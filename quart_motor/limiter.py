@@ -0,0 +1,167 @@
+"""Admission control for database operations."""
+import asyncio
+import time
+from collections import deque
+
+from quart import abort
+
+__all__ = ["ConcurrencyLimiter"]
+
+
+class _Gate(object):
+    """A semaphore with a bounded, observable queue of waiters."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._waiters = deque()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    async def acquire(self, max_queue, timeout):
+        """Take a slot; return ``False`` if the queue is full or the wait times out."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= max_queue:
+            self.shed += 1
+            return False
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            if waiter.cancelled() or not waiter.done():
+                self.shed += 1
+                return False
+            # the slot was handed over just as we timed out
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as we were cancelled
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waited = time.monotonic() - start
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        self.admitted += 1
+        return True
+
+    def release(self):
+        # hand the slot straight to the next waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def discard(self):
+        self.in_flight = 0
+        self._waiters.clear()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_time": self.wait_time,
+            "max_wait_time": self.max_wait_time,
+        }
+
+
+class ConcurrencyLimiter(object):
+    """Cap the number of database operations in flight.
+
+    Passed as ``Motor(app, limiter=...)``, it admits at most
+    ``max_concurrent`` operations of the client at a time, and at most the
+    number given in ``per_collection`` on those collections. Operations
+    beyond that wait in a queue of at most ``max_queue`` for up to
+    ``timeout`` seconds; when the queue is full, or the wait times out,
+    the operation fails straight away with :func:`~quart.abort`
+    (``503 Service Unavailable`` by default), instead of piling up in the
+    driver's connection pool while the server is slow.
+    .. code-block:: python
+        limiter = ConcurrencyLimiter(
+            max_concurrent=50, max_queue=200, timeout=0.5,
+            per_collection={"reports": 5},
+        )
+        mongo = Motor(app, limiter=limiter)
+        @app.route("/metrics/admission")
+        async def admission_metrics():
+            return limiter.stats()
+    Coroutine methods of collections (``find_one``, ``insert_one``,
+    ``aggregate`` and so on) and each batch fetched by ``find`` cursors
+    are admitted; change streams, which are long-lived, are not.
+    :param int max_concurrent: the most operations in flight
+    :param int max_queue: the most operations waiting for a slot
+    :param float timeout: the longest an operation waits for a slot
+    :param dict per_collection: lower limits for some collections, by name
+    :param int status: the HTTP status to abort with when shedding load
+    """
+
+    def __init__(self, max_concurrent=100, max_queue=100, timeout=1.0,
+                 per_collection=None, status=503):
+        """__init__."""
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.status = status
+        self._gate = _Gate(max_concurrent)
+        self._collections = {
+            name: _Gate(limit) for name, limit in (per_collection or {}).items()
+        }
+
+    async def run(self, collection_name, method, *args, **kwargs):
+        """Await ``method(*args, **kwargs)`` once admitted, or abort."""
+        gates = [self._gate]
+        collection_gate = self._collections.get(collection_name)
+        if collection_gate is not None:
+            # take the scarcer slot first, so as not to hold a global one
+            # while queuing for it
+            gates.insert(0, collection_gate)
+
+        acquired = []
+        try:
+            for gate in gates:
+                if not await gate.acquire(self.max_queue, self.timeout):
+                    abort(self.status)
+                acquired.append(gate)
+            return await method(*args, **kwargs)
+        finally:
+            for gate in acquired:
+                gate.release()
+
+    def discard(self):
+        """Forget the operations in flight and queued.
+
+        For a process forked from the one running them, which would
+        otherwise count them against its own limits forever.
+        """
+        self._gate.discard()
+        for gate in self._collections.values():
+            gate.discard()
+
+    def stats(self):
+        """Return the limits, in-flight and queued operations, and wait times.
+
+        ``"*"`` has the stats of the client-wide limit; collections with a
+        limit of their own have theirs under their names. ``shed`` counts
+        the operations that were refused, and wait times are in seconds.
+        """
+        stats = {"*": self._gate.stats()}
+        for name, gate in self._collections.items():
+            stats[name] = gate.stats()
+        return stats
@@ -0,0 +1,146 @@
+"""Batched document loading."""
+import asyncio
+from collections.abc import Mapping
+
+from quart import abort
+
+__all__ = ["DocumentLoader"]
+
+
+class DocumentLoader(object):
+    """Coalesce concurrent single-document lookups into one query.
+
+    Every :meth:`load` issued before the event loop gets round to the
+    next callback is collected, de-duplicated and fetched with a single
+    ``find({key: {"$in": [...]}})``; each caller then receives its own
+    document (or ``None``). Loaded documents are remembered, so that the
+    same key is fetched at most once for the lifetime of the loader.
+    .. code-block:: python
+        @app.route("/orders/<ObjectId:order_id>")
+        async def show_order(order_id):
+            order = await mongo.db.orders.find_one_or_404(order_id)
+            users = mongo.db.users.loader()
+            order["items"] = await asyncio.gather(
+                *(users.load(item["seller_id"]) for item in order["items"])
+            )
+            return order
+    Use :meth:`~quart_motor.wrappers.AsyncIOMotorCollection.loader` to get
+    a loader that is shared by everything handling the current request.
+    :param collection: the :class:`~quart_motor.wrappers.AsyncIOMotorCollection`
+       to load from
+    :param str key: the (unique) field to look documents up by; it may be
+       dotted, and if it holds an array, a document is found by each of
+       the array's elements, as MongoDB matches it
+    :param projection: the projection passed to ``find``; it must include
+       ``key``
+    :param bool cache: if ``False``, forget documents once they have been
+       delivered, so that only concurrent lookups are shared
+    :param int max_batch_size: the most keys sent in one ``$in`` query;
+       larger batches are split into several concurrent queries
+    """
+
+    def __init__(self, collection, key="_id", projection=None, cache=True,
+                 max_batch_size=1000):
+        """__init__."""
+        self.collection = collection
+        self.key = key
+        self.projection = projection
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self._futures = {}
+        self._pending = {}
+
+    def load(self, key):
+        """Load the document whose ``key`` field equals ``key``.
+
+        Returns an awaitable resolving to the document, or ``None`` if no
+        document matches.
+        """
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[key] = future
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            self._pending[key] = future
+        # one caller being cancelled must not cancel the shared lookup
+        return asyncio.shield(future)
+
+    async def load_or_404(self, key):
+        """Load a document like :meth:`load`, or raise a 404 if there is none."""
+        document = await self.load(key)
+        if document is None:
+            abort(404)
+        return document
+
+    async def load_many(self, keys):
+        """Load several documents; returns a list in the order of ``keys``."""
+        return await asyncio.gather(*(self.load(key) for key in keys))
+
+    def clear(self, key=None):
+        """Forget the document loaded for ``key``, or all documents."""
+        if key is None:
+            self._futures = {
+                k: f for k, f in self._futures.items() if k in self._pending
+            }
+        elif key not in self._pending:
+            self._futures.pop(key, None)
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = {k: pending[k] for k in keys[start:start + self.max_batch_size]}
+            asyncio.ensure_future(self._fetch(batch))
+
+    async def _fetch(self, batch):
+        try:
+            found = {}
+            cursor = self.collection.find(
+                {self.key: {"$in": list(batch)}}, self.projection,
+            )
+            path = self.key.split(".")
+            async for document in cursor:
+                for value in _values(document, path):
+                    try:
+                        if value in batch:
+                            found.setdefault(value, document)
+                    except TypeError:
+                        # unhashable, e.g. an embedded document, so not a key
+                        pass
+        except Exception as exc:
+            for key, future in batch.items():
+                # failed lookups are retried by the next load()
+                self._futures.pop(key, None)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for key, future in batch.items():
+            if not self.cache:
+                self._futures.pop(key, None)
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+def _values(value, path):
+    """Yield the values at ``path`` that a query on it can match.
+
+    As in MongoDB queries, arrays along the path are traversed, and an
+    array at its end yields its elements.
+    """
+    if not path:
+        if isinstance(value, list):
+            yield from value
+        else:
+            yield value
+    elif isinstance(value, Mapping):
+        if path[0] in value:
+            yield from _values(value[path[0]], path[1:])
+    elif isinstance(value, list):
+        if path[0].isdigit() and int(path[0]) < len(value):
+            yield from _values(value[int(path[0])], path[1:])
+        for item in value:
+            if isinstance(item, Mapping):
+                yield from _values(item, path)
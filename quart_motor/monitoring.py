@@ -0,0 +1,228 @@
+"""Command monitoring."""
+import bisect
+import contextvars
+import logging
+import threading
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo import monitoring
+
+__all__ = [
+    "CommandInstrumentation",
+    "HistogramSink",
+    "RequestStats",
+    "current_request_stats",
+]
+
+logger = logging.getLogger(__name__)
+
+# Motor runs PyMongo in a thread pool, but copies the calling task's
+# context into it, so listeners see the stats of the request that issued
+# the command.
+_request_stats = contextvars.ContextVar("quart_motor_request_stats", default=None)
+
+# command fields that say nothing about the query's shape
+_IGNORED_FIELDS = frozenset((
+    "lsid", "$clusterTime", "$db", "$readPreference", "txnNumber",
+    "autocommit", "startTransaction", "readConcern", "writeConcern",
+))
+
+
+def redact(value):
+    """Return the shape of a command: its field names, with values replaced by ``"?"``."""
+    if hasattr(value, "items"):
+        return {k: redact(v) for k, v in value.items() if k not in _IGNORED_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [redact(value[0])] if value else []
+    return "?"
+
+
+class RequestStats(object):
+    """The MongoDB commands issued while handling one request."""
+
+    def __init__(self):
+        """__init__."""
+        self.count = 0
+        self.failures = 0
+        self.duration = 0.0
+        self.documents = 0
+        self.reply_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, duration, documents, reply_bytes, failed):
+        """Record one command taking ``duration`` seconds."""
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.documents += documents
+            self.reply_bytes += reply_bytes
+            if failed:
+                self.failures += 1
+
+    def server_timing(self, name="mongodb"):
+        """Format the stats as a ``Server-Timing`` header metric."""
+        return '%s;dur=%.3f;desc="%d commands, %d documents, %d bytes"' % (
+            name, self.duration * 1000, self.count, self.documents, self.reply_bytes,
+        )
+
+
+class HistogramSink(object):
+    """Aggregate command durations per ``(collection, command)`` in memory.
+
+    A :class:`CommandInstrumentation` metrics sink is any object with an
+    ``observe(collection, command_name, duration, documents, reply_bytes, failed)``
+    method; this one keeps counts in fixed latency buckets, for
+    :meth:`snapshot` to report, e.g. from a metrics endpoint.
+    :param buckets: upper bounds of the latency buckets, in milliseconds
+    """
+
+    def __init__(self, buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)):
+        """__init__."""
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, collection, command_name, duration, documents, reply_bytes, failed):
+        """Record one command."""
+        index = bisect.bisect_left(self.buckets, duration * 1000)
+        with self._lock:
+            series = self._series.get((collection, command_name))
+            if series is None:
+                series = self._series[(collection, command_name)] = {
+                    "count": 0, "failures": 0, "duration": 0.0, "documents": 0,
+                    "reply_bytes": 0, "buckets": [0] * (len(self.buckets) + 1),
+                }
+            series["count"] += 1
+            series["duration"] += duration
+            series["documents"] += documents
+            series["reply_bytes"] += reply_bytes
+            series["buckets"][index] += 1
+            if failed:
+                series["failures"] += 1
+
+    def snapshot(self):
+        """Return the aggregated stats, keyed by ``"collection.command"``.
+
+        Bucket counts are not cumulative; the last bucket counts commands
+        slower than the largest bound.
+        """
+        with self._lock:
+            return {
+                "%s.%s" % key: dict(series, buckets=list(series["buckets"]))
+                for key, series in self._series.items()
+            }
+
+
+class CommandInstrumentation(monitoring.CommandListener):
+    """Measure the MongoDB commands issued by each request.
+
+    Registered by :class:`~quart_motor.Motor` on the client it creates
+    when passed as ``Motor(app, instrumentation=...)`` (or
+    ``instrumentation=True`` for the defaults). Command durations, counts,
+    returned documents and reply sizes are attributed to the request that
+    issued them and reported in a ``Server-Timing`` response header; commands
+    slower than ``slow_ms`` are logged to the ``quart_motor.monitoring``
+    logger with their redacted shape; and every command is passed to the
+    metrics ``sink``.
+    .. code-block:: python
+        metrics = HistogramSink()
+        mongo = Motor(app, instrumentation=CommandInstrumentation(
+            slow_ms=100, sink=metrics,
+        ))
+        @app.route("/metrics/mongodb")
+        async def mongodb_metrics():
+            return metrics.snapshot()
+    :param bool server_timing: add a ``Server-Timing`` header to responses
+    :param bool reply_sizes: measure the size of each reply in bytes; the
+       driver has decoded the reply by then, so it is encoded again, which
+       takes about half as long as decoding it did
+    :param float slow_ms: log commands taking at least this many
+       milliseconds, or ``None`` not to
+    :param sink: a metrics sink, such as a :class:`HistogramSink`, or
+       ``None``
+    """
+
+    def __init__(self, server_timing=True, slow_ms=None, sink=None, reply_sizes=True):
+        """__init__."""
+        self.server_timing = server_timing
+        self.reply_sizes = reply_sizes
+        self.slow_ms = slow_ms
+        self.sink = sink
+        self._started = {}
+
+    def started(self, event):
+        """Remember what a command is about until it finishes."""
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        else:
+            collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = None
+        key = (event.request_id, event.connection_id)
+        self._started[key] = (collection, command if self.slow_ms is not None else None)
+
+    def succeeded(self, event):
+        """Record a finished command."""
+        reply_bytes = _reply_bytes(event.reply) if self.reply_sizes else 0
+        self._finished(event, _returned_documents(event.reply), reply_bytes, False)
+
+    def failed(self, event):
+        """Record a failed command."""
+        self._finished(event, 0, 0, True)
+
+    def _finished(self, event, documents, reply_bytes, failed):
+        collection, command = self._started.pop(
+            (event.request_id, event.connection_id), (None, None),
+        )
+        duration = event.duration_micros / 1e6
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.add(duration, documents, reply_bytes, failed)
+        if self.sink is not None:
+            self.sink.observe(
+                collection, event.command_name, duration, documents, reply_bytes, failed,
+            )
+        if command is not None and duration * 1000 >= self.slow_ms:
+            logger.warning(
+                "slow MongoDB command: %s on %s.%s took %.1f ms: %r",
+                event.command_name, event.database_name, collection,
+                duration * 1000, redact(command),
+            )
+
+    async def before_request(self):
+        """Start collecting stats for the current request."""
+        _request_stats.set(RequestStats())
+
+    async def after_request(self, response):
+        """Add the request's stats to the response as a ``Server-Timing`` header."""
+        stats = _request_stats.get()
+        if self.server_timing and stats is not None and stats.count:
+            response.headers.add("Server-Timing", stats.server_timing())
+        return response
+
+
+def current_request_stats():
+    """Return the :class:`RequestStats` of the current request, if any."""
+    return _request_stats.get()
+
+
+def _returned_documents(reply):
+    cursor = reply.get("cursor")
+    if hasattr(cursor, "get"):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if batch is not None:
+            return len(batch)
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+def _reply_bytes(reply):
+    if isinstance(reply, RawBSONDocument):
+        return len(reply.raw)
+    try:
+        return len(bson.encode(reply))
+    except Exception:
+        return 0
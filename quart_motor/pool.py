@@ -0,0 +1,178 @@
+"""Connection pool sizing, warm-up and statistics."""
+import asyncio
+import logging
+import os
+import threading
+
+from pymongo import monitoring
+
+__all__ = ["PoolStats", "detect_workers", "max_pool_size", "warm_up"]
+
+logger = logging.getLogger(__name__)
+
+# connections a client opens to each server besides those of its pool: one
+# for the server monitor, and one measuring round-trip times
+MONITOR_CONNECTIONS = 2
+
+
+def detect_workers():
+    """Return the number of worker processes the app is served by, if known.
+
+    Reads the ``WEB_CONCURRENCY`` environment variable, which Gunicorn and
+    Uvicorn take their worker count from and which hosting platforms set.
+    Without it, a single worker is assumed, as Hypercorn and Quart run by
+    default; Hypercorn doesn't publish the count given to ``--workers``.
+    """
+    value = os.environ.get("WEB_CONCURRENCY")
+    if value:
+        try:
+            return max(1, int(value))
+        except ValueError:
+            logger.warning("ignoring WEB_CONCURRENCY=%r, which is not a number", value)
+    return 1
+
+
+def max_pool_size(budget, workers):
+    """Return the ``maxPoolSize`` that keeps ``workers`` processes within ``budget``.
+
+    ``budget`` is the most connections each server may receive from all
+    the workers together; the connections each client keeps open to
+    monitor a server count against it too. Never less than ``1``, so a
+    budget too small for the workers is exceeded rather than unusable.
+    :param int budget: the most connections to each server, in all
+    :param int workers: the number of worker processes
+    """
+    return max(1, budget // max(1, workers) - MONITOR_CONNECTIONS)
+
+
+async def warm_up(client, connections=None, timeout=10.0):
+    """Connect ``client`` before it serves its first request.
+
+    Pings the server, which selects it and opens the first connection,
+    then issues up to ``connections`` concurrent pings, so that the pool
+    opens that many connections at once rather than one at a time as
+    requests arrive. Returns ``False`` (after logging why) if this did
+    not finish within ``timeout`` seconds, ``True`` otherwise.
+    :param client: an :class:`~motor.motor_asyncio.AsyncIOMotorClient`
+    :param int connections: the number of connections to open; defaults to
+       the client's ``minPoolSize``
+    :param float timeout: seconds to wait for the server
+    """
+    if connections is None:
+        connections = client.options.pool_options.min_pool_size
+    admin = client.admin
+
+    async def _warm_up():
+        await admin.command("ping")
+        if connections > 1:
+            await asyncio.gather(*(admin.command("ping") for _ in range(connections)))
+
+    try:
+        await asyncio.wait_for(_warm_up(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("MongoDB connection pool warm-up timed out after %.1fs", timeout)
+        return False
+    except Exception as exc:
+        logger.warning("MongoDB connection pool warm-up failed: %s", exc)
+        return False
+    return True
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Track the state of the client's connection pools.
+
+    Registered by :class:`~quart_motor.Motor` on the client it creates
+    when passed as ``Motor(app, pool_stats=...)`` (or ``pool_stats=True``),
+    and available afterwards as ``mongo.pool_stats``.
+    .. code-block:: python
+        @app.route("/metrics/pool")
+        async def pool_metrics():
+            return mongo.pool_stats.snapshot()
+    """
+
+    def __init__(self):
+        """__init__."""
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Return the stats of each pool, keyed by ``"host:port"``.
+
+        ``open`` counts all connections, ``checked_out`` those in use,
+        ``available`` those idle in the pool and ``wait_queue`` the
+        operations waiting for a connection; checkout latencies are in
+        seconds.
+        """
+        with self._lock:
+            return {
+                "%s:%s" % address: dict(
+                    pool, available=pool["open"] - pool["checked_out"],
+                )
+                for address, pool in self._pools.items()
+            }
+
+    def _pool(self, address):
+        pool = self._pools.get(address)
+        if pool is None:
+            pool = self._pools[address] = {
+                "open": 0, "checked_out": 0, "wait_queue": 0,
+                "checkouts": 0, "checkout_failures": 0, "clears": 0,
+                "checkout_time": 0.0, "max_checkout_time": 0.0,
+            }
+        return pool
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for name, delta in deltas.items():
+                pool[name] += delta
+
+    def pool_created(self, event):
+        """pool_created."""
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        """pool_ready."""
+
+    def pool_cleared(self, event):
+        """pool_cleared."""
+        self._update(event.address, clears=1)
+
+    def pool_closed(self, event):
+        """pool_closed."""
+
+    def connection_created(self, event):
+        """connection_created."""
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        """connection_ready."""
+
+    def connection_closed(self, event):
+        """connection_closed."""
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        """connection_check_out_started."""
+        self._update(event.address, wait_queue=1)
+
+    def connection_check_out_failed(self, event):
+        """connection_check_out_failed."""
+        self._update(event.address, wait_queue=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        """connection_checked_out."""
+        duration = event.duration or 0.0
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["wait_queue"] -= 1
+            pool["checked_out"] += 1
+            pool["checkouts"] += 1
+            pool["checkout_time"] += duration
+            if duration > pool["max_checkout_time"]:
+                pool["max_checkout_time"] = duration
+
+    def connection_checked_in(self, event):
+        """connection_checked_in."""
+        self._update(event.address, checked_out=-1)
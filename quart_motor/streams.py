@@ -0,0 +1,304 @@
+"""Shared change streams."""
+import asyncio
+import contextvars
+import logging
+from collections import deque
+
+import bson
+from pymongo.errors import InvalidOperation, OperationFailure, PyMongoError
+
+from quart_motor.cache import _CHANGE_STREAMS_UNSUPPORTED
+
+__all__ = ["ChangeEvent", "ChangeStreamHub", "Subscription"]
+
+logger = logging.getLogger(__name__)
+
+# queued for a subscriber that was closed or dropped
+_END = object()
+
+
+class ChangeEvent(object):
+    """A change event, shared by every subscriber of a change stream.
+
+    :attr:`document` is the change document as returned by the server;
+    subscribers must not modify it. :attr:`json` is serialized on first
+    use and then reused by every other subscriber.
+    """
+
+    __slots__ = ("document", "id", "_dumps", "_json")
+
+    def __init__(self, document, dumps):
+        """__init__."""
+        self.document = document
+        self.id = document["_id"]["_data"]
+        self._dumps = dumps
+        self._json = None
+
+    @property
+    def json(self):
+        """The change document serialized by the app's JSON provider."""
+        if self._json is None:
+            self._json = self._dumps(self.document, separators=(",", ":"))
+        return self._json
+
+    def sse(self):
+        """Format the event as a Server-Sent Events message."""
+        return "id: %s\ndata: %s\n\n" % (self.id, self.json)
+
+
+class Subscription(object):
+    """One consumer of a shared change stream.
+
+    An asynchronous iterator of :class:`ChangeEvent`, usually obtained from
+    :meth:`~quart_motor.Motor.watch`. Events are queued for the consumer
+    in a bounded queue; a consumer that lets it fill up is dropped rather
+    than holding up the others: iteration ends and :attr:`dropped` is
+    set. Iteration also ends if the change stream fails in a way that
+    reopening it can't fix, with :attr:`error` set. Close the
+    subscription when done, or use it as an asynchronous context manager.
+    .. code-block:: python
+        @app.websocket("/ws/orders")
+        async def order_updates():
+            async with mongo.watch("orders", [{"$match": {"operationType": "insert"}}]) as events:
+                async for event in events:
+                    await websocket.send(event.json)
+    """
+
+    def __init__(self, feed, maxsize):
+        """__init__."""
+        self._feed = feed
+        self._queue = asyncio.Queue(maxsize + 1)
+        self._maxsize = maxsize
+        self.dropped = False
+        self.closed = False
+        #: the exception the change stream failed with, if it was given up
+        self.error = None
+        #: ``False`` if the subscription was asked to resume after an
+        #: event that is no longer remembered, so events may be missing
+        self.resumed = True
+
+    def __aiter__(self):
+        """__aiter__."""
+        return self
+
+    async def __anext__(self):
+        """__anext__."""
+        event = await self._queue.get()
+        if event is _END:
+            self._queue.put_nowait(_END)
+            raise StopAsyncIteration
+        return event
+
+    async def __aenter__(self):
+        """__aenter__."""
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """__aexit__."""
+        self.close()
+
+    def close(self):
+        """Stop receiving events."""
+        if not self.closed:
+            self._end()
+
+    async def sse(self, keepalive=15.0):
+        """Generate the events as a ``text/event-stream`` response body.
+
+        A comment line is sent after ``keepalive`` seconds without events,
+        which keeps proxies from timing the connection out and lets Quart
+        notice disconnected clients. The subscription is closed when the
+        body is.
+        .. code-block:: python
+            @app.route("/events/orders")
+            async def order_events():
+                events = mongo.watch("orders", resume_after=request.headers.get("Last-Event-ID"))
+                return events.sse(), {"Content-Type": "text/event-stream"}
+        """
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.__anext__(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                except StopAsyncIteration:
+                    return
+                yield event.sse()
+        finally:
+            self.close()
+
+    def _deliver(self, event):
+        if self._queue.qsize() >= self._maxsize:
+            logger.warning("dropping slow change stream subscriber on %s", self._feed.name)
+            self.dropped = True
+            self._end()
+        else:
+            self._queue.put_nowait(event)
+
+    def _end(self):
+        self.closed = True
+        self._feed.remove(self)
+        # the consumer's next event is the end, whatever was queued before
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_END)
+
+
+class _Feed(object):
+    """One change stream and the subscriptions it is shared with."""
+
+    def __init__(self, hub, key, collection, pipeline, kwargs, dumps):
+        self.hub = hub
+        self.key = key
+        self.name = collection.full_name
+        self.collection = collection
+        self.pipeline = pipeline
+        self.kwargs = kwargs
+        self.dumps = dumps
+        self.subscribers = set()
+        self.history = deque(maxlen=hub.history)
+        self.resume_token = None
+        self.task = None
+
+    def add(self, subscription, resume_after=None):
+        if resume_after is not None:
+            ids = [event.id for event in self.history]
+            if resume_after in ids:
+                for event in list(self.history)[ids.index(resume_after) + 1:]:
+                    subscription._deliver(event)
+            elif self.task is None and _is_resume_token(resume_after):
+                # nobody is watching yet: open the stream where the
+                # subscriber left off
+                self.resume_token = {"_data": resume_after}
+            else:
+                subscription.resumed = False
+            if subscription.closed:
+                # dropped while catching up
+                return
+        self.subscribers.add(subscription)
+        if self.task is None:
+            # shared by later subscribers, so must not inherit the first
+            # one's request context, and with it its deadline
+            self.task = contextvars.Context().run(asyncio.ensure_future, self._run())
+
+    def remove(self, subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.hub._feeds.pop(self.key, None)
+
+    def publish(self, document):
+        event = ChangeEvent(document, self.dumps)
+        self.history.append(event)
+        for subscription in list(self.subscribers):
+            subscription._deliver(event)
+
+    def close(self, error=None):
+        for subscription in list(self.subscribers):
+            subscription.error = error
+            subscription._end()
+
+    async def _run(self):
+        while True:
+            kwargs = dict(self.kwargs)
+            if self.resume_token is not None:
+                kwargs["resume_after"] = self.resume_token
+            try:
+                async with self.collection.watch(self.pipeline, **kwargs) as stream:
+                    async for document in stream:
+                        self.resume_token = stream.resume_token
+                        self.publish(document)
+            except InvalidOperation as exc:
+                # raised by the driver rather than the server, e.g. for an
+                # event the pipeline stripped the _id (resume token) of;
+                # reopening would fail the same way
+                logger.error("change stream on %s failed: %s", self.name, exc)
+                self.close(exc)
+                return
+            except PyMongoError as exc:
+                if isinstance(exc, OperationFailure):
+                    if exc.code == _CHANGE_STREAMS_UNSUPPORTED:
+                        logger.error("can't watch %s: %s", self.name, exc)
+                        self.close(exc)
+                        return
+                    # not resumable (the driver resumes after the others):
+                    # start over from now
+                    self.resume_token = None
+                logger.warning("change stream on %s failed, reopening: %s", self.name, exc)
+                await asyncio.sleep(self.hub.retry_delay)
+            except Exception as exc:
+                # not a server or network error, so reopening would fail
+                # the same way; the next subscriber starts over
+                logger.exception("change stream on %s failed", self.name)
+                self.close(exc)
+                return
+
+
+def _is_resume_token(value):
+    try:
+        bytes.fromhex(value)
+    except (TypeError, ValueError):
+        return False
+    return bool(value)
+
+
+class ChangeStreamHub(object):
+    """Share one change stream per collection and pipeline among subscribers.
+
+    Used through :meth:`~quart_motor.Motor.watch`. A change stream is
+    opened when the first subscriber of a collection and pipeline arrives
+    and closed when the last one leaves. Each event is delivered to every
+    subscriber's queue and serialized to JSON at most once. The most
+    recent events are remembered, so that a client reconnecting with the
+    id of the last event it saw (as SSE clients do with ``Last-Event-ID``)
+    picks up where it left off; if nobody is watching yet, the stream is
+    opened from that event. If the stream fails with a server or network
+    error, it is reopened after the last event it delivered; other errors,
+    such as an event without a resume token, end its subscriptions, and
+    the next subscriber opens a new stream.
+    :param int history: how many recent events to remember for resuming
+       subscribers
+    :param float retry_delay: seconds to wait before reopening a failed
+       change stream
+    """
+
+    def __init__(self, history=1000, retry_delay=1.0):
+        """__init__."""
+        self.history = history
+        self.retry_delay = retry_delay
+        self._feeds = {}
+
+    def subscribe(self, collection, pipeline=None, dumps=None, maxsize=100,
+                  resume_after=None, **kwargs):
+        """Subscribe to the changes of ``collection`` matching ``pipeline``.
+
+        :param collection: the collection to watch
+        :param pipeline: the change stream's aggregation pipeline
+        :param dumps: the function serializing events to JSON
+        :param int maxsize: the most events queued for this subscriber
+           before it is dropped
+        :param str resume_after: the :attr:`ChangeEvent.id` of the last
+           event the subscriber saw, to receive the events it missed
+        :param kwargs: further options for the change stream, such as
+           ``full_document``; subscribers share a stream only if these
+           are the same
+        """
+        pipeline = list(pipeline or [])
+        key = (
+            collection.full_name,
+            bson.encode({"pipeline": pipeline, "options": sorted(kwargs.items())}),
+        )
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = self._feeds[key] = _Feed(self, key, collection, pipeline, kwargs, dumps)
+        subscription = Subscription(feed, maxsize)
+        feed.add(subscription, resume_after)
+        return subscription
+
+    def close(self):
+        """End every subscription and close the change streams."""
+        for feed in list(self._feeds.values()):
+            feed.close()
+        self._feeds.clear()
@@ -0,0 +1,165 @@
+"""Materialized views refreshed on a schedule."""
+import asyncio
+import contextvars
+import datetime
+import logging
+import time
+
+__all__ = ["MaterializedView", "ViewScheduler"]
+
+logger = logging.getLogger(__name__)
+
+
+class MaterializedView(object):
+    """A collection kept up to date with the results of an aggregation.
+
+    Created with :meth:`~quart_motor.Motor.materialized_view`. Each
+    refresh runs ``pipeline`` on the source collection, followed by a
+    ``$merge`` stage into the ``into`` collection, so the server writes
+    the results without sending them to the app. Documents of the view
+    that the pipeline no longer produces are left in place, as with any
+    ``$merge``.
+    :param str source: the collection the pipeline runs on
+    :param list pipeline: the aggregation pipeline
+    :param str into: the collection the results are merged into
+    :param float every: seconds between refreshes
+    :param on: the field or fields identifying a result in the view,
+       which need a unique index unless it is ``"_id"``
+    :param str when_matched: what to do with a result that is in the
+       view already, as for ``$merge``
+    """
+
+    def __init__(self, source, pipeline, into, every=300.0, on="_id", when_matched="replace"):
+        """__init__."""
+        self.source = source
+        self.pipeline = list(pipeline)
+        self.into = into
+        self.every = every
+        self.on = on
+        self.when_matched = when_matched
+        self.runs = 0
+        self.failures = 0
+        self.last_refresh = None
+        self.last_duration = None
+        self.last_error = None
+        self._pending = None
+
+    @property
+    def stages(self):
+        """The pipeline, with the ``$merge`` stage appended."""
+        return self.pipeline + [{"$merge": {
+            "into": self.into,
+            "on": self.on,
+            "whenMatched": self.when_matched,
+            "whenNotMatched": "insert",
+        }}]
+
+    async def refresh(self, db):
+        """Run the pipeline on ``db`` now, unless a refresh is already running.
+
+        Refreshes requested while one is running wait for it. Errors are
+        recorded in :meth:`status` and raised.
+        """
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._refresh(db))
+            self._pending.add_done_callback(self._refreshed)
+        await asyncio.shield(self._pending)
+
+    def _refreshed(self, task):
+        self._pending = None
+        if not task.cancelled():
+            # retrieved here as well, in case nobody awaits it any more
+            task.exception()
+
+    async def _refresh(self, db):
+        start = time.monotonic()
+        try:
+            await db[self.source].aggregate(self.stages).to_list(None)
+        except Exception as exc:
+            self.failures += 1
+            self.last_error = str(exc)
+            raise
+        else:
+            self.last_error = None
+        finally:
+            self.runs += 1
+            self.last_refresh = datetime.datetime.now(datetime.timezone.utc)
+            self.last_duration = time.monotonic() - start
+
+    def status(self):
+        """Return the number of refreshes and failures, and how the last one went."""
+        return {
+            "source": self.source,
+            "into": self.into,
+            "every": self.every,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_refresh": self.last_refresh,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+class ViewScheduler(object):
+    """Refresh materialized views in the background while the app serves.
+
+    Used by :class:`~quart_motor.Motor`, which starts it when the app
+    starts serving and stops it when the app stops. Each view is
+    refreshed straight away, then every ``every`` seconds after the
+    previous refresh finished. Stopping waits for refreshes in progress
+    to finish rather than abandoning them.
+    """
+
+    def __init__(self):
+        """__init__."""
+        self.views = {}
+        self._db = None
+        self._stop = None
+        self._tasks = []
+
+    def add(self, view):
+        """Schedule ``view``, starting it now if the scheduler is running."""
+        self.views[view.into] = view
+        if self._db is not None:
+            self._start(view)
+
+    def start(self, db):
+        """Start refreshing the views of ``db``."""
+        self._db = db
+        self._stop = asyncio.Event()
+        for view in self.views.values():
+            self._start(view)
+
+    def _start(self, view):
+        # must not inherit the context of whoever added the view
+        task = contextvars.Context().run(asyncio.ensure_future, self._run(view))
+        self._tasks.append(task)
+
+    async def _run(self, view):
+        while not self._stop.is_set():
+            try:
+                await view.refresh(self._db)
+            except Exception as exc:
+                logger.warning("refreshing the materialized view %s failed: %s", view.into, exc)
+            try:
+                await asyncio.wait_for(self._stop.wait(), view.every)
+            except asyncio.TimeoutError:
+                pass
+
+    def discard(self):
+        """Stop refreshing at once, e.g. in a process forked from the one refreshing."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for view in self.views.values():
+            view._pending = None
+        self._db = self._stop = None
+
+    async def close(self):
+        """Stop refreshing, once the refreshes in progress have finished."""
+        if self._stop is None:
+            return
+        self._stop.set()
+        tasks, self._tasks = self._tasks, []
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._db = self._stop = None
@@ -1,22 +1,203 @@
 """Wrappers."""
+import asyncio
+import base64
+import binascii
+import functools
+import hashlib
+
+import bson
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
 from motor.core import AgnosticBaseProperties
+import pymongo
 from pymongo.collection import Collection
 from pymongo.database import Database
-from quart import abort
+from quart import abort, current_app, g, has_app_context, request
+
+from quart_motor.cache import MISSING, ResultCache, make_key
+from quart_motor.loader import DocumentLoader
 from motor import motor_asyncio
 
 
+def _cached(cache, key, factory):
+    """Return ``cache[key]``, creating it with ``factory()`` on first use.
+
+    Wrappers hold no per-access state, so a wrapper built concurrently by
+    another thread or task is as good as our own; ``setdefault`` keeps
+    whichever was stored first.
+    """
+    try:
+        return cache[key]
+    except KeyError:
+        return cache.setdefault(key, factory())
+
+
+def _cached_variant(variants, options, factory):
+    """Like :func:`_cached`, for wrappers that differ by ``options``.
+
+    PyMongo's option classes (codec options, read preferences) compare
+    by value but are not hashable, so variants are kept in a short list
+    of ``(options, wrapper)`` pairs and looked up by equality.
+    """
+    for variant_options, wrapper in variants:
+        if variant_options == options:
+            return wrapper
+    wrapper = factory()
+    variants.append((options, wrapper))
+    return wrapper
+
+
+def _sort_spec(sort):
+    """Normalize a sort to a list of ``(key, direction)``, ending with ``_id``."""
+    if sort is None:
+        spec = []
+    elif isinstance(sort, str):
+        spec = [(sort, pymongo.ASCENDING)]
+    else:
+        spec = [(key, direction) for key, direction in sort]
+    if not any(key == "_id" for key, _ in spec):
+        spec.append(("_id", pymongo.ASCENDING))
+    return spec
+
+
+def _get_field(document, key):
+    for part in key.split("."):
+        if not hasattr(document, "get"):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _encode_page_token(spec, document):
+    token = {
+        "s": [[key, direction] for key, direction in spec],
+        "v": [_get_field(document, key) for key, _ in spec],
+    }
+    data = json_util.dumps(token, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def _decode_page_token(spec, token):
+    """Return the sort values stored in ``token``, or ``None`` if it is invalid."""
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        decoded = json_util.loads(data, json_options=json_util.CANONICAL_JSON_OPTIONS)
+        if decoded["s"] != [[key, direction] for key, direction in spec]:
+            return None
+        values = decoded["v"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(values, list) or len(values) != len(spec):
+        return None
+    return values
+
+
+def _after_query(spec, values):
+    """Build the filter for documents sorting strictly after ``values``.
+
+    Null and missing keys sort before every other value, but ``$gt`` and
+    ``$lt`` never match them, so they get branches of their own.
+    """
+    clauses = []
+    for i, (key, direction) in enumerate(spec):
+        # {key: None} matches both null and missing, which sort as equal
+        equal = {k: v for (k, _), v in zip(spec[:i], values[:i])}
+        value = values[i]
+        if direction == pymongo.ASCENDING:
+            after = [{"$ne": None} if value is None else {"$gt": value}]
+        elif value is None:
+            after = []
+        else:
+            after = [{"$lt": value}, None]
+        for condition in after:
+            clause = dict(equal)
+            clause[key] = condition
+            clauses.append(clause)
+    return {"$or": clauses}
+
+
+def _admitted(method):
+    """Wrap a Motor coroutine method to wait for the client's limiter, if any.
+
+    Returns a future, like the method it wraps, since Motor's latent
+    cursors chain on the result of ``_async_aggregate`` and friends.
+    """
+    @functools.wraps(method)
+    def admitted(self, *args, **kwargs):
+        limiter = self.database.client.limiter
+        if limiter is None:
+            return method(self, *args, **kwargs)
+        return asyncio.ensure_future(limiter.run(self.name, method, self, *args, **kwargs))
+
+    return admitted
+
+
+def _admit_cursor(collection, cursor):
+    """Make each batch fetched by ``cursor`` wait for the client's limiter."""
+    limiter = collection.database.client.limiter
+    if limiter is not None:
+        refresh = cursor._refresh
+        cursor._refresh = lambda: asyncio.ensure_future(
+            limiter.run(collection.name, refresh),
+        )
+    return cursor
+
+
 class AsyncIOMotorClient(motor_asyncio.AsyncIOMotorClient):
     """Wrapper for :class:`AsyncIOMotorClient.MongoClient`.
 
     Returns instances of Quart-Motor
     :class:`~quart_motor.wrappers.Database` instead of native motor
     :class:`~AsyncIOMotorDatabase` when accessed with dot notation.
+    Database wrappers are created once per name (and options) and reused
+    on later accesses.
     """
 
+    #: The :class:`~quart_motor.limiter.ConcurrencyLimiter` admitting this
+    #: client's operations, if one was given to :class:`~quart_motor.Motor`.
+    limiter = None
+
+    def __init__(self, *args, **kwargs):
+        """__init__."""
+        super(AsyncIOMotorClient, self).__init__(*args, **kwargs)
+        #: The :class:`~quart_motor.cache.ResultCache` of
+        #: :meth:`AsyncIOMotorCollection.aggregate_cached`.
+        self.result_cache = ResultCache()
+        self._databases = {}
+        self._database_variants = {}
+
+    def __getattr__(self, name):
+        """__getattr__."""
+        database = super(AsyncIOMotorClient, self).__getattr__(name)
+        # later dot-notation access is a plain instance attribute lookup
+        self.__dict__[name] = database
+        return database
+
     def __getitem__(self, name):
         """__getitem__."""
-        return AsyncIOMotorDatabase(self, name)
+        return _cached(self._databases, name, lambda: AsyncIOMotorDatabase(self, name))
+
+    def get_database(
+        self,
+        name=None,
+        codec_options=None,
+        read_preference=None,
+        write_concern=None,
+        read_concern=None,
+    ):
+        """Get a :class:`~quart_motor.wrappers.AsyncIOMotorDatabase` with the given options.
+
+        See :meth:`~pymongo.mongo_client.MongoClient.get_database`.
+        """
+        options = (codec_options, read_preference, write_concern, read_concern)
+        delegate = self.delegate.get_database(name, *options)
+        if options == (None,) * 4:
+            return self[delegate.name]
+
+        return _cached_variant(
+            self._database_variants.setdefault(delegate.name, []), options,
+            lambda: AsyncIOMotorDatabase(self, delegate.name, _delegate=delegate),
+        )
 
 
 class AsyncIOMotorDatabase(motor_asyncio.AsyncIOMotorDatabase):
@@ -25,23 +206,71 @@ class AsyncIOMotorDatabase(motor_asyncio.AsyncIOMotorDatabase):
     Returns instances of Quart-Motor
     :class:`~quart_motor.wrappers.AsyncIOMotorCollection` instead of native PyMongo
     :class:`~motor.motor_asyncio.AsyncIOMotorCollection` when accessed with dot notation.
+    Collection wrappers are created once per name (and options) and reused
+    on later accesses.
     """
 
     def __init__(self, client, name, **kwargs):
         """__init__."""
         self._client = client
-        delegate = kwargs.get("_delegate") or Database(client.delegate, name, **kwargs)
+        self._collections = {}
+        self._collection_variants = {}
+        _delegate = kwargs.pop("_delegate", None)
+        delegate = _delegate if _delegate is not None else Database(
+            client.delegate, name, **kwargs
+        )
 
         super(AgnosticBaseProperties, self).__init__(delegate)
 
+    def __getattr__(self, name):
+        """__getattr__."""
+        collection = super(AsyncIOMotorDatabase, self).__getattr__(name)
+        # later dot-notation access is a plain instance attribute lookup
+        self.__dict__[name] = collection
+        return collection
+
     def __getitem__(self, name):
         """__getitem__."""
-        return AsyncIOMotorCollection(self, name)
+        return _cached(self._collections, name, lambda: AsyncIOMotorCollection(self, name))
 
+    def get_collection(
+        self,
+        name,
+        codec_options=None,
+        read_preference=None,
+        write_concern=None,
+        read_concern=None,
+    ):
+        """Get a :class:`~quart_motor.wrappers.AsyncIOMotorCollection` with the given options.
+
+        See :meth:`~pymongo.database.Database.get_collection`.
+        """
+        options = (codec_options, read_preference, write_concern, read_concern)
+        if options == (None,) * 4:
+            return self[name]
+
+        return _cached_variant(
+            self._collection_variants.setdefault(name, []), options,
+            lambda: AsyncIOMotorCollection(self, name, *options),
+        )
+
+
+# Motor's coroutine methods, admitted by the client's limiter
+_AdmittedCollection = type("_AdmittedCollection", (motor_asyncio.AsyncIOMotorCollection,), {
+    name: _admitted(getattr(motor_asyncio.AsyncIOMotorCollection, name))
+    for name in dir(motor_asyncio.AsyncIOMotorCollection)
+    if getattr(getattr(motor_asyncio.AsyncIOMotorCollection, name, None), "is_async_method", False)
+})
 
-class AsyncIOMotorCollection(motor_asyncio.AsyncIOMotorCollection):
+
+class AsyncIOMotorCollection(_AdmittedCollection):
     """Sub-class of Motor :class:`~AsyncIOMotorCollection` with helpers."""
 
+    #: The :class:`~quart_motor.cache.DocumentCache` serving
+    #: :meth:`find_one`, if caching was enabled with
+    #: :meth:`~quart_motor.Motor.cache`.
+    document_cache = None
+
     def __init__(
         self,
         database,
@@ -72,13 +301,303 @@ class AsyncIOMotorCollection(motor_asyncio.AsyncIOMotorCollection):
 
         super(AgnosticBaseProperties, self).__init__(delegate)
         self.database = database
+        self._collections = {}
+        self._variants = []
+
+    def __getattr__(self, name):
+        """__getattr__."""
+        collection = super(AsyncIOMotorCollection, self).__getattr__(name)
+        # later dot-notation access is a plain instance attribute lookup
+        self.__dict__[name] = collection
+        return collection
 
     def __getitem__(self, name):
         """__getitem__."""
-        return AsyncIOMotorCollection(
-            self.database, self.name + "." + name, _delegate=self.delegate[name]
+        return _cached(
+            self._collections, name,
+            lambda: AsyncIOMotorCollection(
+                self.database, self.name + "." + name, _delegate=self.delegate[name]
+            ),
         )
 
+    def with_options(
+        self,
+        codec_options=None,
+        read_preference=None,
+        write_concern=None,
+        read_concern=None,
+    ):
+        """Get a clone of this collection with different options.
+
+        See :meth:`~pymongo.collection.Collection.with_options`. Clones are
+        cached per combination of options.
+        """
+        options = (codec_options, read_preference, write_concern, read_concern)
+        return _cached_variant(
+            self._variants, options,
+            lambda: AsyncIOMotorCollection(
+                self.database, self.name, _delegate=self.delegate.with_options(*options)
+            ),
+        )
+
+    def as_raw(self):
+        """Get a clone of this collection that returns raw BSON documents.
+
+        Documents are returned as :class:`~bson.raw_bson.RawBSONDocument`,
+        which keeps the BSON bytes read from the server and only decodes
+        them when a field is accessed. The application's JSON provider
+        serializes them without going through their mapping interface, so
+        documents that are only passed on to the client are decoded once,
+        straight into the JSON serializer's input. Use ``Motor(app,
+        raw=True)`` to get raw documents from every collection.
+        .. code-block:: python
+            @app.route("/products")
+            async def products():
+                cursor = mongo.db.products.as_raw().find({"listed": True})
+                return await cursor.to_list(100)
+        """
+        return self.with_options(
+            codec_options=self.codec_options.with_options(document_class=RawBSONDocument),
+        )
+
+    def find(self, *args, **kwargs):
+        """Create a cursor; see :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`."""
+        return _admit_cursor(self, super(AsyncIOMotorCollection, self).find(*args, **kwargs))
+
+    def find_raw_batches(self, *args, **kwargs):
+        """Create a raw-batch cursor.
+
+        See :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_raw_batches`.
+        """
+        return _admit_cursor(
+            self, super(AsyncIOMotorCollection, self).find_raw_batches(*args, **kwargs),
+        )
+
+    def aggregate(self, *args, **kwargs):
+        """Create an aggregation cursor.
+
+        See :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.aggregate`.
+        """
+        return _admit_cursor(self, super(AsyncIOMotorCollection, self).aggregate(*args, **kwargs))
+
+    def aggregate_raw_batches(self, *args, **kwargs):
+        """Create a raw-batch aggregation cursor.
+
+        See :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.aggregate_raw_batches`.
+        """
+        return _admit_cursor(
+            self, super(AsyncIOMotorCollection, self).aggregate_raw_batches(*args, **kwargs),
+        )
+
+    async def aggregate_cached(self, pipeline, ttl=60.0, stale_ttl=0.0, **kwargs):
+        """Run an aggregation, or return its cached result.
+
+        Results are kept in the client's
+        :class:`~quart_motor.cache.ResultCache`, keyed by collection,
+        pipeline and options. While a result is being computed, identical
+        aggregations wait for it instead of running as well; once it is
+        older than ``ttl``, it is still returned for ``stale_ttl`` more
+        seconds while it is recomputed in the background.
+        .. code-block:: python
+            @app.route("/dashboard/sales")
+            async def sales_dashboard():
+                return {"days": await mongo.db.orders.aggregate_cached(
+                    [{"$group": {"_id": "$day", "total": {"$sum": "$total"}}}],
+                    ttl=30, stale_ttl=300,
+                )}
+        The same list of documents is returned to every caller; don't
+        modify it.
+        :param list pipeline: the aggregation pipeline
+        :param float ttl: seconds a result is fresh, or ``None`` to keep it
+           until it is evicted
+        :param float stale_ttl: seconds a result older than ``ttl`` is
+           still returned while it is recomputed
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.aggregate`
+        """
+        pipeline = list(pipeline)
+        key = (
+            self.full_name,
+            bson.encode({"pipeline": pipeline, "options": sorted(kwargs.items())}),
+        )
+        return await self.database.client.result_cache.get(
+            key, lambda: self.aggregate(pipeline, **kwargs).to_list(None), ttl, stale_ttl,
+        )
+
+    async def find_columns(self, filter, schema, **kwargs):
+        """Query the collection into a :class:`~quart_motor.columns.Columns`.
+
+        Only the fields in ``schema`` are fetched, and the results are
+        copied into one typed array per field a thousand documents at a
+        time, instead of being kept as a list of documents. The result
+        takes a fraction of the memory (about 115 rather than 630 bytes
+        per row in ``benchmarks/bench_columns.py``), but filling the
+        arrays costs time: that benchmark's 20,000 rows take 10 to 30%
+        longer than with ``find().to_list()``, most of it spent converting
+        datetimes.
+        .. code-block:: python
+            @app.route("/reports/revenue")
+            async def revenue():
+                orders = await mongo.db.orders.find_columns(
+                    {"status": "paid"}, {"total": float, "created": datetime},
+                )
+                arrays = orders.to_numpy()
+                return {"revenue": float(arrays["total"].sum())}
+        :param filter: the query filter, as for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        :param dict schema: the type of each field, by name; see
+           :class:`~quart_motor.columns.Columns`
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        """
+        # imported when used, as it imports numpy and pyarrow
+        from quart_motor import columns
+
+        # documents are decoded by the driver, which is faster than
+        # decoding raw batches here
+        cursor = self.find(filter, columns.projection(schema), **kwargs)
+        return await columns.read_columns(cursor, schema)
+
+    async def aggregate_columns(self, pipeline, schema, **kwargs):
+        """Run an aggregation into a :class:`~quart_motor.columns.Columns`.
+
+        Like :meth:`find_columns`; a ``$project`` stage keeping only the
+        fields in ``schema`` is added to the end of the pipeline.
+        :param list pipeline: the aggregation pipeline
+        :param dict schema: the type of each field, by name
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.aggregate`
+        """
+        from quart_motor import columns
+
+        pipeline = list(pipeline) + [{"$project": columns.projection(schema)}]
+        return await columns.read_columns(self.aggregate(pipeline, **kwargs), schema)
+
+    def loader(self, key="_id", projection=None, **kwargs):
+        """Get a :class:`~quart_motor.loader.DocumentLoader` for this collection.
+
+        Within a request the same loader is returned for the same ``key``
+        and ``projection`` every time, so that lookups from anywhere in
+        the request are batched together and each document is fetched at
+        most once per request. Outside a request a new loader is returned.
+        .. code-block:: python
+            @app.route("/posts")
+            async def posts():
+                posts = await mongo.db.posts.find().to_list(100)
+                authors = mongo.db.users.loader()
+                for post, author in zip(posts, await authors.load_many(
+                        [post["author_id"] for post in posts])):
+                    post["author"] = author
+                return jsonify(posts)
+        :param str key: the field to look documents up by
+        :param projection: the projection to load documents with
+        :param kwargs: further arguments for
+           :class:`~quart_motor.loader.DocumentLoader`
+        """
+        if not has_app_context():
+            return DocumentLoader(self, key, projection, **kwargs)
+
+        loaders = g.setdefault("_quart_motor_loaders", {})
+        # collection wrappers are cached, so id() is stable for the request
+        loader_key = (id(self), key, repr(projection))
+        if loader_key not in loaders:
+            loaders[loader_key] = DocumentLoader(self, key, projection, **kwargs)
+        return loaders[loader_key]
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        """Get a single document from the database.
+
+        See :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_one`.
+        If a :attr:`document_cache` is set, calls with only a filter and a
+        projection are answered from the cache when possible.
+        """
+        if self.document_cache is None or len(args) > 1 or set(kwargs) - {"projection"}:
+            return await super(AsyncIOMotorCollection, self).find_one(filter, *args, **kwargs)
+
+        projection = args[0] if args else kwargs.get("projection")
+        raw = await self._find_one_raw(filter, projection)
+        if raw is None:
+            return None
+        return bson.decode(raw, codec_options=self.codec_options)
+
+    async def _find_one_raw(self, filter, projection=None, **kwargs):
+        """Get the BSON bytes of a single document, through the cache if set."""
+        cache = self.document_cache if not kwargs else None
+        if cache is not None:
+            key = make_key(filter, projection)
+            raw = cache.get(key)
+            if raw is not MISSING:
+                return raw
+            generation = cache.generation
+
+        document = await self.as_raw().find_one(filter, projection, **kwargs)
+        raw = document.raw if document is not None else None
+        if cache is not None:
+            cache.set(key, raw, generation)
+        return raw
+
+    async def find_page(
+        self,
+        filter=None,
+        sort=None,
+        after=None,
+        limit=20,
+        projection=None,
+        abort_invalid=True,
+        **kwargs
+    ):
+        """Get one page of a query, paginating by the sort keys.
+
+        Rather than skipping over earlier pages, each page continues from
+        the sort key values of the last document of the previous page, so
+        that (with an index on the sort keys) every page costs the same as
+        the first. ``_id`` is appended to the sort as a tie-breaker unless
+        it is already part of it. Each sort key may be null or missing,
+        but its other values must all have the same BSON type (numbers
+        count as one), since range queries only match values of the type
+        they compare against.
+        Returns a ``(documents, token)`` tuple; ``token`` is an opaque
+        string to pass as ``after`` to get the next page, or ``None`` on
+        the last page.
+        .. code-block:: python
+            @app.route("/users")
+            async def list_users():
+                users, token = await mongo.db.users.find_page(
+                    {"active": True},
+                    sort=[("created", DESCENDING)],
+                    after=request.args.get("after"),
+                )
+                return {"users": users, "next": token}
+        :param filter: the query filter
+        :param sort: a key or a list of ``(key, direction)`` pairs
+        :param str after: a token returned with the previous page
+        :param int limit: the number of documents per page
+        :param projection: the projection; it must include the sort keys
+        :param bool abort_invalid: if ``True``, an invalid ``after`` token
+           causes a 404 Not Found HTTP status on the request, like
+           :meth:`find_one_or_404`; otherwise it raises ``ValueError``
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        """
+        if limit < 1:
+            raise ValueError("limit must be at least 1, not %r" % (limit,))
+        spec = _sort_spec(sort)
+        if after is not None:
+            values = _decode_page_token(spec, after)
+            if values is None:
+                if abort_invalid:
+                    abort(404)
+                raise ValueError("invalid page token %r" % (after,))
+            after_query = _after_query(spec, values)
+            filter = {"$and": [filter, after_query]} if filter else after_query
+
+        cursor = self.find(filter, projection, sort=spec, limit=limit + 1, **kwargs)
+        documents = await cursor.to_list(length=limit + 1)
+        if len(documents) <= limit:
+            return documents, None
+        documents = documents[:limit]
+        return documents, _encode_page_token(spec, documents[-1])
+
     async def find_one_or_404(self, *args, **kwargs):
         """Find a single document or raise a 404.
 
@@ -96,3 +615,301 @@ class AsyncIOMotorCollection(motor_asyncio.AsyncIOMotorCollection):
         if found is None:
             abort(404)
         return found
+
+    async def find_one_conditional(
+        self,
+        filter=None,
+        projection=None,
+        etag_field=None,
+        last_modified_field=None,
+        **kwargs
+    ):
+        """Respond with a single document as JSON, or ``304 Not Modified``.
+
+        Like :meth:`find_one_or_404`, but returns a response with an
+        ``ETag`` (and, optionally, a ``Last-Modified``) header. When the
+        request's ``If-None-Match`` or ``If-Modified-Since`` header shows
+        the client already has this version of the document, the response
+        is an empty ``304`` and the document is never decoded or
+        serialized.
+        .. code-block:: python
+            @app.route("/orders/<ObjectId:order_id>")
+            async def show_order(order_id):
+                return await mongo.db.orders.find_one_conditional(
+                    order_id, etag_field="version", last_modified_field="updatedAt",
+                )
+        :param filter: the ``find_one`` filter, or an ``_id`` value
+        :param projection: the ``find_one`` projection
+        :param str etag_field: a field (in dot notation) that changes
+           whenever the document does, such as a version number or a
+           modification time, to derive the ETag from; by default, and for
+           documents where the field is missing or ``null``, the ETag is a
+           hash of the whole document
+        :param str last_modified_field: a datetime field to send as
+           ``Last-Modified``
+        :param kwargs: other arguments for ``find_one``
+        """
+        raw = await self._find_one_raw(filter, projection, **kwargs)
+        if raw is None:
+            abort(404)
+
+        document = RawBSONDocument(raw)
+        version = raw
+        if etag_field is not None:
+            value = _get_field(document, etag_field)
+            # a missing version would give every document the same ETag
+            if value is not None:
+                version = bson.encode({"v": value})
+        etag = hashlib.blake2b(version, digest_size=16).hexdigest()
+        last_modified = None
+        if last_modified_field is not None:
+            last_modified = _get_field(document, last_modified_field)
+
+        def conditional(response):
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+
+        response = conditional(current_app.response_class(b""))
+        await response.make_conditional(request)
+        if response.status_code != 200:
+            return response
+        return conditional(
+            current_app.json.response(bson.decode(raw, codec_options=self.codec_options)),
+        )
+
+    def stream_json(self, filter=None, *args, format="array", batch_size=100, **kwargs):
+        """Stream the results of a query as a JSON response.
+
+        Returns an instance of the :attr:`~quart.Quart.response_class` whose
+        body is produced from the cursor one batch at a time, so the result
+        set is never held in memory and the first documents are sent as
+        soon as the first batch arrives. Documents are serialized with the
+        application's JSON provider (the BSON-aware
+        :class:`~quart_motor.helpers.JSONEncoder` installed by
+        :class:`~quart_motor.Motor`).
+        .. code-block:: python
+            @app.route("/export/users")
+            async def export_users():
+                return mongo.db.users.stream_json({"active": True}, format="ndjson")
+        :param filter: the query filter, as for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        :param str format: ``"array"`` for a single JSON array
+           (``application/json``), or ``"ndjson"`` for one document per line
+           (``application/x-ndjson``)
+        :param int batch_size: number of documents fetched from the server
+           and serialized together
+        :param args: further arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        """
+        if format not in ("array", "ndjson"):
+            raise ValueError("'format' must be 'array' or 'ndjson'")
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("'batch_size' must be a positive integer")
+
+        cursor = self.find(filter, *args, batch_size=batch_size, **kwargs)
+        dumps = current_app.json.dumps
+
+        async def generate_array():
+            yield "["
+            first = True
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                # drop the brackets of the serialized batch
+                data = dumps(batch, separators=(",", ":"))[1:-1]
+                yield data if first else "," + data
+                first = False
+            yield "]\n"
+
+        async def generate_ndjson():
+            while True:
+                batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    break
+                yield "".join(
+                    dumps(document, separators=(",", ":")) + "\n" for document in batch
+                )
+
+        if format == "ndjson":
+            return current_app.response_class(
+                generate_ndjson(), mimetype="application/x-ndjson",
+            )
+        return current_app.response_class(generate_array(), mimetype="application/json")
+
+    def stream_bson(self, filter=None, *args, **kwargs):
+        """Stream the results of a query as a BSON response.
+
+        The body is the matching documents' BSON, one after the other, as
+        read by :func:`bson.decode_all` or ``bsondump``; it is copied from
+        the server's reply batches (see
+        :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_raw_batches`)
+        without decoding any document. The content type is
+        ``application/bson``.
+        .. code-block:: python
+            @app.route("/export/users")
+            async def export_users():
+                best = request.accept_mimetypes.best_match(
+                    ["application/json", "application/bson"],
+                )
+                if best == "application/bson":
+                    return mongo.db.users.stream_bson({"active": True})
+                return mongo.db.users.stream_json({"active": True})
+        :param filter: the query filter, as for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        :param args: further arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_raw_batches`
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_raw_batches`
+        """
+        cursor = self.find_raw_batches(filter, *args, **kwargs)
+
+        async def generate():
+            async for batch in cursor:
+                yield batch
+
+        return current_app.response_class(generate(), mimetype="application/bson")
+
+    def stream_csv(self, filter, schema, **kwargs):
+        """Stream the results of a query as a CSV response.
+
+        The columns are the fields of ``schema``, as for
+        :meth:`find_columns`, in that order and under a header row; each
+        batch of results is decoded and formatted as it arrives.
+        .. code-block:: python
+            @app.route("/export/orders.csv")
+            async def export_orders():
+                return mongo.db.orders.stream_csv(
+                    {"status": "paid"}, {"_id": str, "total": float, "created": datetime},
+                )
+        :param filter: the query filter, as for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        :param dict schema: the type of each field, by name
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_raw_batches`
+        """
+        from quart_motor import columns
+
+        cursor = self.find_raw_batches(filter, columns.projection(schema), **kwargs)
+        return current_app.response_class(
+            columns.generate_csv(cursor, schema), mimetype="text/csv",
+        )
+
+    def stream_parquet(self, filter, schema, **kwargs):
+        """Stream the results of a query as a Parquet file.
+
+        Like :meth:`stream_csv`, with one row group per batch of results.
+        Requires :mod:`pyarrow` (``pip install Quart-Motor[columns]``).
+        :param filter: the query filter, as for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find`
+        :param dict schema: the type of each field, by name
+        :param kwargs: further keyword arguments for
+           :meth:`~motor.motor_asyncio.AsyncIOMotorCollection.find_raw_batches`
+        """
+        from quart_motor import columns
+
+        if columns.parquet is None:
+            raise RuntimeError("stream_parquet() requires pyarrow")
+        cursor = self.find_raw_batches(filter, columns.projection(schema), **kwargs)
+        return current_app.response_class(
+            columns.generate_parquet(cursor, schema),
+            mimetype="application/vnd.apache.parquet",
+        )
+
+
+# collection methods that only read, and may be sent to another cluster
+_READ_METHODS = frozenset((
+    "count_documents", "distinct", "estimated_document_count", "find", "find_columns",
+    "find_one", "find_one_conditional", "find_one_or_404", "find_page",
+    "find_raw_batches", "list_indexes", "list_search_indexes", "loader",
+    "stream_bson", "stream_csv", "stream_json", "stream_parquet",
+))
+
+# collection methods running a pipeline, which reads unless it has an
+# $out or $merge stage
+_PIPELINE_METHODS = frozenset((
+    "aggregate", "aggregate_cached", "aggregate_columns", "aggregate_raw_batches",
+))
+
+
+def _writes_output(pipeline):
+    return any("$out" in stage or "$merge" in stage for stage in pipeline or ())
+
+
+class ReadRoutedCollection(object):
+    """A collection whose reads go to another cluster.
+
+    Methods that only read (``find``, ``find_one``, ``count_documents``,
+    ``aggregate`` without ``$out`` or ``$merge`` and so on) are those of
+    :attr:`reads`; everything else, writes included, is that of
+    :attr:`writes`.
+    """
+
+    def __init__(self, writes, reads):
+        """__init__."""
+        self.writes = writes
+        self.reads = reads
+
+    def __getattr__(self, name):
+        """__getattr__."""
+        if name in _READ_METHODS:
+            return getattr(self.reads, name)
+        if name in _PIPELINE_METHODS:
+            return functools.partial(self._pipeline, name)
+        attribute = getattr(self.writes, name)
+        if isinstance(attribute, AsyncIOMotorCollection):
+            # a sub-collection, e.g. fs.files
+            return ReadRoutedCollection(attribute, getattr(self.reads, name))
+        return attribute
+
+    def __getitem__(self, name):
+        """__getitem__."""
+        return ReadRoutedCollection(self.writes[name], self.reads[name])
+
+    def _pipeline(self, method, pipeline, *args, **kwargs):
+        collection = self.writes if _writes_output(pipeline) else self.reads
+        return getattr(collection, method)(pipeline, *args, **kwargs)
+
+
+class ReadRoutedDatabase(object):
+    """A database whose collections read from another cluster.
+
+    What :attr:`quart_motor.Motor.db` is in views whose reads are routed
+    to a ``MONGO_URIS`` connection (see
+    :meth:`~quart_motor.Motor.reads_from`). Its collections are
+    :class:`ReadRoutedCollection` instances, which read from the same
+    collections of :attr:`reads`, the connection's database, and write to
+    those of :attr:`writes`, the default database. Everything else, such
+    as ``command``, ``name`` or GridFS, is that of :attr:`writes`.
+    """
+
+    def __init__(self, writes, reads):
+        """__init__."""
+        self.writes = writes
+        self.reads = reads
+        self._collections = {}
+
+    def __getattr__(self, name):
+        """__getattr__."""
+        attribute = getattr(self.writes, name)
+        if isinstance(attribute, AsyncIOMotorCollection):
+            return self[name]
+        return attribute
+
+    def __getitem__(self, name):
+        """__getitem__."""
+        return _cached(
+            self._collections, name,
+            lambda: ReadRoutedCollection(self.writes[name], self.reads[name]),
+        )
+
+    def get_collection(self, name, *args, **kwargs):
+        """Get a :class:`ReadRoutedCollection` with the given options."""
+        return ReadRoutedCollection(
+            self.writes.get_collection(name, *args, **kwargs),
+            self.reads.get_collection(name, *args, **kwargs),
+        )
@@ -24,6 +24,8 @@ tests_require = [
 
 extras_require = {
     'tests': tests_require,
+    'fast': ['orjson>=3.6'],
+    'columns': ['numpy>=1.20', 'pyarrow>=8.0'],
 }
 
 extras_require['all'] = [req for exts, reqs in extras_require.items()
@@ -50,10 +52,9 @@ setup(
     zip_safe=False,
     packages=find_packages(),
     install_requires=[
-        "PyMongo>=3.10",
+        "PyMongo>=4.9",
         "Quart>=0.18.0",
-        "motor>=2.1.0",
-        "six",
+        "motor>=3.6.0",
         "werkzeug"
     ],
     classifiers=[
@@ -64,11 +65,13 @@ setup(
         "License :: OSI Approved :: BSD License",
         "Operating System :: MacOS :: MacOS X",
         "Operating System :: Unix",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "Topic :: Internet :: WWW/HTTP :: Dynamic Content",
         "Topic :: Software Development :: Libraries :: Python Modules"
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
 )
@@ -1,7 +1,46 @@
+from .test_bulk import TestBulkWriter, TestMotorBulkWriter
+from .test_cache import TestCollectionCache, TestDocumentCache, TestResultCache
+from .test_columns import TestColumns
 from .test_connection import TestQuartMotor
-from .test_wrappers import TestCollection
+from .test_gridfs import TestGridFSBody, TestGridFSFileCache, TestIterChunks, TestSendFile
+from .test_helpers import TestJSONEncoder
+from .test_indexes import TestIndexes
+from .test_limiter import TestConcurrencyLimiter
+from .test_loader import TestCollectionLoader, TestDocumentLoader
+from .test_monitoring import TestCommandInstrumentation
+from .test_pool import TestPool
+from .test_streams import TestChangeStreamHub
+from .test_views import TestViewScheduler
+from .test_wrappers import (
+    TestCollection,
+    TestFindOneConditional,
+    TestPageToken,
+    TestWrapperCache,
+)
 
 __all__ = [
+    "TestBulkWriter",
+    "TestMotorBulkWriter",
+    "TestDocumentCache",
+    "TestResultCache",
+    "TestCollectionCache",
+    "TestColumns",
     "TestQuartMotor",
+    "TestGridFSBody",
+    "TestGridFSFileCache",
+    "TestIterChunks",
+    "TestSendFile",
+    "TestJSONEncoder",
+    "TestIndexes",
+    "TestConcurrencyLimiter",
+    "TestDocumentLoader",
+    "TestCollectionLoader",
+    "TestCommandInstrumentation",
+    "TestPool",
+    "TestChangeStreamHub",
+    "TestViewScheduler",
     "TestCollection",
-]
\ No newline at end of file
+    "TestFindOneConditional",
+    "TestPageToken",
+    "TestWrapperCache",
+]
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, WriteError
+from quart import Quart
+
+from quart_motor import Motor
+from quart_motor.bulk import BulkWriter
+
+
+class FakeCollection:
+    """Records bulk writes; inserts of documents with "fail" are rejected."""
+
+    def __init__(self):
+        self.batches = []
+
+    async def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        self.batches.append(requests)
+        errors = [
+            {"index": i, "code": 11000, "errmsg": "duplicate key"}
+            for i, request in enumerate(requests) if request._doc.get("fail")
+        ]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+
+class TestBulkWriter:
+    @pytest.mark.asyncio
+    async def test_writes_are_batched(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, max_batch=3, flush_interval=10)
+        await asyncio.gather(*(writer.insert_one({"n": i}) for i in range(6)))
+        assert [len(batch) for batch in collection.batches] == [3, 3]
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_flush_interval(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, flush_interval=0.01)
+        await asyncio.gather(writer.insert_one({"n": 1}), writer.insert_one({"n": 2}))
+        assert [len(batch) for batch in collection.batches] == [2]
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_failures_are_reported_per_write(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, flush_interval=0.01)
+        results = await asyncio.gather(
+            writer.insert_one({"n": 1}),
+            writer.insert_one({"n": 2, "fail": True}),
+            return_exceptions=True,
+        )
+        assert results[0] is None
+        assert isinstance(results[1], WriteError)
+        assert results[1].code == 11000
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_invalid_request_fails_alone(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, flush_interval=0.01)
+        results = await asyncio.gather(
+            writer.insert_one({"n": 1}),
+            writer.update_one({"n": 1}, {"n": 2}),
+            writer.replace_one({"n": 1}, {"$set": {"n": 2}}),
+            writer.insert_one({"n": 3}),
+            return_exceptions=True,
+        )
+        assert results[0] is None and results[3] is None
+        assert isinstance(results[1], ValueError) and isinstance(results[2], ValueError)
+        assert [len(batch) for batch in collection.batches] == [2]
+        with pytest.raises(TypeError):
+            await writer.write({"n": 4})
+        await writer.close()
+
+    @pytest.mark.asyncio
+    async def test_backpressure_and_close(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, flush_interval=10, max_pending=2)
+        await writer.write(InsertOne({"n": 1}), wait=False)
+        await writer.write(InsertOne({"n": 2}), wait=False)
+        blocked = asyncio.ensure_future(writer.insert_one({"n": 3}, wait=False))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert len(writer) == 2
+
+        await writer.flush()
+        await blocked
+        await writer.close()
+        assert [len(batch) for batch in collection.batches] == [2, 1]
+        with pytest.raises(RuntimeError):
+            await writer.insert_one({"n": 4})
+
+    @pytest.mark.asyncio
+    async def test_close_rejects_waiting_writes(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, flush_interval=10, max_pending=1)
+        queued = await writer.write(InsertOne({"n": 1}), wait=False)
+        blocked = asyncio.ensure_future(writer.insert_one({"n": 2}))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        await asyncio.wait_for(writer.close(), 1)
+        assert queued.result() is None
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(blocked, 1)
+        assert [len(batch) for batch in collection.batches] == [1]
+
+    @pytest.mark.asyncio
+    async def test_close_resolves_unsent_writes(self):
+        collection = FakeCollection()
+        writer = BulkWriter(collection, flush_interval=10)
+        queued = await writer.write(InsertOne({"n": 1}), wait=False)
+        writer._task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer.close()
+        with pytest.raises(RuntimeError):
+            queued.result()
+        assert len(writer) == 0
+
+
+class TestMotorBulkWriter:
+    uri = f"mongodb://localhost:27017/test"
+
+    @pytest.mark.asyncio
+    async def test_flushed_on_shutdown(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        writer = mongo.bulk_writer("things", flush_interval=10)
+        assert mongo.bulk_writer("things") is writer
+        await writer.insert_one({"_id": "thing"}, wait=False)
+        await app.shutdown()
+        assert mongo.cx.delegate._closed
+
+        # the writers are flushed before the app's client is closed, so
+        # check with a client of our own
+        client = AsyncIOMotorClient(self.uri)
+        try:
+            assert await client.test.things.find_one("thing") == {"_id": "thing"}
+        finally:
+            await client.test.things.delete_many({})
+            client.close()
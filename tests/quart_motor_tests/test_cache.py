@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import pytest
+from bson import ObjectId
+from quart import Quart
+
+from quart_motor import Motor
+from quart_motor.cache import DocumentCache, MISSING, ResultCache, make_key
+
+
+class TestDocumentCache:
+    def test_make_key(self):
+        oid = ObjectId()
+        assert make_key(oid) == make_key({"_id": oid})
+        assert make_key({"a": 1, "b": 2}) == make_key({"b": 2, "a": 1})
+        assert make_key({"a": {"x": 1, "y": 2}}) != make_key({"a": {"y": 2, "x": 1}})
+        assert make_key({"a": 1}, ["b"]) == make_key({"a": 1}, {"b": 1})
+        assert make_key({"a": 1}, ["b"]) != make_key({"a": 1})
+
+    def test_lru_eviction(self):
+        cache = DocumentCache(maxsize=2)
+        cache.set("a", b"1")
+        cache.set("b", b"2")
+        assert cache.get("a") == b"1"
+        cache.set("c", b"3")
+        assert cache.get("b") is MISSING
+        assert cache.get("a") == b"1"
+        assert cache.stats == {
+            "hits": 2, "misses": 1, "evictions": 1, "invalidations": 0,
+            "size": 2, "maxsize": 2,
+        }
+
+    def test_ttl(self, monkeypatch):
+        cache = DocumentCache(ttl=10)
+        cache.set("a", None)
+        assert cache.get("a") is None
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+        assert cache.get("a") is MISSING
+
+    def test_clear_discards_stale_reads(self):
+        cache = DocumentCache()
+        generation = cache.generation
+        cache.clear()
+        cache.set("a", b"1", generation)
+        assert cache.get("a") is MISSING
+        assert cache.stats["invalidations"] == 1
+
+
+class TestResultCache:
+    @pytest.mark.asyncio
+    async def test_single_flight(self):
+        cache = ResultCache()
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return ["result"]
+
+        results = await asyncio.gather(*(cache.get("k", load, ttl=60) for _ in range(5)))
+        assert results == [["result"]] * 5 and len(loads) == 1
+        assert await cache.get("k", load, ttl=60) == ["result"]
+        assert len(loads) == 1
+        assert (cache.stats["hits"], cache.stats["misses"]) == (1, 5)
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        cache = ResultCache()
+        values = iter([1, 2, 3])
+
+        async def load():
+            await asyncio.sleep(0)
+            return next(values)
+
+        assert await cache.get("k", load, ttl=0.05, stale_ttl=60) == 1
+        await asyncio.sleep(0.06)
+        # stale: returned at once, while a refresh runs in the background
+        assert await cache.get("k", load, ttl=0.05, stale_ttl=60) == 1
+        await asyncio.sleep(0.01)
+        assert await cache.get("k", load, ttl=0.05, stale_ttl=60) == 2
+        assert (cache.stats["hits"], cache.stats["stale_hits"], cache.stats["misses"]) == (1, 1, 1)
+    @pytest.mark.asyncio
+    async def test_failed_load(self):
+        cache = ResultCache(maxsize=1)
+
+        async def fail():
+            raise RuntimeError("no")
+
+        async def load():
+            return "ok"
+
+        with pytest.raises(RuntimeError):
+            await cache.get("k", fail, ttl=60)
+        assert await cache.get("k", load, ttl=60) == "ok"
+        await cache.get("other", load, ttl=60)
+        assert cache.stats["failures"] == 1 and cache.stats["evictions"] == 1
+
+
+class TestCollectionCache:
+    uri = f"mongodb://localhost:27017/test"
+
+    @pytest.mark.asyncio
+    async def test_find_one_is_cached(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        cache = mongo.cache("things", ttl=None)
+        await app.startup()
+        await mongo.db.things.insert_one({"_id": "thing", "val": "foo"})
+        try:
+            thing = await mongo.db.things.find_one({"_id": "thing"})
+            thing["val"] = "changed locally"
+            await mongo.db.things.update_one({"_id": "thing"}, {"$set": {"val": "bar"}})
+            # served from the cache, and unaffected by the caller's change
+            assert (await mongo.db.things.find_one_or_404("thing"))["val"] == "foo"
+            assert cache.stats["hits"] == 1
+
+            cache.clear()
+            assert (await mongo.db.things.find_one("thing"))["val"] == "bar"
+        finally:
+            await mongo.db.things.delete_many({})
+            await app.shutdown()
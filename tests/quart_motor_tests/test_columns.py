@@ -0,0 +1,105 @@
+import datetime
+import math
+import subprocess
+import sys
+
+import bson
+import pytest
+from bson import ObjectId
+
+from quart_motor.columns import Columns, read_columns
+
+SCHEMA = {
+    "_id": str,
+    "total": float,
+    "quantity": int,
+    "paid": bool,
+    "created": datetime.datetime,
+    "customer.country": str,
+}
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.lengths = []
+
+    async def to_list(self, length):
+        self.lengths.append(length)
+        documents, self.documents = self.documents[:length], self.documents[length:]
+        return documents
+
+
+def _batch(documents):
+    return b"".join(bson.encode(document) for document in documents)
+
+
+class TestColumns:
+    oid = ObjectId()
+    documents = [
+        {
+            "_id": oid, "total": 12.5, "quantity": 2, "paid": True,
+            "created": datetime.datetime(2024, 1, 2, 3, 4, 5),
+            "customer": {"country": "NZ"},
+        },
+        {"_id": 2, "total": None, "paid": False, "customer": "anonymous"},
+    ]
+
+    def test_decode(self):
+        columns = Columns(SCHEMA)
+        columns.extend(_batch(self.documents[:1]))
+        columns.extend(_batch(self.documents[1:]))
+        assert len(columns) == 2
+        assert columns["_id"] == [str(self.oid), "2"]
+        assert columns["total"][0] == 12.5 and math.isnan(columns["total"][1])
+        assert list(columns["quantity"]) == [2, 0]
+        assert list(columns["paid"]) == [1, 0]
+        assert list(columns["created"]) == [1704164645000, 0]
+        assert columns["customer.country"] == ["NZ", None]
+
+    def test_convert(self):
+        columns = Columns({"total": float, "quantity": int})
+        columns.extend_documents([{"total": 1, "quantity": 2}, {"total": 2.5, "quantity": 3.0}])
+        assert list(columns["total"]) == [1.0, 2.5]
+        assert list(columns["quantity"]) == [2, 3]
+
+    @pytest.mark.asyncio
+    async def test_read_columns(self):
+        cursor = FakeCursor([{"quantity": n} for n in range(5)])
+        columns = await read_columns(cursor, {"quantity": int}, length=2)
+        assert list(columns["quantity"]) == [0, 1, 2, 3, 4]
+        assert cursor.lengths == [2, 2, 2, 2]
+
+    def test_csv(self):
+        columns = Columns(SCHEMA)
+        columns.extend(_batch(self.documents))
+        assert columns.to_csv().splitlines() == [
+            "_id,total,quantity,paid,created,customer.country",
+            "%s,12.5,2,True,2024-01-02T03:04:05+00:00,NZ" % self.oid,
+            "2,,,False,,",
+        ]
+
+    def test_numpy(self):
+        numpy = pytest.importorskip("numpy")
+        columns = Columns(SCHEMA)
+        columns.extend(_batch(self.documents))
+        arrays = columns.to_numpy()
+        assert arrays["total"].dtype == numpy.float64
+        assert arrays["quantity"].mask.tolist() == [False, True]
+        assert arrays["created"][0] == numpy.datetime64("2024-01-02T03:04:05")
+        assert Columns({"total": float}).to_numpy()["total"].shape == (0,)
+
+    def test_arrow(self):
+        pytest.importorskip("pyarrow")
+        columns = Columns(SCHEMA)
+        columns.extend(_batch(self.documents))
+        table = columns.to_arrow()
+        assert table.column_names == list(SCHEMA)
+        assert table.column("quantity").to_pylist() == [2, None]
+        assert table.column("paid").to_pylist() == [True, False]
+
+    def test_imported_when_used(self):
+        # the wrappers import columns (and with it numpy) only when used
+        lazy = ("quart_motor.columns", "numpy", "pyarrow")
+        script = "import sys, quart_motor.wrappers; print([m for m in %r if m in sys.modules])" % (lazy,)
+        assert subprocess.check_output([sys.executable, "-c", script], text=True).strip() == "[]"
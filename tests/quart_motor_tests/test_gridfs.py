@@ -0,0 +1,260 @@
+import hashlib
+import io
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from quart import Quart
+from werkzeug.exceptions import NotFound
+
+from quart_motor import Motor
+from quart_motor.file_cache import GridFSFileCache, MappedFileBody
+from quart_motor.grid_file import GridFSBody, iter_chunks
+
+
+class FakeGridOut:
+    """Minimal stand-in for an opened GridOut, for body-only tests."""
+
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.length = len(data)
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.reads = []
+
+    def seek(self, pos):
+        self.position = pos
+
+    def tell(self):
+        return self.position
+
+    async def readchunk(self):
+        self.reads.append(self.position // self.chunk_size)
+        end = (self.position // self.chunk_size + 1) * self.chunk_size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+class TestGridFSBody:
+    @pytest.mark.asyncio
+    async def test_streams_whole_file(self):
+        body = GridFSBody(FakeGridOut(b"abcdefghij", chunk_size=4))
+        async with body as chunks:
+            data = [chunk async for chunk in chunks]
+        assert data == [b"abcd", b"efgh", b"ij"]
+
+    @pytest.mark.asyncio
+    async def test_range_starts_at_chunk(self):
+        grid_out = FakeGridOut(b"abcdefghij", chunk_size=4)
+        body = GridFSBody(grid_out)
+        assert await body.make_conditional(5, 7) == 10
+        async with body as chunks:
+            data = b"".join([chunk async for chunk in chunks])
+        assert data == b"fg"
+        assert grid_out.reads == [1]
+
+    @pytest.mark.asyncio
+    async def test_suffix_range(self):
+        body = GridFSBody(FakeGridOut(b"abcdefghij", chunk_size=4))
+        await body.make_conditional(-3, None)
+        async with body as chunks:
+            data = b"".join([chunk async for chunk in chunks])
+        assert data == b"hij"
+
+
+class FakeStorage:
+    def __init__(self, *files):
+        self.files = {grid_out._id: grid_out for grid_out in files}
+        self.opened = []
+
+    async def open_download_stream(self, file_id):
+        self.opened.append(file_id)
+        return self.files[file_id]
+
+
+def _grid_out(file_id, data, md5=None):
+    grid_out = FakeGridOut(data, chunk_size=4)
+    grid_out._id = file_id
+    grid_out.md5 = md5
+    grid_out.upload_date = None
+    grid_out.content_type = None
+    grid_out.metadata = None
+    return grid_out
+
+
+async def _read(body):
+    async with body as chunks:
+        return b"".join([chunk async for chunk in chunks])
+
+
+class TestGridFSFileCache:
+    @pytest.mark.asyncio
+    async def test_caches_on_first_read(self, tmp_path):
+        cache = GridFSFileCache(directory=str(tmp_path))
+        grid_out = _grid_out(1, b"abcdefghij", md5="x")
+        body = await cache.body("fs", "a.txt", grid_out, FakeStorage())
+        assert isinstance(body, MappedFileBody)
+        assert await _read(body) == b"abcdefghij"
+        assert grid_out.reads == [0, 1, 2]
+
+        body = await cache.body("fs", "a.txt", grid_out, FakeStorage())
+        assert await body.make_conditional(-3, None) == 10
+        assert await _read(body) == b"hij"
+        assert grid_out.reads == [0, 1, 2]
+        assert cache.stats == {"files": 1, "size": 10, "hits": 1, "misses": 1, "evictions": 0}
+
+        cache.close()
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_eviction_and_large_files(self, tmp_path):
+        cache = GridFSFileCache(directory=str(tmp_path), max_size=15, max_file_size=10)
+        first, second = _grid_out(1, b"a" * 10), _grid_out(2, b"b" * 10)
+        await cache.body("fs", "a", first, FakeStorage())
+        old = await cache.body("fs", "a", first, FakeStorage())
+        await cache.body("fs", "b", second, FakeStorage())
+        assert cache.stats["files"] == 1 and cache.stats["evictions"] == 1
+        # a body handed out before the eviction can still be sent
+        assert await _read(old) == b"a" * 10
+
+        large = await cache.body("fs", "c", _grid_out(3, b"c" * 11), FakeStorage())
+        assert isinstance(large, GridFSBody)
+        cache.close()
+
+    @pytest.mark.asyncio
+    async def test_versions_and_lookups(self, tmp_path):
+        cache = GridFSFileCache(directory=str(tmp_path), lookup_ttl=60)
+        v1, v2 = _grid_out(1, b"one"), _grid_out(2, b"two")
+        storage = FakeStorage(v1, v2)
+        cache.remember("fs", "a", -1, v1)
+        await cache.body("fs", "a", v1, storage)
+
+        info = cache.lookup("fs", "a", -1)
+        assert (info._id, info.length) == (1, 3)
+        assert await _read(await cache.body("fs", "a", info, storage)) == b"one"
+        assert storage.opened == []
+
+        cache.invalidate("fs", "a")
+        assert cache.lookup("fs", "a", -1) is None
+        # a newer version replaces the copy of the old one
+        cache.remember("fs", "a", -1, v2)
+        assert cache.stats["files"] == 0
+        await cache.body("fs", "a", cache.lookup("fs", "a", -1), storage)
+        assert storage.opened == [2]
+        cache.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_fetch_leaves_no_file(self, tmp_path):
+        cache = GridFSFileCache(directory=str(tmp_path))
+        grid_out = _grid_out(1, b"abcdefghij")
+
+        async def readchunk():
+            if grid_out.position:
+                raise OSError("connection lost")
+            grid_out.position = 4
+            return b"abcd"
+
+        grid_out.readchunk = readchunk
+        with pytest.raises(OSError):
+            await cache.body("fs", "a", grid_out, FakeStorage())
+        assert cache.stats["files"] == 0
+        assert [list(path.iterdir()) for path in tmp_path.iterdir()] == [[]]
+        cache.close()
+
+
+class TestIterChunks:
+    @pytest.mark.asyncio
+    async def test_file_like_is_read_in_chunks(self):
+        data = [chunk async for chunk in iter_chunks(io.BytesIO(b"abcdefghij"), 4)]
+        assert data == [b"abcd", b"efgh", b"ij"]
+
+    @pytest.mark.asyncio
+    async def test_async_iterable(self):
+        async def body():
+            yield b"ab"
+            yield b""
+            yield b"cd"
+
+        data = [chunk async for chunk in iter_chunks(body(), 4)]
+        assert data == [b"ab", b"cd"]
+
+    @pytest.mark.asyncio
+    async def test_invalid_fileobj(self):
+        with pytest.raises(TypeError):
+            [chunk async for chunk in iter_chunks(42, 4)]
+
+
+class TestSendFile:
+    uri = f"mongodb://localhost:27017/test"
+
+    async def _setup(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        bucket = AsyncIOMotorGridFSBucket(mongo.db)
+        await bucket.upload_from_stream(
+            "hello.txt", b"hello, world", chunk_size_bytes=4,
+            metadata={"contentType": "text/plain"},
+        )
+        return app, mongo
+
+    async def _teardown(self, mongo):
+        await mongo.db.fs.files.delete_many({})
+        await mongo.db.fs.chunks.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_send_file(self):
+        app, mongo = await self._setup()
+        try:
+            async with app.test_request_context("/"):
+                response = await mongo.send_file("hello.txt")
+                assert response.status_code == 200
+                assert response.mimetype == "text/plain"
+                assert await response.get_data() == b"hello, world"
+        finally:
+            await self._teardown(mongo)
+
+    @pytest.mark.asyncio
+    async def test_send_file_range(self):
+        app, mongo = await self._setup()
+        try:
+            async with app.test_request_context("/", headers={"Range": "bytes=7-11"}):
+                response = await mongo.send_file("hello.txt")
+                assert response.status_code == 206
+                assert await response.get_data() == b"world"
+        finally:
+            await self._teardown(mongo)
+
+    @pytest.mark.asyncio
+    async def test_send_file_notfound(self):
+        app, mongo = await self._setup()
+        try:
+            async with app.test_request_context("/"):
+                with pytest.raises(NotFound):
+                    await mongo.send_file("missing.txt")
+        finally:
+            await self._teardown(mongo)
+
+    @pytest.mark.asyncio
+    async def test_save_file_stream(self):
+        app, mongo = await self._setup()
+
+        async def body():
+            yield b"streamed "
+            yield b"upload"
+
+        try:
+            file_id = await mongo.save_file("stream.txt", body(), chunk_size=4)
+            doc = await mongo.db.fs.files.find_one({"_id": file_id})
+            assert doc["length"] == len(b"streamed upload")
+            assert doc["contentType"] == "text/plain"
+            assert doc["md5"] == hashlib.md5(b"streamed upload").hexdigest()
+            async with app.test_request_context("/"):
+                response = await mongo.send_file("stream.txt")
+                assert await response.get_data() == b"streamed upload"
+                assert response.get_etag()[0] == doc["md5"]
+        finally:
+            await self._teardown(mongo)
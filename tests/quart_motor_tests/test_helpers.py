@@ -0,0 +1,95 @@
+import datetime
+import random
+import struct
+import uuid
+
+import bson
+import pytest
+from bson import Decimal128, ObjectId, SON, json_util
+from bson.raw_bson import RawBSONDocument
+from quart import Quart
+
+from quart_motor.helpers import FastJSONEncoder, JSONEncoder
+
+
+def _document():
+    return {
+        "_id": ObjectId("5f1e0c3a9d1e8a2b3c4d5e6f"),
+        "created": datetime.datetime(2020, 7, 26, 12, 30, 15, 123000),
+        "price": Decimal128("12.50"),
+        "name": "café \U0001f600",
+        "ratio": [0.1, 1e-05, 1.5e-07, 1e16, 2.5e300, -3.25],
+        "nested": SON([("z", 1), ("a", [{"k": ObjectId("5f1e0c3a9d1e8a2b3c4d5e70")}])]),
+        "text": "looks like 1e5, :0.00001 and [1.0e7]",
+        "quoted": 'say "1e-07" \\',
+    }
+
+
+class TestJSONEncoder:
+    def setup_method(self):
+        app = Quart(__name__)
+        self.encoder = JSONEncoder(app=app, json_options=None)
+        self.fast = FastJSONEncoder(app=app, json_options=None)
+
+    def test_bson_types(self):
+        data = self.encoder.dumps(_document(), separators=(",", ":"))
+        assert '"_id":{"$oid":"5f1e0c3a9d1e8a2b3c4d5e6f"}' in data
+        assert '"price":{"$numberDecimal":"12.50"}' in data
+        assert '"created":{"$date":"2020-07-26T12:30:15.123Z"}' in data
+
+    @pytest.mark.parametrize("value", [
+        datetime.datetime(2020, 7, 26, 12, 30, 15),
+        datetime.datetime(2020, 7, 26, 12, 30, 15, 999999),
+        datetime.datetime(1969, 12, 31, 23, 59, 59),
+        datetime.datetime(2020, 7, 26, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+    ])
+    def test_datetime(self, value):
+        expected = json_util.default(value, json_options=json_util.RELAXED_JSON_OPTIONS)
+        assert self.encoder.default(value) == expected
+
+    @pytest.mark.parametrize("kwargs", [{"separators": (",", ":")}, {"indent": 2}, {}])
+    def test_fast_encoder_is_identical(self, kwargs):
+        doc = _document()
+        assert self.fast.dumps(doc, **kwargs) == self.encoder.dumps(doc, **kwargs)
+
+    def test_fast_encoder_floats(self):
+        rng = random.Random(0)
+        floats = [struct.unpack("d", struct.pack("Q", rng.getrandbits(64)))[0]
+                  for _ in range(2000)]
+        floats = [f for f in floats if f == f and abs(f) != float("inf")]
+        kwargs = {"separators": (",", ":")}
+        assert self.fast.dumps(floats, **kwargs) == self.encoder.dumps(floats, **kwargs)
+
+    def test_fast_encoder_falls_back(self):
+        doc = {"big": 2 ** 70, "_id": ObjectId("5f1e0c3a9d1e8a2b3c4d5e6f")}
+        kwargs = {"separators": (",", ":")}
+        assert self.fast.dumps(doc, **kwargs) == self.encoder.dumps(doc, **kwargs)
+
+    @pytest.mark.parametrize("kwargs", [{"separators": (",", ":")}, {}])
+    def test_fast_encoder_escapes_delete(self, kwargs):
+        doc = {"text": "a\x7fb", "mixed": "\x7f é"}
+        assert self.fast.dumps(doc, **kwargs) == self.encoder.dumps(doc, **kwargs)
+        assert "\\u007f" in self.fast.dumps(doc, **kwargs)
+
+    def test_fast_encoder_uuids(self):
+        value = uuid.UUID("5f1e0c3a-9d1e-4a2b-8c4d-5e6f00112233")
+        options = json_util.JSONOptions(uuid_representation=bson.binary.UuidRepresentation.STANDARD)
+        app = Quart(__name__)
+        encoder = JSONEncoder(app=app, json_options=options)
+        fast = FastJSONEncoder(app=app, json_options=options)
+        kwargs = {"separators": (",", ":")}
+        for doc in ({"id": value}, [{"nested": (value,)}], {"text": str(value)}):
+            assert fast.dumps(doc, **kwargs) == encoder.dumps(doc, **kwargs)
+        # encoded by json_util, not as the plain string orjson writes
+        assert str(value) not in fast.dumps({"id": value}, **kwargs)
+        # without a UUID representation, both refuse to encode one
+        with pytest.raises(ValueError):
+            self.fast.dumps({"id": value}, **kwargs)
+
+    @pytest.mark.parametrize("kwargs", [{"separators": (",", ":")}, {}])
+    def test_raw_documents(self, kwargs):
+        doc = _document()
+        raw = [RawBSONDocument(bson.encode(doc))]
+        expected = self.encoder.dumps([doc], **kwargs)
+        assert self.encoder.dumps(raw, **kwargs) == expected
+        assert self.fast.dumps(raw, **kwargs) == expected
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import OperationFailure
+from quart import Quart
+
+from quart_motor import Motor
+from quart_motor.indexes import IndexAdvisor, IndexManager, suggest_index
+
+
+class FakeCollection:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.full_name = "test." + name
+        self.fail = fail
+
+    async def create_indexes(self, models):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise OperationFailure("Index build failed", 86)
+        return [model.document["name"] for model in models]
+
+
+class FakeDatabase:
+    def __init__(self, plans):
+        self.plans = plans
+        self.explained = []
+
+    def __getitem__(self, name):
+        return FakeCollection(name, fail=name == "broken")
+
+    async def command(self, command):
+        self.explained.append(command)
+        return {"queryPlanner": {"winningPlan": self.plans[command["explain"]["find"]]}}
+
+
+class FakeClient:
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        return self.db
+
+
+def _started(collection, filter, sort=None, command_name="find"):
+    command = {command_name: collection, "filter": filter, "lsid": {"id": 1}, "$db": "test"}
+    if sort:
+        command["sort"] = sort
+    return SimpleNamespace(command_name=command_name, command=command, database_name="test")
+
+
+class TestIndexes:
+    def test_suggest_index(self):
+        assert suggest_index({"status": "paid", "total": {"$gt": 10}}, {"created": -1}) == [
+            ("status", 1), ("created", -1), ("total", 1),
+        ]
+        assert suggest_index({"tag": {"$in": ["a", "b"]}, "$or": [{"a": 1}]}) == [("tag", 1)]
+        assert suggest_index({}) is None
+
+    @pytest.mark.asyncio
+    async def test_index_manager(self):
+        manager = IndexManager()
+        assert manager.declare("orders", [("customer", 1), ("created", -1)]) == "customer_1_created_-1"
+        manager.declare("users", "email", unique=True)
+        manager.declare("broken", "x")
+        assert manager.status()["orders"]["state"] == "pending"
+
+        await manager.ensure(FakeDatabase({}))
+        status = manager.status()
+        assert status["orders"] == {
+            "state": "ready", "indexes": ["customer_1_created_-1"], "error": None,
+        }
+        assert status["users"]["indexes"] == ["email_1"]
+        assert status["broken"]["state"] == "failed"
+        assert "Index build failed" in status["broken"]["error"]
+
+    @pytest.mark.asyncio
+    async def test_index_advisor(self):
+        db = FakeDatabase({
+            "orders": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+            "users": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+        })
+        advisor = IndexAdvisor()
+        advisor.start(FakeClient(db))
+        for status in ("paid", "open"):
+            advisor.started(_started("orders", {"status": status}, {"created": -1}))
+        advisor.started(_started("users", {"email": "a@example.com"}))
+        advisor.started(SimpleNamespace(command_name="insert", command={}, database_name="test"))
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+        assert len(db.explained) == 2
+        assert "lsid" not in db.explained[0]["explain"]
+        assert advisor.report() == [{
+            "namespace": "test.orders",
+            "command": "find",
+            "shape": {"find": "?", "filter": {"status": "?"}, "sort": {"created": "?"}},
+            "count": 2,
+            "problems": ["collection scan", "in-memory sort"],
+            "suggested_index": [("status", 1), ("created", -1)],
+        }]
+        advisor.close()
+
+    @pytest.mark.asyncio
+    async def test_index_advisor_watches_default_client(self):
+        app = Quart(__name__)
+        app.config["MONGO_URIS"] = {"analytics": "mongodb://localhost:1/analytics"}
+        mongo = Motor(app, "mongodb://localhost:1/test", index_advisor=True, pool_stats=True)
+        await app.startup()
+        try:
+            assert mongo.index_advisor in mongo.cx.options.event_listeners
+            analytics = mongo.get_client("analytics").options.event_listeners
+            assert mongo.index_advisor not in analytics
+            assert mongo.pool_stats in analytics
+        finally:
+            await app.shutdown()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from quart import Quart
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from quart_motor import Motor
+from quart_motor.limiter import ConcurrencyLimiter
+
+
+class TestConcurrencyLimiter:
+    @pytest.mark.asyncio
+    async def test_limits_and_sheds(self):
+        limiter = ConcurrencyLimiter(max_concurrent=2, max_queue=1, timeout=1.0)
+        running, peak = 0, 0
+
+        async def operation():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "done"
+
+        results = await asyncio.gather(
+            *(limiter.run("things", operation) for _ in range(5)), return_exceptions=True,
+        )
+        assert results.count("done") == 3
+        assert all(isinstance(r, ServiceUnavailable) for r in results if r != "done")
+        assert peak == 2
+        stats = limiter.stats()["*"]
+        assert (stats["admitted"], stats["shed"], stats["in_flight"]) == (3, 2, 0)
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, timeout=0.01, status=429)
+        results = await asyncio.gather(
+            limiter.run("things", asyncio.sleep, 0.1),
+            limiter.run("things", asyncio.sleep, 0.1),
+            return_exceptions=True,
+        )
+        assert results[0] is None
+        assert isinstance(results[1], TooManyRequests)
+
+    @pytest.mark.asyncio
+    async def test_per_collection_limit(self):
+        limiter = ConcurrencyLimiter(max_concurrent=10, max_queue=0, per_collection={"reports": 1})
+        results = await asyncio.gather(
+            limiter.run("reports", asyncio.sleep, 0.01),
+            limiter.run("reports", asyncio.sleep, 0.01),
+            limiter.run("things", asyncio.sleep, 0.01),
+            return_exceptions=True,
+        )
+        assert results[0] is None and results[2] is None
+        assert isinstance(results[1], ServiceUnavailable)
+        assert limiter.stats()["reports"]["shed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_collection_operations_are_admitted(self):
+        app = Quart(__name__)
+        # nothing is admitted, so the (absent) server is never contacted
+        limiter = ConcurrencyLimiter(max_concurrent=0, max_queue=0)
+        mongo = Motor(app, "mongodb://localhost:27017/test", limiter=limiter)
+        await app.startup()
+        with pytest.raises(ServiceUnavailable):
+            await mongo.db.things.find_one({"_id": 1})
+        with pytest.raises(ServiceUnavailable):
+            await mongo.db.things.find().to_list(None)
+        with pytest.raises(ServiceUnavailable):
+            await mongo.db.things.aggregate([]).to_list(None)
+        assert limiter.stats()["*"]["shed"] == 3
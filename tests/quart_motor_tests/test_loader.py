@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from quart import Quart
+from werkzeug.exceptions import NotFound
+
+from quart_motor import Motor
+from quart_motor.loader import DocumentLoader
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Records the queries issued by a DocumentLoader."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, projection=None):
+        (field, condition), = query.items()
+        keys = condition["$in"]
+        self.queries.append(sorted(keys))
+        # only "_id" is matched here; other keys return every document, which
+        # the loader must tell apart itself
+        return FakeCursor([d for d in self.documents if field != "_id" or d["_id"] in keys])
+
+
+class TestDocumentLoader:
+    def setup_method(self):
+        self.collection = FakeCollection([{"_id": i, "val": i * 10} for i in range(5)])
+
+    @pytest.mark.asyncio
+    async def test_concurrent_loads_are_batched(self):
+        loader = DocumentLoader(self.collection)
+        docs = await asyncio.gather(
+            loader.load(1), loader.load(3), loader.load(1), loader.load(9),
+        )
+        assert [d and d["val"] for d in docs] == [10, 30, 10, None]
+        assert self.collection.queries == [[1, 3, 9]]
+
+    @pytest.mark.asyncio
+    async def test_loaded_documents_are_cached(self):
+        loader = DocumentLoader(self.collection)
+        await loader.load(1)
+        await loader.load_many([1, 2])
+        assert self.collection.queries == [[1], [2]]
+
+        loader.clear(1)
+        await loader.load(1)
+        assert self.collection.queries[-1] == [1]
+
+    @pytest.mark.asyncio
+    async def test_max_batch_size(self):
+        loader = DocumentLoader(self.collection, cache=False, max_batch_size=2)
+        await loader.load_many([0, 1, 2, 3])
+        assert self.collection.queries == [[0, 1], [2, 3]]
+        await loader.load(0)
+        assert self.collection.queries[-1] == [0]
+
+    @pytest.mark.asyncio
+    async def test_dotted_and_array_keys(self):
+        collection = FakeCollection([
+            {"_id": 1, "author": {"id": "a"}, "tags": ["x", "y"]},
+            {"_id": 2, "author": {"id": "b"}, "tags": [["x"], {"y": 1}], "editors": [{"id": "c"}]},
+            {"_id": 3, "author": "anonymous", "tags": {"x": 1}},
+        ])
+        by_author = DocumentLoader(collection, key="author.id")
+        docs = await by_author.load_many(["a", "b", "z"])
+        assert [d and d["_id"] for d in docs] == [1, 2, None]
+        by_tag = DocumentLoader(collection, key="tags")
+        docs = await by_tag.load_many(["x", "y", "q"])
+        assert [d and d["_id"] for d in docs] == [1, 1, None]
+        by_editor = DocumentLoader(collection, key="editors.id")
+        assert (await by_editor.load("c"))["_id"] == 2
+
+    @pytest.mark.asyncio
+    async def test_load_or_404(self):
+        loader = DocumentLoader(self.collection)
+        with pytest.raises(NotFound):
+            await loader.load_or_404(9)
+
+
+class TestCollectionLoader:
+    uri = f"mongodb://localhost:27017/test"
+
+    @pytest.mark.asyncio
+    async def test_loader_is_request_scoped(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_many([{"_id": i} for i in range(3)])
+        try:
+            async with app.test_request_context("/"):
+                loader = mongo.db.things.loader()
+                assert mongo.db.things.loader() is loader
+                docs = await loader.load_many([0, 2, 5])
+                assert docs == [{"_id": 0}, {"_id": 2}, None]
+            async with app.test_request_context("/"):
+                assert mongo.db.things.loader() is not loader
+        finally:
+            await mongo.db.things.delete_many({})
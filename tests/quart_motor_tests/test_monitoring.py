@@ -0,0 +1,87 @@
+import logging
+from types import SimpleNamespace
+
+import bson
+import pytest
+from quart import Quart
+
+from quart_motor import Motor
+from quart_motor.monitoring import (
+    CommandInstrumentation,
+    HistogramSink,
+    current_request_stats,
+    redact,
+)
+
+
+def started(command_name, command, request_id=1):
+    return SimpleNamespace(
+        command_name=command_name, command=command,
+        request_id=request_id, connection_id=("localhost", 27017),
+    )
+
+
+def succeeded(command_name, reply, duration_ms, request_id=1):
+    return SimpleNamespace(
+        command_name=command_name, reply=reply, database_name="test",
+        request_id=request_id, connection_id=("localhost", 27017),
+        duration_micros=int(duration_ms * 1000),
+    )
+
+
+class TestCommandInstrumentation:
+    def test_redact(self):
+        command = {
+            "find": "users", "filter": {"name": "Alice", "tags": ["a", "b"]},
+            "lsid": {"id": "..."}, "$db": "test",
+        }
+        assert redact(command) == {"find": "?", "filter": {"name": "?", "tags": ["?"]}}
+
+    def test_histogram_sink(self):
+        sink = HistogramSink(buckets=(1, 10))
+        sink.observe("users", "find", 0.0005, 1, 120, False)
+        sink.observe("users", "find", 0.05, 3, 0, True)
+        series = sink.snapshot()["users.find"]
+        assert series["count"] == 2
+        assert series["failures"] == 1
+        assert series["documents"] == 4
+        assert series["reply_bytes"] == 120
+        assert series["buckets"] == [1, 0, 1]
+
+    def test_slow_command_is_logged(self, caplog):
+        instrumentation = CommandInstrumentation(slow_ms=10)
+        instrumentation.started(started("find", {"find": "users", "filter": {"name": "Bob"}}))
+        with caplog.at_level(logging.WARNING, logger="quart_motor.monitoring"):
+            instrumentation.succeeded(succeeded("find", {"cursor": {"firstBatch": []}}, 20))
+        assert "slow MongoDB command: find on test.users" in caplog.text
+        assert "Bob" not in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_server_timing_header(self):
+        app = Quart(__name__)
+        mongo = Motor(app, "mongodb://localhost:27017/test", instrumentation=True)
+
+        @app.route("/")
+        async def index():
+            instrumentation = mongo.instrumentation
+            instrumentation.started(started("find", {"find": "users"}))
+            instrumentation.succeeded(
+                succeeded("find", {"cursor": {"firstBatch": [{}, {}]}}, 1.5),
+            )
+            assert current_request_stats().count == 1
+            return "ok"
+
+        response = await app.test_client().get("/")
+        assert response.headers["Server-Timing"] == (
+            'mongodb;dur=1.500;desc="1 commands, 2 documents, %d bytes"'
+            % len(bson.encode({"cursor": {"firstBatch": [{}, {}]}}))
+        )
+
+    def test_reply_sizes(self):
+        reply = {"cursor": {"firstBatch": [{"name": "Alice"}]}, "ok": 1.0}
+        for reply_sizes, expected in ((True, len(bson.encode(reply))), (False, 0)):
+            sink = HistogramSink()
+            instrumentation = CommandInstrumentation(sink=sink, reply_sizes=reply_sizes)
+            instrumentation.started(started("find", {"find": "users"}))
+            instrumentation.succeeded(succeeded("find", reply, 1))
+            assert sink.snapshot()["users.find"]["reply_bytes"] == expected
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+from pymongo import monitoring
+from quart import Quart
+
+from quart_motor import Motor
+from quart_motor.limiter import ConcurrencyLimiter
+from quart_motor.pool import PoolStats, detect_workers, max_pool_size, warm_up
+
+ADDRESS = ("localhost", 27017)
+
+
+class TestPool:
+    def test_pool_stats(self):
+        stats = PoolStats()
+        stats.pool_created(monitoring.PoolCreatedEvent(ADDRESS, {}))
+        for connection_id in (1, 2):
+            stats.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, connection_id))
+        stats.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        stats.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        stats.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1, 0.25))
+
+        pool = stats.snapshot()["localhost:27017"]
+        assert pool["open"] == 2
+        assert pool["checked_out"] == 1
+        assert pool["available"] == 1
+        assert pool["wait_queue"] == 1
+        assert pool["max_checkout_time"] == 0.25
+
+        stats.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+        assert stats.snapshot()["localhost:27017"]["available"] == 2
+
+    @pytest.mark.asyncio
+    async def test_warm_up_timeout(self):
+        app = Quart(__name__)
+        mongo = Motor(app, "mongodb://localhost:1/test")
+        await app.startup()
+        try:
+            assert await warm_up(mongo.cx, 4, timeout=0.1) is False
+        finally:
+            await app.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_client_closed_after_serving(self):
+        app = Quart(__name__)
+        mongo = Motor(app, "mongodb://localhost:1/test", pool_stats=True)
+        await app.startup()
+        assert mongo.pool_stats in mongo.cx.options.event_listeners
+        await app.shutdown()
+        assert mongo.cx.delegate._closed
+
+    def test_max_pool_size(self, monkeypatch):
+        assert max_pool_size(400, 8) == 48
+        assert max_pool_size(10, 8) == 1
+        monkeypatch.setenv("WEB_CONCURRENCY", "6")
+        assert detect_workers() == 6
+        monkeypatch.delenv("WEB_CONCURRENCY")
+        assert detect_workers() == 1
+
+    @pytest.mark.asyncio
+    async def test_pool_budget(self):
+        app = Quart(__name__)
+        app.config["MONGO_POOL_BUDGET"] = 100
+        mongo = Motor(app, "mongodb://localhost:1/test", workers=4, minPoolSize=50)
+        await app.startup()
+        try:
+            assert mongo.cx.options.pool_options.max_pool_size == 23
+            assert mongo.cx.options.pool_options.min_pool_size == 23
+            stats = mongo.worker_stats()
+            assert stats["pid"] == os.getpid()
+            assert (stats["workers"], stats["pool_budget"], stats["max_pool_size"]) == (4, 100, 23)
+        finally:
+            await app.shutdown()
+
+        with pytest.raises(ValueError):
+            Motor(Quart(__name__), "mongodb://localhost:1/test", pool_budget=100, maxPoolSize=10)
+
+    @pytest.mark.asyncio
+    async def test_fork_safety(self):
+        app = Quart(__name__)
+        mongo = Motor(
+            app, "mongodb://localhost:1/test", index_advisor=True,
+            limiter=ConcurrencyLimiter(max_concurrent=1), serverSelectionTimeoutMS=50,
+        )
+        cache = mongo.cache("things")
+        view = mongo.materialized_view("things", [], "thing_view", every=60)
+
+        @app.route("/")
+        async def index():
+            return "ok"
+
+        await app.startup()
+        try:
+            client = app.test_client()
+            assert (await client.get("/")).status_code == 200
+            # as if the client had been created before this process was forked
+            mongo._pid = -1
+            assert (await client.get("/")).status_code == 500
+
+            mongo.fork_safety = "recreate"
+            parent = mongo.cx
+            writer = mongo.bulk_writer("things", flush_interval=60)
+            await writer.insert_one({"n": 1}, wait=False)
+            cache.set("key", b"raw")
+            mongo.limiter._gate.in_flight = 5
+            assert (await client.get("/")).status_code == 200
+            assert mongo.cx is not parent and mongo._pid == os.getpid()
+            assert mongo.db.client is mongo.cx
+            # nothing inherited from the parent is used any more
+            assert len(writer) == 0 and mongo.bulk_writer("things") is not writer
+            assert mongo.db.things.document_cache is cache and len(cache) == 0
+            assert mongo._views._db is mongo._db and mongo._views.views["thing_view"] is view
+            assert mongo.index_advisor._client is mongo.cx
+            # at most the view's first refresh on the new client
+            assert mongo.limiter.stats()["*"]["in_flight"] <= 1
+            parent.close()
+        finally:
+            await app.shutdown()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+import pytest
+from pymongo.errors import InvalidOperation
+from quart import Quart
+
+from quart_motor.helpers import JSONEncoder
+from quart_motor.streams import ChangeStreamHub
+
+
+class FakeChangeStream:
+    def __init__(self, collection, resume_after):
+        self.collection = collection
+        self.resume_token = resume_after
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        change = await self.collection.changes.get()
+        if isinstance(change, Exception):
+            raise change
+        self.resume_token = change["_id"]
+        return change
+
+
+class FakeCollection:
+    """Hands out change streams fed from a queue."""
+
+    full_name = "test.orders"
+
+    def __init__(self):
+        self.changes = asyncio.Queue()
+        self.watches = []
+
+    def watch(self, pipeline=None, resume_after=None):
+        self.watches.append((pipeline, resume_after))
+        return FakeChangeStream(self, resume_after)
+
+    def change(self, n):
+        self.changes.put_nowait({
+            "_id": {"_data": "%04x" % n}, "operationType": "insert",
+            "fullDocument": {"_id": n},
+        })
+
+
+class CountingDumps:
+    def __init__(self):
+        self.encoder = JSONEncoder(app=Quart(__name__), json_options=None)
+        self.calls = 0
+
+    def __call__(self, obj, **kwargs):
+        self.calls += 1
+        return self.encoder.dumps(obj, **kwargs)
+
+
+class TestChangeStreamHub:
+    def setup_method(self):
+        self.hub = ChangeStreamHub()
+        self.collection = FakeCollection()
+        self.dumps = CountingDumps()
+
+    def subscribe(self, pipeline=None, **kwargs):
+        return self.hub.subscribe(self.collection, pipeline, dumps=self.dumps, **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_one_stream_is_shared(self):
+        first, second = self.subscribe(), self.subscribe()
+        other = self.subscribe([{"$match": {"operationType": "delete"}}])
+        await asyncio.sleep(0)
+        assert len(self.collection.watches) == 2
+
+        self.collection.change(1)
+        events = [await first.__anext__(), await second.__anext__()]
+        assert events[0] is events[1]
+        assert json.loads(events[0].json)["fullDocument"] == {"_id": 1}
+        assert events[1].sse() == "id: 0001\ndata: %s\n\n" % events[0].json
+        assert self.dumps.calls == 1
+
+        for subscription in (first, second, other):
+            subscription.close()
+        assert self.hub._feeds == {}
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_is_dropped(self):
+        slow, fast = self.subscribe(maxsize=2), self.subscribe(maxsize=10)
+        for n in range(3):
+            self.collection.change(n)
+        for n in range(3):
+            assert (await fast.__anext__()).document["fullDocument"]["_id"] == n
+        assert slow.dropped
+        assert [event async for event in slow] == []
+        fast.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_stream_ends_subscriptions(self):
+        first, second = self.subscribe(), self.subscribe()
+        self.collection.changes.put_nowait(ValueError("bad event"))
+        assert [event async for event in first] == []
+        assert isinstance(first.error, ValueError)
+        assert second.closed and second.error is first.error
+        assert self.hub._feeds == {}
+
+        again = self.subscribe()
+        await asyncio.sleep(0)
+        assert len(self.collection.watches) == 2
+        again.close()
+
+    @pytest.mark.asyncio
+    async def test_missing_resume_token_ends_subscriptions(self):
+        self.hub.retry_delay = 0
+        subscription = self.subscribe()
+        self.collection.changes.put_nowait(InvalidOperation(
+            "Cannot provide resume functionality when the resume token is missing."
+        ))
+        assert [event async for event in subscription] == []
+        assert isinstance(subscription.error, InvalidOperation)
+        assert len(self.collection.watches) == 1
+        assert self.hub._feeds == {}
+
+    @pytest.mark.asyncio
+    async def test_resume_from_history(self):
+        first = self.subscribe()
+        for n in range(3):
+            self.collection.change(n)
+        for n in range(3):
+            await first.__anext__()
+
+        resumed = self.subscribe(resume_after="0000")
+        assert resumed.resumed
+        assert [(await resumed.__anext__()).id for _ in range(2)] == ["0001", "0002"]
+
+        unknown = self.subscribe(resume_after="ffff")
+        assert not unknown.resumed
+        for subscription in (first, resumed, unknown):
+            subscription.close()
+
+    @pytest.mark.asyncio
+    async def test_new_stream_resumes_after_token(self):
+        subscription = self.subscribe(resume_after="0007")
+        await asyncio.sleep(0)
+        assert self.collection.watches == [([], {"_data": "0007"})]
+        assert subscription.resumed
+        subscription.close()
+
+    @pytest.mark.asyncio
+    async def test_sse(self):
+        subscription = self.subscribe()
+        body = subscription.sse(keepalive=0.01)
+        assert await body.__anext__() == ": keepalive\n\n"
+        self.collection.change(1)
+        assert (await body.__anext__()).startswith("id: 0001\ndata: ")
+        await body.aclose()
+        assert subscription.closed
+        assert self.hub._feeds == {}
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from quart_motor.views import MaterializedView, ViewScheduler
+
+
+class FakeCursor:
+    def __init__(self, collection, pipeline):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    async def to_list(self, length):
+        self.collection.runs.append(self.pipeline)
+        await asyncio.sleep(0)
+        if self.collection.fail:
+            raise OperationFailure("$merge failed", 51183)
+        return []
+
+
+class FakeCollection:
+    def __init__(self):
+        self.runs = []
+        self.fail = False
+
+    def aggregate(self, pipeline):
+        return FakeCursor(self, pipeline)
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+async def _wait_for_runs(collection, runs):
+    while len(collection.runs) < runs:
+        await asyncio.sleep(0)
+
+
+class TestViewScheduler:
+    @pytest.mark.asyncio
+    async def test_refresh(self):
+        db = FakeDatabase()
+        view = MaterializedView("orders", [{"$match": {"paid": True}}], "paid_orders")
+        await asyncio.gather(view.refresh(db), view.refresh(db))
+        assert db["orders"].runs == [[
+            {"$match": {"paid": True}},
+            {"$merge": {
+                "into": "paid_orders", "on": "_id",
+                "whenMatched": "replace", "whenNotMatched": "insert",
+            }},
+        ]]
+        db["orders"].fail = True
+        with pytest.raises(OperationFailure):
+            await view.refresh(db)
+        status = view.status()
+        assert (status["runs"], status["failures"]) == (2, 1)
+        assert "$merge failed" in status["last_error"]
+
+    @pytest.mark.asyncio
+    async def test_schedule(self):
+        db = FakeDatabase()
+        scheduler = ViewScheduler()
+        # refreshed again as soon as the previous refresh finished
+        scheduler.add(MaterializedView("orders", [], "a", every=0))
+        scheduler.start(db)
+        scheduler.add(MaterializedView("users", [], "b", every=60))
+        await asyncio.wait_for(_wait_for_runs(db["orders"], 3), 5)
+        await scheduler.close()
+        runs = len(db["orders"].runs)
+        assert len(db["users"].runs) == 1
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert len(db["orders"].runs) == runs
@@ -1,8 +1,24 @@
+import datetime
+import json
+
+import bson
 import pytest
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from pymongo import ReadPreference
 from quart import Quart
 from werkzeug.exceptions import NotFound
 
-from quart_motor import Motor
+from quart_motor import ASCENDING, DESCENDING, Motor
+from quart_motor.cache import make_key
+from quart_motor.wrappers import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    _after_query,
+    _decode_page_token,
+    _encode_page_token,
+    _sort_spec,
+)
 
 
 class TestCollection:
@@ -26,3 +42,285 @@ class TestCollection:
         thing = await mongo.db.things.find_one_or_404({"_id": "thing"})
         assert thing["val"] == "foo"
         await mongo.db.things.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_stream_json_array(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_many([{"_id": i, "val": "foo"} for i in range(5)])
+        try:
+            async with app.app_context():
+                response = mongo.db.things.stream_json(sort=[("_id", 1)], batch_size=2)
+                assert response.mimetype == "application/json"
+                data = json.loads(await response.get_data())
+            assert data == [{"_id": i, "val": "foo"} for i in range(5)]
+        finally:
+            await mongo.db.things.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_stream_json_ndjson(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_many([{"_id": i} for i in range(3)])
+        try:
+            async with app.app_context():
+                response = mongo.db.things.stream_json(
+                    {"_id": {"$gt": 0}}, sort=[("_id", 1)], format="ndjson",
+                )
+                assert response.mimetype == "application/x-ndjson"
+                data = await response.get_data(as_text=True)
+            assert data == '{"_id":1}\n{"_id":2}\n'
+        finally:
+            await mongo.db.things.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_stream_json_empty(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.delete_many({})
+        async with app.app_context():
+            response = mongo.db.things.stream_json()
+            assert await response.get_data(as_text=True) == "[]\n"
+
+    @pytest.mark.asyncio
+    async def test_stream_bson(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_many([{"_id": i, "val": "foo"} for i in range(5)])
+        try:
+            async with app.app_context():
+                response = mongo.db.things.stream_bson(sort=[("_id", 1)], batch_size=2)
+                assert response.mimetype == "application/bson"
+                data = bson.decode_all(await response.get_data())
+            assert data == [{"_id": i, "val": "foo"} for i in range(5)]
+        finally:
+            await mongo.db.things.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_find_columns(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_many([{"_id": i, "val": i * 1.5} for i in range(5)])
+        try:
+            columns = await mongo.db.things.find_columns({"_id": {"$gte": 2}}, {"val": float})
+            assert list(columns["val"]) == [3.0, 4.5, 6.0]
+            async with app.app_context():
+                response = mongo.db.things.stream_csv({}, {"_id": int, "val": float}, batch_size=2)
+                assert response.mimetype == "text/csv"
+                data = await response.get_data(as_text=True)
+            assert data.splitlines()[:2] == ["_id,val", "0,0.0"]
+        finally:
+            await mongo.db.things.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_find_page(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_many(
+            [{"_id": i, "group": i % 3} for i in range(10)]
+        )
+        try:
+            seen, token = [], None
+            while True:
+                page, token = await mongo.db.things.find_page(
+                    sort=[("group", DESCENDING)], after=token, limit=4,
+                )
+                seen.extend(doc["_id"] for doc in page)
+                if token is None:
+                    break
+            assert seen == [2, 5, 8, 1, 4, 7, 0, 3, 6, 9]
+
+            await mongo.db.things.insert_many(
+                [{"_id": 10, "group": None}, {"_id": 11}]
+            )
+            for direction, expected in (
+                (ASCENDING, [10, 11, 0, 3, 6, 9, 1, 4, 7, 2, 5, 8]),
+                (DESCENDING, [2, 5, 8, 1, 4, 7, 0, 3, 6, 9, 10, 11]),
+            ):
+                seen, token = [], None
+                while True:
+                    page, token = await mongo.db.things.find_page(
+                        sort=[("group", direction)], after=token, limit=3,
+                    )
+                    seen.extend(doc["_id"] for doc in page)
+                    if token is None:
+                        break
+                assert seen == expected
+
+            with pytest.raises(NotFound):
+                await mongo.db.things.find_page(after="garbage")
+        finally:
+            await mongo.db.things.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_find_one_conditional(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri=self.uri)
+        await app.startup()
+        await mongo.db.things.insert_one({"_id": "thing", "version": 1})
+        try:
+            async with app.test_request_context("/"):
+                response = await mongo.db.things.find_one_conditional(
+                    "thing", etag_field="version",
+                )
+                etag = response.get_etag()[0]
+            await mongo.db.things.update_one({"_id": "thing"}, {"$inc": {"version": 1}})
+            async with app.test_request_context("/", headers={"If-None-Match": '"%s"' % etag}):
+                response = await mongo.db.things.find_one_conditional(
+                    "thing", etag_field="version",
+                )
+                assert response.status_code == 200
+                assert json.loads(await response.get_data())["version"] == 2
+        finally:
+            await mongo.db.things.delete_many({})
+
+
+class TestFindOneConditional:
+    async def _setup(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri="mongodb://localhost:27017/test")
+        # served from the cache, so no server is needed
+        cache = mongo.cache("things", ttl=None)
+        await app.startup()
+        modified = datetime.datetime(2024, 5, 1, 12, 30)
+        cache.set(make_key({"_id": 1}), bson.encode({"_id": 1, "updatedAt": modified}))
+        cache.set(make_key({"_id": 2}), None)
+        return app, mongo
+
+    @pytest.mark.asyncio
+    async def test_etag_and_not_modified(self):
+        app, mongo = await self._setup()
+        async with app.test_request_context("/"):
+            response = await mongo.db.things.find_one_conditional({"_id": 1})
+            assert response.status_code == 200
+            assert json.loads(await response.get_data())["_id"] == 1
+            etag = response.get_etag()[0]
+
+        async with app.test_request_context("/", headers={"If-None-Match": '"%s"' % etag}):
+            response = await mongo.db.things.find_one_conditional({"_id": 1})
+            assert response.status_code == 304
+            assert await response.get_data() == b""
+
+    @pytest.mark.asyncio
+    async def test_etag_field_missing(self):
+        app, mongo = await self._setup()
+        cache = mongo.db.things.document_cache
+        etags = []
+        for document in ({"_id": 1, "name": "a"}, {"_id": 1, "name": "b"}, {"_id": 1, "version": None}):
+            cache.set(make_key({"_id": 1}), bson.encode(document))
+            async with app.test_request_context("/"):
+                response = await mongo.db.things.find_one_conditional(
+                    {"_id": 1}, etag_field="version",
+                )
+                etags.append(response.get_etag()[0])
+        # hashed from the whole document, so each version has its own
+        assert len(set(etags)) == 3
+
+    @pytest.mark.asyncio
+    async def test_last_modified(self):
+        app, mongo = await self._setup()
+        headers = {"If-Modified-Since": "Wed, 01 May 2024 12:30:00 GMT"}
+        async with app.test_request_context("/", headers=headers):
+            response = await mongo.db.things.find_one_conditional(
+                {"_id": 1}, last_modified_field="updatedAt",
+            )
+            assert response.status_code == 304
+            assert response.last_modified == datetime.datetime(
+                2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc,
+            )
+
+    @pytest.mark.asyncio
+    async def test_notfound(self):
+        app, mongo = await self._setup()
+        async with app.test_request_context("/"):
+            with pytest.raises(NotFound):
+                await mongo.db.things.find_one_conditional({"_id": 2})
+
+
+class TestPageToken:
+    def test_sort_spec(self):
+        assert _sort_spec(None) == [("_id", 1)]
+        assert _sort_spec("name") == [("name", 1), ("_id", 1)]
+        assert _sort_spec([("_id", -1)]) == [("_id", -1)]
+
+    def test_token_round_trip(self):
+        spec = _sort_spec([("created", -1), ("owner.name", 1)])
+        doc = {
+            "_id": ObjectId(),
+            "created": datetime.datetime(2020, 7, 26, 12, 30),
+            "owner": {"name": "sriram"},
+        }
+        token = _encode_page_token(spec, doc)
+        assert _decode_page_token(spec, token) == [doc["created"], "sriram", doc["_id"]]
+        assert _decode_page_token(_sort_spec("created"), token) is None
+        assert _decode_page_token(spec, "not-a-token") is None
+
+    def test_after_query(self):
+        spec = _sort_spec([("group", -1)])
+        assert _after_query(spec, [2, 8]) == {"$or": [
+            {"group": {"$lt": 2}},
+            {"group": None},
+            {"group": 2, "_id": {"$gt": 8}},
+        ]}
+
+    def test_after_query_null(self):
+        ascending = _sort_spec("group")
+        assert _after_query(ascending, [None, 8]) == {"$or": [
+            {"group": {"$ne": None}},
+            {"group": None, "_id": {"$gt": 8}},
+        ]}
+        assert _after_query(ascending, [2, 8]) == {"$or": [
+            {"group": {"$gt": 2}},
+            {"group": 2, "_id": {"$gt": 8}},
+        ]}
+        descending = _sort_spec([("group", -1)])
+        assert _after_query(descending, [None, 8]) == {"$or": [
+            {"group": None, "_id": {"$gt": 8}},
+        ]}
+
+    @pytest.mark.asyncio
+    async def test_find_page_limit(self):
+        app = Quart(__name__)
+        mongo = Motor(app=app, uri="mongodb://localhost:27017/test")
+        await app.startup()
+        # rejected before any query is sent, so no server is needed
+        for limit in (0, -1):
+            with pytest.raises(ValueError):
+                await mongo.db.things.find_page(limit=limit)
+        await app.shutdown()
+
+
+class TestWrapperCache:
+    def setup_method(self):
+        self.cx = AsyncIOMotorClient("mongodb://localhost:27017/", connect=False)
+
+    def test_database_is_cached(self):
+        assert self.cx.test is self.cx["test"]
+        assert self.cx.get_database("test") is self.cx.test
+        assert self.cx.test is not self.cx.other
+
+    def test_collection_is_cached(self):
+        db = self.cx.test
+        assert db.things is db["things"]
+        assert db.get_collection("things") is db.things
+        assert db.things.sub is db["things"]["sub"]
+        assert db.things.sub.name == "things.sub"
+
+    def test_options_variants_are_distinct(self):
+        db = self.cx.test
+        secondary = db.things.with_options(read_preference=ReadPreference.SECONDARY)
+        assert secondary is not db.things
+        assert secondary is db.things.with_options(read_preference=ReadPreference.SECONDARY)
+        assert isinstance(secondary, AsyncIOMotorCollection)
+        assert secondary.read_preference == ReadPreference.SECONDARY
+
+        tz_aware = db.get_collection("things", codec_options=CodecOptions(tz_aware=True))
+        assert tz_aware is db.get_collection("things", codec_options=CodecOptions(tz_aware=True))
+        assert tz_aware.codec_options.tz_aware
+        assert not db.things.codec_options.tz_aware